@@ -0,0 +1,42 @@
+"""
+Benchmark rendering many rows from a parameter table against creating and
+rendering one Template per row.
+"""
+import common
+
+from boaconstructor import Template
+from boaconstructor.bulk import render_rows
+
+
+ROWS = 1000
+
+
+def main():
+    shared, templates = common.fleet(hosts=1, keys=50)
+    template = templates[0]
+    references = {'common': shared}
+
+    table = dict(
+        host=['host%d.example.com' % i for i in range(ROWS)],
+        port=[8000 + i for i in range(ROWS)],
+    )
+
+    def per_row():
+        for index in range(ROWS):
+            content = dict(template.content)
+            content['host'] = table['host'][index]
+            content['port'] = table['port'][index]
+            Template(template.name, content).render(references)
+
+    common.report(
+        "%d rows, one Template per row" % ROWS,
+        common.best_of(per_row, number=1, repeat=3)
+    )
+    common.report(
+        "%d rows, render_rows" % ROWS,
+        common.best_of(lambda: render_rows(template, table, references), number=1, repeat=3)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark the boaconstructor command's runs from its cache, over a directory
+of 200 host templates of 50 keys each referring to a common one. Also how
+long decoding the whole cache takes, and would as a pickle, as the command
+wrote it before, and with cPickle.
+"""
+import os
+import json
+import shutil
+import tempfile
+import pickle
+import cPickle
+
+import common
+
+from boaconstructor import cli
+from boaconstructor import codec
+
+
+HOSTS = 200
+
+
+def write_fleet(directory):
+    shared, templates = common.fleet(hosts=HOSTS, keys=50)
+    for template in [shared] + templates:
+        stream = open(os.path.join(directory, "%s.json" % template.name), 'w')
+        try:
+            json.dump(template.content, stream)
+
+        finally:
+            stream.close()
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        write_fleet(directory)
+        cli.run(directory, cache_dir=cache_dir)
+        cli.run(directory, ['host1'], ['port'], cache_dir=cache_dir)
+
+        data = cli._read_cache(cli._cache_file(cache_dir, directory))
+        parsed, renders = cli._load_cache(data)
+        pickled = pickle.dumps(
+            dict(format=1, parsed=parsed, renders=renders), pickle.HIGHEST_PROTOCOL
+        )
+
+        common.report(
+            "cached run, 1 of %d templates" % HOSTS,
+            common.best_of(lambda: cli.run(directory, ['host1'], cache_dir=cache_dir), number=20)
+        )
+        common.report(
+            "cached run, 1 template, 1 key",
+            common.best_of(lambda: cli.run(directory, ['host1'], ['port'], cache_dir=cache_dir), number=20)
+        )
+        common.report(
+            "cached run, all %d templates" % HOSTS,
+            common.best_of(lambda: cli.run(directory, cache_dir=cache_dir), number=5)
+        )
+        common.report(
+            "codec.loads of the whole cache",
+            common.best_of(lambda: codec.loads(data), number=5)
+        )
+        common.report(
+            "pickle.loads of the same",
+            common.best_of(lambda: pickle.loads(pickled), number=5)
+        )
+        common.report(
+            "cPickle.loads of the same",
+            common.best_of(lambda: cPickle.loads(pickled), number=5)
+        )
+        print("%-50s %12d bytes" % ("codec cache size", len(data)))
+        print("%-50s %12d bytes" % ("pickle size", len(pickled)))
+
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark encoding and decoding a rendered dict of 200 hosts with 50 keys
+each, most values repeated, with the codec, JSON and pickle. Also reading
+one host back with codec.load_key, and the size of each encoding.
+"""
+import json
+import cPickle as pickle
+
+import common
+
+from boaconstructor import codec
+
+
+def rendered():
+    returned = {}
+    for h in range(200):
+        host = dict([
+            (u'setting%d' % i, u'shared value %d' % (i % 10)) for i in range(45)
+        ])
+        host.update({
+            u'host': u'host%d.example.com' % h,
+            u'port': 8000 + h,
+            u'weight': h / 7.0,
+            u'enabled': h % 2 == 0,
+            u'aliases': [u'alias%d' % (h % 5), u'www'],
+        })
+        returned[u'host%d' % h] = host
+    return returned
+
+
+def main():
+    value = rendered()
+    encoded = codec.dumps(value)
+    as_json = json.dumps(value, separators=(',', ':'))
+    pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    assert codec.loads(encoded) == json.loads(as_json) == pickle.loads(pickled) == value
+    assert codec.load_key(encoded, u'host150') == value[u'host150']
+
+    for label, dumps, loads, data in (
+        ("codec", codec.dumps, codec.loads, encoded),
+        ("json", lambda v: json.dumps(v, separators=(',', ':')), json.loads, as_json),
+        ("pickle", lambda v: pickle.dumps(v, pickle.HIGHEST_PROTOCOL), pickle.loads, pickled),
+    ):
+        common.report("%s encode" % label, common.best_of(lambda: dumps(value), number=10))
+        common.report("%s decode" % label, common.best_of(lambda: loads(data), number=10))
+        print("%-50s %12d bytes" % ("%s size" % label, len(data)))
+
+    common.report(
+        "codec load_key, 1 host of 200",
+        common.best_of(lambda: codec.load_key(encoded, u'host150'), number=100)
+    )
+
+
+if __name__ == "__main__":
+    main()
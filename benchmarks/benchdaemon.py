@@ -0,0 +1,99 @@
+"""
+Benchmark renders from a RenderServer against rendering in process.
+
+The server runs in a child process on a Unix socket, serving a directory of
+100 host templates which each refer to a common one.
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+import common
+
+from boaconstructor.daemon import RenderClient
+from boaconstructor.daemon import RenderServer
+from boaconstructor.directory import TemplateDirectory
+
+
+HOSTS = 100
+
+
+def write_fleet(directory):
+    shared, templates = common.fleet(hosts=HOSTS, keys=20)
+    for template in [shared] + templates:
+        stream = open(os.path.join(directory, "%s.json" % template.name), 'w')
+        try:
+            json.dump(template.content, stream)
+
+        finally:
+            stream.close()
+
+
+def serve(path, directory):
+    RenderServer(path, directory).serve_forever()
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'render.sock')
+    write_fleet(directory)
+
+    server = multiprocessing.Process(target=serve, args=(path, directory))
+    server.start()
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+        conf = TemplateDirectory(directory)
+        names = ['host%d' % h for h in range(HOSTS)]
+        host = conf.templates['host1']
+
+        common.report(
+            "in process Template.render",
+            common.best_of(lambda: host.render(conf.templates), number=200)
+        )
+        common.report(
+            "in process TemplateDirectory.render (kept)",
+            common.best_of(lambda: conf.render('host1'), number=2000)
+        )
+
+        client = RenderClient(path)
+        client.render_many(names)
+        common.report(
+            "client.render, one at a time",
+            common.best_of(lambda: client.render('host1'), number=2000)
+        )
+        common.report(
+            "client.render_many, %d pipelined (per render)" % HOSTS,
+            common.best_of(lambda: client.render_many(names), number=20) / HOSTS
+        )
+
+        def threaded(count=4, each=500):
+            def work():
+                for i in range(each):
+                    client.render('host1')
+            threads = [threading.Thread(target=work) for i in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        started = time.time()
+        threaded()
+        taken = time.time() - started
+        print("%-50s %12.0f /s" % ("client.render from 4 threads", 2000 / taken))
+
+        client.close()
+
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark importing boaconstructor in a fresh interpreter, less the time to
+start one which imports nothing, and count the modules the import loads.
+"""
+import os
+import sys
+import time
+import subprocess
+
+import common
+
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+
+COUNT = (
+    "import sys; before = set(sys.modules); import boaconstructor; "
+    "print(len([m for m in set(sys.modules) - before if sys.modules[m]]))"
+)
+
+
+def started(code, repeat=20):
+    """Return the best wall time in seconds to run python -c code."""
+    environ = dict(os.environ, PYTHONPATH=LIB)
+    best = None
+    for i in range(repeat):
+        began = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=environ)
+        taken = time.time() - began
+        if best is None or taken < best:
+            best = taken
+    return best
+
+
+def main():
+    baseline = started("pass")
+    imported = started("import boaconstructor")
+    modules = subprocess.Popen(
+        [sys.executable, '-c', COUNT],
+        env=dict(os.environ, PYTHONPATH=LIB),
+        stdout=subprocess.PIPE,
+    ).communicate()[0]
+
+    common.report("start python", baseline)
+    common.report("import boaconstructor (less starting python)", imported - baseline)
+    print("%-50s %12d" % ("modules loaded by the import", int(modules)))
+
+
+if __name__ == "__main__":
+    main()
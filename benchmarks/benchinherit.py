@@ -0,0 +1,30 @@
+"""
+Benchmark rendering a leaf template extending a large base, against
+rendering the same base with extendwith each time.
+"""
+import common
+
+from boaconstructor import Template
+
+
+def main():
+    shared, templates = common.fleet(hosts=1, keys=500)
+    base = Template('base', dict(templates[0].content), references={'common': shared})
+    host = Template('host', dict(host='host1.example.com', port=80), extends=base)
+    plain = Template('host', dict(host='host1.example.com', port=80))
+
+    common.report(
+        "500 key base, extendwith",
+        common.best_of(
+            lambda: plain.render({'common': shared}, extendwith=base.content),
+            number=100,
+        )
+    )
+    common.report(
+        "500 key base, extends (memoized)",
+        common.best_of(lambda: host.render(), number=100)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark the memory held by a rendered fleet, with and without interning.
+
+Each host includes the same blocks from a common template. Every mode is run
+in a fresh process so the peak resident sizes can be compared.
+
+"""
+import gc
+import sys
+import time
+import resource
+import subprocess
+
+import common
+
+
+HOSTS = 20000
+
+
+def fleet():
+    from boaconstructor import Template
+
+    shared = Template('shared', dict(
+        ntp=dict(servers=['ntp%d.example.com' % i for i in range(4)], burst=True),
+        dns=['10.0.0.%d' % i for i in range(4)],
+        logging=dict(level='info', targets=['syslog', 'file'], rotate=dict(days=7, size='100M')),
+        packages=['pkg%d' % i for i in range(30)],
+    ))
+
+    return [
+        Template('host%d' % h, {
+                'host': 'host%d.example.com' % h,
+                'ntp': 'shared.$.ntp',
+                'dns': 'shared.$.dns',
+                'packages': 'shared.$.packages',
+                'base': 'shared.*',
+            },
+            references={'shared': shared},
+        )
+        for h in range(HOSTS)
+    ]
+
+
+def rss_kb():
+    """The peak resident size of this process so far, in KB on Linux."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode):
+    templates = fleet()
+    gc.collect()
+    before = rss_kb()
+
+    started = time.time()
+    if mode == 'interned':
+        rendered = [t.render(interner=True) for t in templates]
+    else:
+        rendered = [t.render() for t in templates]
+    taken = time.time() - started
+
+    gc.collect()
+    print("%s %d %f" % (mode, rss_kb() - before, taken))
+
+
+def main():
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+        return
+
+    for mode in ('plain', 'interned'):
+        output = subprocess.check_output([sys.executable, __file__, mode])
+        mode, grown, taken = output.split()
+        print("%-50s %12.1f MB %8.2f s" % (
+            "render %d hosts (%s)" % (HOSTS, mode), int(grown) / 1024.0, float(taken)
+        ))
+
+
+if __name__ == "__main__":
+    main()
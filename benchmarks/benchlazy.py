@@ -0,0 +1,34 @@
+"""
+Benchmark rendering one key of a template whose 200 other keys each hold a
+1,000 item list, built up front or given as Lazy factories.
+"""
+import common
+
+from boaconstructor import Lazy
+from boaconstructor import Template
+
+
+def table(i):
+    return ['row%d-%d' % (i, j) for j in range(1000)]
+
+
+def main():
+    def eager():
+        content = dict([('table%d' % i, table(i)) for i in range(200)])
+        content['host'] = 'host1'
+        return Template('host', content).render(keys=['host'])
+
+    def lazy():
+        content = dict([
+            ('table%d' % i, Lazy(lambda i=i: table(i))) for i in range(200)
+        ])
+        content['host'] = 'host1'
+        return Template('host', content).render(keys=['host'])
+
+    assert eager() == lazy()
+    common.report("200 tables, build and render 1 key", common.best_of(eager, number=5))
+    common.report("200 Lazy tables, build and render 1 key", common.best_of(lazy, number=5))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Benchmark rendering a template holding a 200,000 item list, with and without
+resolving it a chunk at a time, for a list with no references and one where
+one item in 2,000 is a reference.
+"""
+import common
+
+from boaconstructor import utils
+from boaconstructor import Template
+
+
+def main():
+    shared = Template('common', dict(a=1))
+    plain = list(range(200000))
+    sparse = list(plain)
+    for i in range(0, len(sparse), 2000):
+        sparse[i] = 'common.$.a'
+
+    for label, items in (("no references", plain), ("1 in 2000 references", sparse)):
+        host = Template('host', dict(items=items), references=dict(common=shared))
+
+        saved = utils.CHUNK_SIZE
+        utils.CHUNK_SIZE = len(items) + 1
+        try:
+            expected = host.render()
+            common.report(
+                "200,000 items, %s, item at a time" % label,
+                common.best_of(host.render, number=3, repeat=3)
+            )
+
+        finally:
+            utils.CHUNK_SIZE = saved
+
+        assert host.render() == expected
+        common.report(
+            "200,000 items, %s, chunked" % label,
+            common.best_of(host.render, number=3, repeat=3)
+        )
+
+
+if __name__ == "__main__":
+    main()
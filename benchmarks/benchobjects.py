@@ -0,0 +1,47 @@
+"""
+Benchmark rendering 50 templates against a settings object whose 20
+attributes are properties costing about 20us each, given as it is and
+wrapped in Attributes.
+"""
+import time
+
+import common
+
+from boaconstructor import Template
+from boaconstructor.objects import Attributes
+
+
+def slow(i):
+    def read(self):
+        stop = time.time() + 0.00002
+        while time.time() < stop:
+            pass
+        return i
+    return property(read)
+
+
+Settings = type('Settings', (object,), dict([('key%d' % i, slow(i)) for i in range(20)]))
+
+
+def main():
+    templates = [
+        Template('host%d' % h, dict([('key%d' % i, 'settings.$.key%d' % i) for i in range(20)]))
+        for h in range(50)
+    ]
+    settings = Settings()
+
+    def render(references):
+        return [template.render(references) for template in templates]
+
+    plain = dict(settings=settings)
+    wrapped = dict(settings=Attributes(settings))
+    shared = dict(settings=Attributes(settings, ttl=60))
+    assert render(plain) == render(wrapped) == render(shared)
+
+    common.report("50 renders, plain object", common.best_of(lambda: render(plain), number=3))
+    common.report("50 renders, Attributes per render", common.best_of(lambda: render(wrapped), number=3))
+    common.report("50 renders, Attributes with a ttl", common.best_of(lambda: render(shared), number=3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Benchmark tenant renders of a 500 key template where each tenant overrides
+one reference used by 5 keys, rendering with the merged references against
+an Overlay.
+"""
+import common
+
+from boaconstructor import Template
+from boaconstructor.overlay import Overlay
+
+
+def main():
+    shared, templates = common.fleet(hosts=1, keys=500)
+    content = dict(templates[0].content)
+    for i in range(5):
+        content['tenant%d' % i] = 'tenant.$.value%d' % i
+    template = Template('host', content, references={'common': shared})
+
+    base = dict(tenant=dict([('value%d' % i, 'base') for i in range(5)]))
+    overrides = dict(tenant=dict([('value%d' % i, 't1') for i in range(5)]))
+    merged = dict(base, **overrides)
+
+    overlay = Overlay(base)
+    assert overlay.render(template, overrides) == template.render(merged)
+
+    common.report(
+        "500 keys, render with merged references",
+        common.best_of(lambda: template.render(merged), number=100)
+    )
+    common.report(
+        "500 keys, overlay render (5 keys affected)",
+        common.best_of(lambda: overlay.render(template, overrides), number=100)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark the basic render path, with and without instrumentation and tracing.
+
+The 'disabled' figure is the one to watch: rendering without an Instrument
+must stay as close as possible to the plain render.
+
+"""
+import common
+
+from boaconstructor.instrument import Instrument
+
+
+def main():
+    shared, templates = common.fleet(hosts=1, keys=50)
+    host = templates[0]
+
+    common.report(
+        "render 50 keys (instrument disabled)",
+        common.best_of(lambda: host.render())
+    )
+
+    instrument = Instrument()
+    common.report(
+        "render 50 keys (instrument enabled)",
+        common.best_of(lambda: host.render(instrument=instrument))
+    )
+
+    common.report(
+        "render 50 keys (trace=True)",
+        common.best_of(lambda: host.render(trace=True))
+    )
+
+    shared, templates = common.fleet(hosts=1, keys=5000)
+    big = templates[0]
+    common.report(
+        "render 5000 keys",
+        common.best_of(lambda: big.render(), number=10)
+    )
+    common.report(
+        "render 3 of 5000 keys (keys=...)",
+        common.best_of(lambda: big.render(keys=['key1', 'key2', 'host']))
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark checking renders against a schema: the whole rendered dict checked
+after each render, against the template's compiled schema which only checks
+the values from references per render.
+"""
+import common
+
+from boaconstructor import Template
+from boaconstructor.schema import Schema
+
+
+def main():
+    shared, templates = common.fleet(hosts=1, keys=20)
+    content = dict(templates[0].content)
+    spec = dict([(key, basestring) for key in content])
+    spec.update(host=basestring, port=int)
+    for i in range(200):
+        content['literal%d' % i] = dict(name='item%d' % i, sizes=range(10))
+        spec['literal%d' % i] = dict(name=basestring, sizes=[int])
+
+    schema = Schema(spec)
+    plain = Template('host', content, references={'common': shared})
+    checked = Template('host', content, references={'common': shared}, schema=schema)
+
+    def render_then_check():
+        assert not schema.check(plain.render())
+
+    common.report(
+        "render only",
+        common.best_of(plain.render, number=200)
+    )
+    common.report(
+        "render then check the whole dict",
+        common.best_of(render_then_check, number=200)
+    )
+    common.report(
+        "render with compiled schema",
+        common.best_of(checked.render, number=200)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Shared helpers for the boaconstructor benchmarks.
+
+Each bench*.py script in this directory can be run on its own from the
+project root e.g.::
+
+    python benchmarks/benchrender.py
+
+or all of them with::
+
+    python benchmarks/run.py
+
+"""
+import os
+import sys
+import timeit
+
+# Force finding the lib version first, as setup.py does:
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+)
+
+
+def best_of(func, number=1000, repeat=5):
+    """Return the best time in seconds per call of func().
+    """
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def report(label, seconds):
+    """Print a benchmark result line in microseconds per call.
+    """
+    print("%-50s %12.2f us" % (label, seconds * 1e6))
+
+
+def fleet(hosts=100, keys=20):
+    """Create a common template and a set of host templates referring to it.
+
+    :returns: (common, [host templates...])
+
+    """
+    from boaconstructor import Template
+
+    common = Template('common', dict(
+        [('key%d' % i, 'value%d' % i) for i in range(keys)]
+    ))
+
+    templates = []
+    for h in range(hosts):
+        content = dict(
+            [('key%d' % i, 'common.$.key%d' % i) for i in range(keys)]
+        )
+        content['host'] = 'host%d.example.com' % h
+        content['port'] = 8000 + h
+        templates.append(
+            Template('host%d' % h, content, references={'common': common})
+        )
+
+    return common, templates
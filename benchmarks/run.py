@@ -0,0 +1,19 @@
+"""
+Run all the bench*.py benchmarks in this directory.
+"""
+import os
+import glob
+import subprocess
+import sys
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for script in sorted(glob.glob(os.path.join(here, 'bench*.py'))):
+        print("== %s" % os.path.basename(script))
+        sys.stdout.flush()
+        subprocess.call([sys.executable, script])
+
+
+if __name__ == "__main__":
+    main()
@@ -20,11 +20,117 @@ details of this module.
 
 .. automodule:: boaconstructor.utils
 
+
+Render instrumentation
+----------------------
+
+.. automodule:: boaconstructor.instrument
+
+
+Value provenance
+----------------
+
+.. automodule:: boaconstructor.provenance
+
+
+Reference providers
+-------------------
+
+.. automodule:: boaconstructor.providers
+
+
+Asynchronous reference providers
+--------------------------------
+
+.. automodule:: boaconstructor.asyncrender
+
+
+Bulk rendering
+--------------
+
+.. automodule:: boaconstructor.bulk
+
+
+Versioned template store
+------------------------
+
+.. automodule:: boaconstructor.store
+
+
+Caches
+------
+
+.. automodule:: boaconstructor.cache
+
+
+Interning rendered values
+-------------------------
+
+.. automodule:: boaconstructor.interning
+
+
+Fingerprints
+------------
+
+.. automodule:: boaconstructor.fingerprint
+
+
+Consumer index
+--------------
+
+.. automodule:: boaconstructor.index
+
+Validation
+----------
+
+.. automodule:: boaconstructor.validate
+
+Schemas
+-------
+
+.. automodule:: boaconstructor.schema
+
+The boaconstructor command
+--------------------------
+
+.. automodule:: boaconstructor.cli
+
+Template directories
+--------------------
+
+.. automodule:: boaconstructor.directory
+
+The render daemon
+-----------------
+
+.. automodule:: boaconstructor.daemon
+
+Watching for changes
+--------------------
+
+.. automodule:: boaconstructor.watch
+
+Tenant overlays
+---------------
+
+.. automodule:: boaconstructor.overlay
+
+Object references
+-----------------
+
+.. automodule:: boaconstructor.objects
+
+Binary encoding
+---------------
+
+.. automodule:: boaconstructor.codec
+
 """
 import utils
 import core
 
 from core import Template
 from core import TemplateError
+from utils import Lazy
 
 __version__ = "0.2.0"
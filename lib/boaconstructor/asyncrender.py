@@ -0,0 +1,295 @@
+"""
+.. module::`asyncrender`
+    :platform: Unix, Windows
+    :synopsis: Render templates whose references come from slow providers.
+
+A reference provider is any object with a ``get(name, attribute)`` method,
+which returns the value of the attribute for the reference name it is
+registered under. An attribute of None is an all-inclusion, the provider must
+then return a dict of everything the reference contains. If the attribute is
+not present it should raise :py:class:`boaconstructor.utils.AttributeError`.
+
+Provider lookups are slow so they are not done one at a time during the
+render. Instead every lookup the template needs is worked out, as for the
+get_many providers in :py:mod:`boaconstructor.providers`, and these are all
+started at once on a :py:class:`ProviderPool`. This is repeated with the
+results until nothing is missing and the render is then done against the
+values fetched. Identical lookups which are already in flight, from this
+or any other render sharing the pool, are waited on and not started again.
+
+Example:
+
+.. code-block:: python
+
+    from boaconstructor.asyncrender import ProviderPool
+
+    pool = ProviderPool({'kv': KeyValueSidecar()}, workers=8)
+
+    host1 = Template('host1', {
+        'timeout': 'kv.$.timeout',
+        'region': 'kv.$.region',
+    })
+
+    pending = host1.render_async(pool)
+    ...
+    result = pending.get(timeout=5)
+
+Providers are given at render time so they have the same priority as the
+external references: render time references beat providers which beat the
+template's own references.
+
+.. autoclass:: ProviderPool
+    :members:
+
+.. autoclass:: Pending
+    :members:
+
+.. autofunction:: render_async
+
+"""
+__all__ = ['ProviderPool', 'Pending', 'render_async']
+
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+from boaconstructor import utils
+from boaconstructor import providers
+
+
+# Raise an error with the traceback of where it was first raised. The three
+# argument raise isn't valid syntax everywhere the package is compiled:
+if sys.version_info[0] < 3:
+    exec("def _reraise(exc_type, exc_value, traceback):\n"
+         "    raise exc_type, exc_value, traceback\n")
+else:
+    def _reraise(exc_type, exc_value, traceback):
+        raise exc_value.with_traceback(traceback)
+
+
+class ProviderPool(object):
+    """The worker threads and in flight lookups for a set of providers.
+
+    Share one of these between renders so identical lookups are only made
+    once while they are in flight.
+
+    """
+    def __init__(self, providers, workers=8):
+        """
+        :param providers: a dict of reference name to provider.
+
+        :param workers: the number of lookups which can run at once.
+
+        """
+        self.providers = providers
+        self._pool = ThreadPool(workers)
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+
+    def fetch(self, name, attribute):
+        """Start a lookup or join the one already in flight for it.
+
+        :returns: a :py:class:`Pending` for the value.
+
+        """
+        key = (name, attribute)
+        self._lock.acquire()
+        try:
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Pending()
+                self._pool.apply_async(pending._run, (self._get, key))
+
+        finally:
+            self._lock.release()
+
+        return pending
+
+
+    def close(self):
+        """Stop the worker threads once the lookups in flight are done."""
+        self._pool.close()
+        self._pool.join()
+
+
+    def _get(self, name, attribute):
+        try:
+            return self.providers[name].get(name, attribute)
+
+        finally:
+            # The result is handed to whoever is waiting on it, later
+            # lookups of the same key will go to the provider again.
+            self._lock.acquire()
+            try:
+                self._inflight.pop((name, attribute), None)
+
+            finally:
+                self._lock.release()
+
+
+class Pending(object):
+    """A result which will be ready later, returned by :py:func:`render_async`
+    and :py:meth:`ProviderPool.fetch`.
+
+    This is modelled on multiprocessing's AsyncResult, except any number of
+    threads can wait on it.
+
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+
+    def ready(self):
+        """Return True when the result is ready or has failed."""
+        return self._done.is_set()
+
+
+    def wait(self, timeout=None):
+        """Wait for the result to be ready."""
+        self._done.wait(timeout)
+
+
+    def get(self, timeout=None):
+        """Return the result, raising any error raised while working it out.
+
+        :param timeout: seconds to wait. If the result isn't ready by then
+        a multiprocessing.TimeoutError is raised.
+
+        """
+        self._done.wait(timeout)
+        if not self._done.is_set():
+            from multiprocessing import TimeoutError
+            raise TimeoutError("The result was not ready in time.")
+
+        if self._exc_info:
+            exc_type, exc_value, traceback = self._exc_info
+            _reraise(exc_type, exc_value, traceback)
+
+        return self._result
+
+
+    def _run(self, func, args):
+        try:
+            self._result = func(*args)
+
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+        self._done.set()
+
+
+def render_async(template, pool, references=None, extendwith=None):
+    """Render the template in the background, gathering provider lookups.
+
+    :param template: the :py:class:`boaconstructor.Template` to render.
+
+    :param pool: a :py:class:`ProviderPool` or a dict of reference name to
+    provider. A pool is created for a dict and closed when the render is done.
+
+    :param references: the render time references, as for Template.render.
+
+    :param extendwith: as for Template.render.
+
+    :returns: a :py:class:`Pending`, its get() returns the rendered dict.
+
+    """
+    if references is None:
+        references = {}
+    if extendwith is None:
+        extendwith = {}
+
+    pending = Pending()
+    worker = threading.Thread(
+        target=pending._run,
+        args=(_render, (template, pool, references, extendwith)),
+    )
+    worker.daemon = True
+    worker.start()
+    return pending
+
+
+def _render(template, pool, references, extendwith):
+    """Fetch every provider lookup the template needs, then render it."""
+    own_pool = not isinstance(pool, ProviderPool)
+    if own_pool:
+        pool = ProviderPool(pool)
+
+    snapshot = template.snapshot()
+    try:
+        reference_cache = utils.build_ref_cache(snapshot.references, references)
+
+        # Any get_many providers in the references are batched as usual:
+        reference_cache, views = providers.with_views(reference_cache)
+
+        ext_refs = reference_cache['ext'] = dict(reference_cache['ext'])
+        for name, provider in pool.providers.items():
+            if name not in ext_refs:
+                view = ext_refs[name] = providers.View(name, provider)
+                views.append(view)
+
+        fetch = lambda wanted: _gather(pool, wanted)
+        values = [value for key, value in snapshot.content.items()]
+        values.extend([value for key, value in extendwith.items()])
+        providers.prefetch(values, reference_cache, views, fetch=fetch)
+
+        # The templates extended are rendered with the views as references,
+        # so their lookups are gathered here too:
+        extends = template.extends
+        while extends is not None:
+            found = extends.snapshot()
+            providers.prefetch(
+                [value for key, value in found.content.items()],
+                utils.build_ref_cache(found.references, ext_refs),
+                views,
+                fetch=fetch,
+            )
+            extends = extends.extends
+
+    finally:
+        if own_pool:
+            pool.close()
+
+    # Rendered as Template.render does, so inheritance and the schema apply:
+    return template._render(
+        ext_refs, extendwith, reference_cache=reference_cache, snapshot=snapshot
+    )
+
+
+def _gather(pool, wanted):
+    """Start all the lookups the views are missing, then wait for them.
+
+    :param wanted: a list of (View, set of attributes it is missing).
+
+    """
+    pending = []
+    batched = []
+    for view, attributes in wanted:
+        if providers.is_provider(view.provider):
+            batched.append((view, attributes))
+            continue
+
+        if None in attributes:
+            attributes = [None]
+        pending.append((view, [(a, pool.fetch(view.name, a)) for a in attributes]))
+
+    # get_many providers are fetched while the lookups are in flight:
+    providers.fetch_views(batched)
+
+    for view, lookups in pending:
+        if lookups[0][0] is None:
+            view.add(None, lookups[0][1].get())
+            continue
+
+        values = {}
+        for attribute, lookup in lookups:
+            try:
+                values[attribute] = lookup.get()
+
+            except utils.AttributeError:
+                # Absent, the render will fall back or raise as usual.
+                pass
+
+        view.add([attribute for attribute, lookup in lookups], values)
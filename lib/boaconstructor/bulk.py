@@ -0,0 +1,220 @@
+"""
+.. module::`bulk`
+    :platform: Unix, Windows
+    :synopsis: Render one template many times from a table of parameters.
+
+Instead of creating a Template per row of near identical configuration, give
+the one template and a columnar table of the values which differ. Each column
+overrides the template key of the same name for that row:
+
+.. code-block:: python
+
+    from boaconstructor.bulk import render_rows
+
+    webserver = Template('webserver', dict(
+        host='<per row>',
+        port=80,
+        url='webserver.$.host',
+        timeout='common.$.timeout',
+    ))
+
+    rows = render_rows(
+        webserver,
+        dict(host=['a.example.com', 'b.example.com'], port=[80, 8080]),
+        references={'webserver': webserver, 'common': common},
+    )
+
+    >> rows[1]
+    {'host': 'b.example.com', 'port': 8080, 'url': 'b.example.com', 'timeout': 30}
+
+The table can also be a CSV file name or file object with a header line, the
+values are then strings.
+
+The keys which don't depend on the parameters are resolved once and shared
+by every row. A key depends on the parameters if it is a column, if working
+it out used a reference to the template itself (like 'url' above) or if it
+couldn't be resolved without the row. Only these are resolved for each row.
+The shared values are the same objects in every row, so copy any you want to
+change.
+
+Keys inherited from a template extended are added to each row, and rows are
+checked against the template's schema, as :py:meth:`Template.render` does.
+
+.. autofunction:: render_rows
+
+.. autofunction:: iter_rows
+
+"""
+__all__ = ['render_rows', 'iter_rows']
+
+import csv
+import types
+
+from boaconstructor import core
+from boaconstructor import utils
+from boaconstructor import provenance
+
+
+def render_rows(template, table, references=None, extendwith=None):
+    """Render the template once for every row of the table.
+
+    :returns: a list of rendered dicts, in row order.
+
+    See :py:func:`iter_rows` for the arguments.
+
+    """
+    return list(iter_rows(template, table, references, extendwith))
+
+
+def iter_rows(template, table, references=None, extendwith=None):
+    """Render the template for each row of the table as it is asked for.
+
+    :param template: the :py:class:`boaconstructor.Template` to render.
+
+    :param table: a dict of column name to a list of values, all of the same
+    length. Or a CSV file name or open file with a header line.
+
+    :param references: the render time references, as for Template.render.
+
+    :param extendwith: as for Template.render.
+
+    :returns: a generator of rendered dicts, in row order.
+
+    """
+    if references is None:
+        references = {}
+    if extendwith is None:
+        extendwith = {}
+
+    columns, rows = _read_table(table)
+
+    snapshot = template.snapshot()
+    content = snapshot.content
+    reference_cache = utils.build_ref_cache(snapshot.references, references)
+    reference_cache = utils.prefetch_providers(
+        content.items(), extendwith, reference_cache
+    )
+
+    # The names the template itself is known by:
+    own_names = [
+        (dest, name)
+        for dest in ('int', 'ext')
+        for name, source in reference_cache[dest].items()
+        if source is template
+    ]
+    own = set([name for dest, name in own_names])
+
+    # Resolve everything the rows don't override, noting what was used.
+    tracer = provenance.Trace()
+    traced = dict(reference_cache, trace=tracer)
+
+    shared = {}
+    depends = set(columns)
+
+    items = [(k, v) for k, v in extendwith.items() if k not in content]
+    items.extend(content.items())
+    for key, value in items:
+        if key in depends:
+            continue
+
+        tracer.enter(key)
+        try:
+            shared[key] = utils.hunt_n_resolve(value, traced)
+
+        except (utils.ReferenceError, utils.AttributeError):
+            # This may work once the row's values are there.
+            depends.add(key)
+
+        tracer.unwind()
+
+    for key, names in tracer.dependencies.items():
+        if names & own:
+            depends.add(key)
+            shared.pop(key, None)
+
+    # What the templates extended give, as for Template.render:
+    inherited = {}
+    if template.extends is not None:
+        inherited = template.extends._inherit(references).rendered
+
+    # The columns are checked as rendered, the rest of the content as given:
+    plan = None
+    if template.schema is not None:
+        plan = template.schema.plan(dict([
+            (key, value) for key, value in content.items() if key not in columns
+        ]))
+
+    for row in rows:
+        row_content = dict(content)
+        row_content.update(row)
+
+        row_cache = reference_cache
+        if own_names:
+            # References to the template now point at this row's version:
+            row_template = core.Template(
+                template.name, row_content, snapshot.references
+            )
+            row_cache = dict(reference_cache)
+            for dest in ('int', 'ext'):
+                row_cache[dest] = dict(reference_cache[dest])
+            for dest, name in own_names:
+                row_cache[dest][name] = row_template
+
+        returned = dict(shared)
+        for key in depends:
+            if key in row_content:
+                value = row_content[key]
+            elif key in extendwith:
+                value = extendwith[key]
+            else:
+                continue
+            returned[key] = utils.hunt_n_resolve(value, row_cache)
+
+        for key in inherited:
+            if key not in row_content:
+                returned[key] = core._copied(inherited[key])
+
+        if plan is not None:
+            problems = plan.check(returned)
+            if problems:
+                from boaconstructor.schema import SchemaError
+                raise SchemaError(template.name, problems)
+
+        yield returned
+
+
+def _read_table(table):
+    """Recover the column names and a row iterator from the table.
+
+    :returns: (column names, iterator of row dicts)
+
+    """
+    if isinstance(table, dict):
+        columns = list(table.keys())
+        lengths = set([len(table[column]) for column in columns])
+        if len(lengths) > 1:
+            raise ValueError("The table columns are not all the same length!")
+
+        def rows():
+            for values in zip(*[table[column] for column in columns]):
+                yield dict(zip(columns, values))
+
+        return columns, rows()
+
+    if not isinstance(table, types.StringTypes):
+        reader = csv.DictReader(table)
+        return reader.fieldnames, reader
+
+    handle = open(table, 'rb')
+    reader = csv.DictReader(handle)
+    columns = reader.fieldnames
+
+    def rows():
+        try:
+            for row in reader:
+                yield row
+
+        finally:
+            handle.close()
+
+    return columns, rows()
@@ -0,0 +1,381 @@
+"""
+.. module::`cache`
+    :platform: Unix, Windows
+    :synopsis: Bounded caches with LRU eviction, TTL and statistics.
+
+The caches kept by the library use :py:class:`Cache` so their memory use can
+be capped in long running processes. Each can hold at most 'max_entries'
+entries and roughly 'max_bytes' bytes. When either limit is reached the least
+recently used entries are evicted. Entries can also expire 'ttl' seconds
+after they were stored.
+
+The library's shared caches are registered by name and can be inspected or
+limited at any time:
+
+.. code-block:: python
+
+    from boaconstructor import cache
+
+    cache.configure('chunk_scan', max_entries=16, max_bytes=512 * 1024)
+
+    >> cache.stats()
+    {'chunk_scan': {'hits': 10412, 'misses': 180, 'evictions': 0,
+        'expired': 0, 'entries': 16, 'bytes': 51840, ...}}
+
+The registered caches are:
+
+  * 'chunk_scan': which chunks of the long lists rendered hold references.
+
+The parsed reference strings aren't kept in one of these, as the lock taken
+by every get would be taken for every string rendered.
+
+Each reference provider based on :py:class:`boaconstructor.providers.Provider`
+has a cache of its own, limited by the arguments it is created with.
+
+The byte sizes are estimates made with sys.getsizeof, following the contents
+of lists, tuples, sets and dicts. A function can be given to work them out
+instead.
+
+.. autoclass:: Cache
+    :members:
+
+.. autofunction:: register
+
+.. autofunction:: get_cache
+
+.. autofunction:: configure
+
+.. autofunction:: stats
+
+"""
+__all__ = ['Cache', 'register', 'get_cache', 'configure', 'stats', 'approximate_size']
+
+import sys
+import time
+import thread
+
+
+# The default for arguments to Cache.configure which aren't being changed:
+UNCHANGED = object()
+
+# The positions in each entry's link:
+PREV, NEXT, KEY, VALUE, SIZE, EXPIRES = range(6)
+
+
+def approximate_size(key, value):
+    """Estimate the bytes held by a cache entry."""
+    return _sizeof(key) + _sizeof(value)
+
+
+def _sizeof(value, depth=4):
+    size = sys.getsizeof(value)
+    if depth:
+        depth -= 1
+        if isinstance(value, dict):
+            for key, item in value.items():
+                size += _sizeof(key, depth) + _sizeof(item, depth)
+
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            for item in value:
+                size += _sizeof(item, depth)
+
+    return size
+
+
+class Cache(object):
+    """A thread safe mapping which evicts the least recently used entries.
+
+    The entries are kept in a doubly linked list in the order they were used,
+    with a dict to find them. Looking up, storing and evicting are O(1).
+
+    """
+    def __init__(self, name, max_entries=None, max_bytes=None, ttl=None, sizeof=approximate_size):
+        """
+        :param name: the name the statistics are reported under.
+
+        :param max_entries: the most entries to hold, None for no limit.
+
+        :param max_bytes: roughly the most bytes to hold, None for no limit.
+
+        :param ttl: the seconds an entry is kept for, None to keep it until
+        it is evicted.
+
+        :param sizeof: called with (key, value) to estimate the bytes an
+        entry holds. It is only called if max_bytes is set.
+
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self._lock = thread.allocate_lock()
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0, None]
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+
+    def __len__(self):
+        return len(self._links)
+
+
+    def __contains__(self, key):
+        """True if the key has an unexpired entry. The entry is not counted
+        as used.
+        """
+        link = self._links.get(key)
+        return link is not None and not self._stale(link, time.time())
+
+
+    def get(self, key, default=None):
+        """Return the value stored for the key, or the default if there is
+        none or it has expired.
+        """
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+
+            if link[EXPIRES] is not None and link[EXPIRES] <= time.time():
+                self._unlink(link)
+                self.expired += 1
+                self.misses += 1
+                return default
+
+            # Move it to the most recently used end:
+            root = self._root
+            last = root[PREV]
+            if last is not link:
+                prev, following = link[PREV], link[NEXT]
+                prev[NEXT] = following
+                following[PREV] = prev
+                last[NEXT] = root[PREV] = link
+                link[PREV] = last
+                link[NEXT] = root
+
+            self.hits += 1
+            return link[VALUE]
+
+        finally:
+            self._lock.release()
+
+
+    def put(self, key, value):
+        """Store the value for the key, evicting entries to stay in the limits.
+
+        A value which is bigger than max_bytes on its own is not stored.
+
+        """
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, value)
+            if size > self.max_bytes:
+                self.pop(key)
+                return
+
+        expires = None
+        if self.ttl:
+            expires = time.time() + self.ttl
+
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+
+            root = self._root
+            last = root[PREV]
+            link = [last, root, key, value, size, expires]
+            last[NEXT] = root[PREV] = self._links[key] = link
+            self._bytes += size
+
+            self._evict()
+
+        finally:
+            self._lock.release()
+
+
+    def pop(self, key, default=None):
+        """Remove the entry for the key and return its value, or the default
+        if there isn't one.
+        """
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                return default
+
+            self._unlink(link)
+            return link[VALUE]
+
+        finally:
+            self._lock.release()
+
+
+    def items(self):
+        """Return the unexpired (key, value) entries, least recently used first.
+
+        The entries are not counted as used.
+
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            returned = []
+            link = self._root[NEXT]
+            while link is not self._root:
+                if not self._stale(link, now):
+                    returned.append((link[KEY], link[VALUE]))
+                link = link[NEXT]
+
+        finally:
+            self._lock.release()
+
+        return returned
+
+
+    def clear(self):
+        """Remove every entry. The statistics are not reset."""
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None, 0, None]
+            self._bytes = 0
+
+        finally:
+            self._lock.release()
+
+
+    def configure(self, max_entries=UNCHANGED, max_bytes=UNCHANGED, ttl=UNCHANGED):
+        """Change the limits, evicting at once to fit in new ones.
+
+        Arguments not given are left as they are. If max_bytes is set for the
+        first time the sizes of the entries held are worked out.
+
+        """
+        self._lock.acquire()
+        try:
+            if max_entries is not UNCHANGED:
+                self.max_entries = max_entries
+            if ttl is not UNCHANGED:
+                self.ttl = ttl
+            if max_bytes is not UNCHANGED:
+                if max_bytes is not None and self.max_bytes is None:
+                    self._bytes = 0
+                    for link in self._links.values():
+                        link[SIZE] = self.sizeof(link[KEY], link[VALUE])
+                        self._bytes += link[SIZE]
+                self.max_bytes = max_bytes
+
+            self._evict()
+
+        finally:
+            self._lock.release()
+
+
+    def stats(self):
+        """Return a dict of the statistics and limits."""
+        self._lock.acquire()
+        try:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                expired=self.expired,
+                entries=len(self._links),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+            )
+
+        finally:
+            self._lock.release()
+
+
+    def reset_stats(self):
+        """Set the hit, miss, eviction and expired counts back to 0."""
+        self._lock.acquire()
+        try:
+            self.hits = self.misses = self.evictions = self.expired = 0
+
+        finally:
+            self._lock.release()
+
+
+    def _stale(self, link, now):
+        return link[EXPIRES] is not None and link[EXPIRES] <= now
+
+
+    def _unlink(self, link):
+        """Remove an entry, call with the lock held."""
+        prev, following = link[PREV], link[NEXT]
+        prev[NEXT] = following
+        following[PREV] = prev
+        del self._links[link[KEY]]
+        self._bytes -= link[SIZE]
+
+
+    def _evict(self):
+        """Evict the least recently used entries until inside the limits,
+        call with the lock held.
+        """
+        root = self._root
+        max_entries = self.max_entries
+        max_bytes = self.max_bytes
+        while root[NEXT] is not root and (
+            (max_entries is not None and len(self._links) > max_entries) or
+            (max_bytes is not None and self._bytes > max_bytes)
+        ):
+            self._unlink(root[NEXT])
+            self.evictions += 1
+
+
+_registered = {}
+_registered_lock = thread.allocate_lock()
+
+
+def register(cache):
+    """Make the cache available to :py:func:`configure` and :py:func:`stats`
+    under its name, replacing any with the same name.
+    """
+    _registered_lock.acquire()
+    try:
+        _registered[cache.name] = cache
+
+    finally:
+        _registered_lock.release()
+
+    return cache
+
+
+def get_cache(name):
+    """Return the registered cache, raising KeyError if there isn't one."""
+    return _registered[name]
+
+
+def configure(name, max_entries=UNCHANGED, max_bytes=UNCHANGED, ttl=UNCHANGED):
+    """Change the limits of the registered cache, see :py:meth:`Cache.configure`.
+    """
+    get_cache(name).configure(max_entries, max_bytes, ttl)
+
+
+def stats():
+    """Return a dict of registered cache name to its statistics."""
+    _registered_lock.acquire()
+    try:
+        caches = list(_registered.values())
+
+    finally:
+        _registered_lock.release()
+
+    return dict([(cache.name, cache.stats()) for cache in caches])
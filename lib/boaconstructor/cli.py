@@ -0,0 +1,418 @@
+"""
+.. module::`cli`
+    :platform: Unix, Windows
+    :synopsis: The boaconstructor command, renders a directory of JSON templates.
+
+Installing the package adds a 'boaconstructor' command. It renders templates
+kept as JSON files in a directory and prints the result as JSON:
+
+.. code-block:: sh
+
+    $ ls conf/
+    common.json  host1.json  host2.json
+
+    $ cat conf/host1.json
+    {"host": "1.2.3.4", "timeout": "common.$.timeout"}
+
+    $ boaconstructor conf/ host1
+    {"host": "1.2.3.4", "timeout": 42}
+
+    $ boaconstructor conf/ --keys timeout --jobs 4 --stats
+    {"common": {"timeout": 42}, "host1": {"timeout": 42}, ...}
+
+Each file name.json holds the content dict of the template 'name'. Every
+template in the directory can refer to the others by name. With no names
+given all of them are rendered. If just one name is given its rendered dict
+is printed, otherwise a dict of name to rendered dict.
+
+The options are:
+
+  * --keys a,b: only render these keys.
+
+  * --jobs N: render in N processes.
+
+  * --output DIR: write each render to DIR/name.json instead.
+
+  * --cache DIR: where to keep the cache, by default in
+    ~/.cache/boaconstructor.
+
+  * --no-cache: don't read or write the cache.
+
+  * --stats: print the time taken and the cache use to stderr.
+
+The cache holds the parsed content of each file and each render with the
+files it used. A render is reused while none of those files has changed
+size or modification time, so running again over unchanged files parses and
+resolves nothing. Files are only parsed if something has to be rendered, and
+then only those which changed.
+
+The cache is written with :py:mod:`boaconstructor.codec`, each render under
+a top level key of its own. When everything asked for is cached only those
+renders are decoded, with codec.load_keys, and not the parsed files or any
+other render.
+
+.. autofunction:: main
+
+.. autofunction:: run
+
+"""
+__all__ = ['main', 'run']
+
+import os
+import sys
+import time
+import json
+import hashlib
+import optparse
+
+from boaconstructor import core
+from boaconstructor import codec
+from boaconstructor import utils
+from boaconstructor import provenance
+from boaconstructor.directory import load
+from boaconstructor.directory import signature
+
+
+# Bump when the cache's contents change form:
+CACHE_FORMAT = 3
+
+# The templates each worker process renders from:
+_templates = {}
+
+
+def _default_cache():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    return os.path.join(base, 'boaconstructor')
+
+
+def _cache_file(cache_dir, directory):
+    digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, "%s.cache" % digest)
+
+
+def _read_cache(path):
+    """Return the cache file's data, or None if there is no usable cache.
+
+    Only the format is decoded.
+
+    """
+    try:
+        stream = open(path, 'rb')
+        try:
+            data = stream.read()
+
+        finally:
+            stream.close()
+
+        if codec.load_key(data, 'format', None) == CACHE_FORMAT:
+            return data
+
+    except Exception:
+        pass
+
+    return None
+
+
+def _render_key(name, keys):
+    """The top level key a render is cached under."""
+    if keys is not None:
+        keys = list(keys)
+    return "render %s" % json.dumps([name, keys])
+
+
+def _cached_renders(data, wanted):
+    """Return a dict of (name, keys) to the cached (files used, rendered),
+    for those of the wanted (name, keys) which are cached. Only these
+    renders are decoded.
+    """
+    if data is None:
+        return {}
+    try:
+        found = codec.load_keys(data, [_render_key(name, keys) for name, keys in wanted])
+
+    except Exception:
+        return {}
+
+    returned = {}
+    for name, keys, used, rendered in found.values():
+        returned[(name, keys)] = (used, rendered)
+    return returned
+
+
+def _load_cache(data):
+    """Return the cached (parsed, renders), or empty ones if there is no
+    usable cache.
+    """
+    if data is None:
+        return {}, {}
+    try:
+        cached = codec.loads(data)
+
+    except Exception:
+        return {}, {}
+
+    renders = {}
+    for key, value in cached.items():
+        if key.startswith('render '):
+            name, keys, used, rendered = value
+            renders[(name, keys)] = (used, rendered)
+
+    return cached['parsed'], renders
+
+
+def _save_cache(path, parsed, renders):
+    """Write the cache, replacing the old one in one step."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    cached = dict(format=CACHE_FORMAT, parsed=parsed)
+    for (name, keys), (used, rendered) in renders.items():
+        cached[_render_key(name, keys)] = (name, keys, used, rendered)
+
+    partial = "%s.%d" % (path, os.getpid())
+    stream = open(partial, 'wb')
+    try:
+        stream.write(codec.dumps(cached))
+
+    finally:
+        stream.close()
+
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(partial, path)
+
+
+def _init_worker(contents):
+    _templates.clear()
+    for name, content in contents.items():
+        _templates[name] = core.Template(name, content)
+
+
+def _render(job):
+    """Render one template, in a worker process or in this one.
+
+    :returns: (name, rendered, names used, error message).
+
+    """
+    name, keys = job
+    tracer = provenance.Trace()
+    try:
+        rendered, found = _templates[name].render(
+            _templates, trace=tracer, keys=keys
+        )
+
+    except (core.TemplateError, utils.ReferenceError, utils.AttributeError) as error:
+        return name, None, None, str(error)
+
+    used = set([name])
+    for names in tracer.dependencies.values():
+        used.update(names)
+    return name, rendered, used, None
+
+
+def run(directory, names=None, keys=None, jobs=1, cache_dir=None):
+    """Render templates from a directory of JSON files.
+
+    :param directory: the directory holding the name.json files.
+
+    :param names: the templates to render, by default all of them.
+
+    :param keys: if given only these keys are rendered.
+
+    :param jobs: the number of processes to render in.
+
+    :param cache_dir: where to keep the cache, None to not use one.
+
+    :returns: (rendered, errors, stats). rendered is a dict of name to
+    rendered dict and errors a dict of name to the error message for those
+    which couldn't be rendered. stats is a dict of the counts and times.
+
+    """
+    started = time.time()
+    stats = dict(templates=0, parsed=0, cached=0, rendered=0, failed=0)
+
+    signatures = {}
+    for filename in os.listdir(directory):
+        if filename.endswith('.json'):
+            path = os.path.join(directory, filename)
+            signatures[filename[:-len('.json')]] = signature(path)
+    stats['templates'] = len(signatures)
+
+    if names is None:
+        names = sorted(signatures)
+    if keys is not None:
+        keys = tuple(keys)
+
+    data = None
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _cache_file(cache_dir, directory)
+        data = _read_cache(cache_path)
+
+    def fresh(used):
+        for name, found in used.items():
+            if signatures.get(name) != found:
+                return False
+        return True
+
+    cached = _cached_renders(data, [
+        (name, cached_keys)
+        for name in names if name in signatures
+        for cached_keys in set([keys, None])
+    ])
+
+    rendered = {}
+    errors = {}
+    wanted = []
+    for name in names:
+        if name not in signatures:
+            errors[name] = "There is no template '%s'!" % name
+            continue
+
+        for cached_keys in (keys, None):
+            found = cached.get((name, cached_keys))
+            if found is not None and fresh(found[0]):
+                result = found[1]
+                if cached_keys != keys:
+                    result = dict([(key, result[key]) for key in keys if key in result])
+                rendered[name] = result
+                stats['cached'] += 1
+                break
+        else:
+            wanted.append(name)
+
+    stats['load_time'] = time.time() - started
+
+    if wanted:
+        # Rendering means writing the cache again, so all of it is needed:
+        parsed, renders = _load_cache(data)
+        contents = {}
+        for name, current in signatures.items():
+            found = parsed.get(name)
+            if found is None or found[0] != current:
+                stats['parsed'] += 1
+                parsed.pop(name, None)
+                try:
+                    content = load(os.path.join(directory, "%s.json" % name))
+
+                except core.TemplateError as error:
+                    if name in wanted:
+                        errors[name] = str(error)
+                        stats['failed'] += 1
+                    continue
+                found = parsed[name] = (current, content)
+            contents[name] = found[1]
+        for name in list(parsed):
+            if name not in signatures:
+                del parsed[name]
+        for name, cached_keys in list(renders):
+            if name not in signatures:
+                del renders[(name, cached_keys)]
+
+        rendering = time.time()
+        work = [(name, keys) for name in wanted if name in contents]
+        if jobs > 1 and len(work) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs, _init_worker, (contents,))
+            try:
+                results = pool.map(_render, work, max(1, len(work) // (jobs * 4)))
+
+            finally:
+                pool.close()
+                pool.join()
+
+        else:
+            _init_worker(contents)
+            results = [_render(job) for job in work]
+
+        for name, result, used, error in results:
+            if error is not None:
+                errors[name] = error
+                stats['failed'] += 1
+                continue
+            rendered[name] = result
+            used = dict([
+                (used_name, signatures[used_name])
+                for used_name in used if used_name in signatures
+            ])
+            renders[(name, keys)] = (used, result)
+            stats['rendered'] += 1
+
+        stats['render_time'] = time.time() - rendering
+
+        if cache_path is not None:
+            _save_cache(cache_path, parsed, renders)
+
+    stats['total_time'] = time.time() - started
+    return rendered, errors, stats
+
+
+def main(argv=None):
+    """The boaconstructor command.
+
+    :returns: the exit code, 1 if anything couldn't be rendered.
+
+    """
+    parser = optparse.OptionParser(
+        usage="%prog [options] DIRECTORY [NAME ...]",
+        description="Render the JSON templates in DIRECTORY, all of them "
+            "if no NAMEs are given.",
+    )
+    parser.add_option("--keys", help="only render these comma separated keys")
+    parser.add_option("--jobs", type="int", default=1, help="render in this many processes")
+    parser.add_option("--output", metavar="DIR", help="write each render to DIR/NAME.json")
+    parser.add_option("--cache", metavar="DIR", default=_default_cache(), help="keep the cache here (%default)")
+    parser.add_option("--no-cache", action="store_true", default=False, help="don't use the cache")
+    parser.add_option("--stats", action="store_true", default=False, help="print timing and cache use to stderr")
+
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("The template DIRECTORY is needed.")
+
+    directory, names = args[0], args[1:] or None
+    keys = None
+    if options.keys:
+        keys = [key.strip() for key in options.keys.split(',') if key.strip()]
+
+    rendered, errors, stats = run(
+        directory,
+        names,
+        keys,
+        options.jobs,
+        None if options.no_cache else options.cache,
+    )
+
+    if options.output:
+        if not os.path.isdir(options.output):
+            os.makedirs(options.output)
+        for name, result in rendered.items():
+            stream = open(os.path.join(options.output, "%s.json" % name), 'w')
+            try:
+                json.dump(result, stream, indent=2, sort_keys=True)
+
+            finally:
+                stream.close()
+
+    elif names is not None and len(names) == 1:
+        if rendered:
+            print(json.dumps(rendered[names[0]], indent=2, sort_keys=True))
+
+    else:
+        print(json.dumps(rendered, indent=2, sort_keys=True))
+
+    for name in sorted(errors):
+        sys.stderr.write("%s: %s\n" % (name, errors[name]))
+
+    if options.stats:
+        sys.stderr.write(
+            "templates %(templates)d, parsed %(parsed)d, cached %(cached)d, "
+            "rendered %(rendered)d, failed %(failed)d\n" % stats
+        )
+        for label in ('load_time', 'render_time', 'total_time'):
+            if label in stats:
+                sys.stderr.write("%s %.3f ms\n" % (label, stats[label] * 1000))
+
+    return 1 if errors else 0
@@ -0,0 +1,401 @@
+"""
+.. module::`codec`
+    :platform: Unix, Windows
+    :synopsis: A compact binary encoding of rendered dicts.
+
+Rendered configuration tends to repeat the same keys and values many times
+over. :py:func:`dumps` writes each distinct string once, in a table at the
+front, and refers to it by its index everywhere else. Only the standard
+library is used:
+
+.. code-block:: python
+
+    from boaconstructor import codec
+
+    data = codec.dumps(rendered)
+
+    >> codec.loads(data) == rendered
+    True
+
+    # Decode just one top level key, without decoding the rest:
+    >> codec.load_key(data, 'timeout')
+    42
+
+:py:func:`load_key` finds the key by a binary search of the top level dict's
+index and decodes only its value and the strings that uses. Its cost grows
+with the size of that value rather than the size of the whole.
+
+The values encoded can be None, True, False, ints, longs, floats, byte and
+unicode strings, lists, tuples and dicts of these. Tuples and the two string
+types come back as they went in. Anything else raises CodecError.
+
+Being pure Python, encoding or decoding a whole value takes several times as
+long as json or cPickle. The codec pays where only some top level keys are
+read back, as the boaconstructor command does from its cache: each render is
+a top level key and a run decodes only those asked for, with
+:py:func:`load_keys`.
+
+The render daemon sends JSON instead. Its responses are already cut down to
+the keys asked for and are each read in full, which json.loads does quicker.
+
+The layout, all numbers big endian:
+
+  * 'BOA' and a format version byte.
+
+  * The number of strings, n, and n + 1 offsets to where each starts, and the
+    last ends, in the string data after them.
+
+  * The string data. Each string is a kind byte, 'u' for unicode as UTF-8 or
+    's' for a byte string, and its bytes.
+
+  * The value. Each value starts with a tag byte. A top level dict with only
+    string keys is indexed: a count then, sorted by the key's bytes, each
+    key's string index and the offset of its value from the start of the
+    dict.
+
+.. autofunction:: dumps
+
+.. autofunction:: loads
+
+.. autofunction:: load_key
+
+.. autofunction:: load_keys
+
+.. autoclass:: CodecError
+
+"""
+__all__ = ['dumps', 'loads', 'load_key', 'load_keys', 'CodecError']
+
+import struct
+import types
+
+
+MAGIC = 'BOA\x01'
+
+_COUNT = struct.Struct('>I')
+_TAGGED_COUNT = struct.Struct('>cI')
+_INT = struct.Struct('>cq')
+_FLOAT = struct.Struct('>cd')
+_ENTRY = struct.Struct('>II')
+
+_INT_MIN = -2 ** 63
+_INT_MAX = 2 ** 63 - 1
+
+
+class CodecError(ValueError):
+    """Raised for values which can't be encoded and data which can't be
+    decoded.
+    """
+
+
+class _Encoder(object):
+    """Builds the string table and the encoded value."""
+
+    def __init__(self):
+        # The encoded reference to each string. The byte and unicode strings
+        # are kept apart, as 'a' == u'a':
+        self.byte_strings = {}
+        self.unicode_strings = {}
+        self.table = []
+
+
+    def string(self, value):
+        """Return the encoded reference to the string, adding it to the
+        table if it's new.
+        """
+        if type(value) == types.UnicodeType:
+            found = self.unicode_strings.get(value)
+            if found is None:
+                found = self.unicode_strings[value] = _TAGGED_COUNT.pack('S', len(self.table))
+                self.table.append('u' + value.encode('utf-8'))
+
+        else:
+            found = self.byte_strings.get(value)
+            if found is None:
+                found = self.byte_strings[value] = _TAGGED_COUNT.pack('S', len(self.table))
+                self.table.append('s' + value)
+
+        return found
+
+
+    def encode(self, value, parts):
+        """Append the encoded parts of the value to the list."""
+        kind = type(value)
+        if kind == types.UnicodeType:
+            found = self.unicode_strings.get(value)
+            parts.append(found if found is not None else self.string(value))
+
+        elif kind == types.StringType:
+            found = self.byte_strings.get(value)
+            parts.append(found if found is not None else self.string(value))
+
+        elif kind == types.DictType:
+            parts.append(_TAGGED_COUNT.pack('D', len(value)))
+            encode = self.encode
+            for key, item in value.iteritems():
+                encode(key, parts)
+                encode(item, parts)
+
+        elif kind == types.ListType or kind == types.TupleType:
+            parts.append(_TAGGED_COUNT.pack('L' if kind == types.ListType else 'T', len(value)))
+            encode = self.encode
+            for item in value:
+                encode(item, parts)
+
+        elif value is None:
+            parts.append('N')
+
+        elif value is True:
+            parts.append('Y')
+
+        elif value is False:
+            parts.append('F')
+
+        elif kind in (types.IntType, types.LongType) and _INT_MIN <= value <= _INT_MAX:
+            parts.append(_INT.pack('i' if kind == types.IntType else 'l', value))
+
+        elif kind in (types.IntType, types.LongType):
+            # Too big for 8 bytes, kept as its digits:
+            parts.append('B' + self.string(str(value))[1:])
+
+        elif kind == types.FloatType:
+            parts.append(_FLOAT.pack('d', value))
+
+        else:
+            raise CodecError("Values of type '%s' can't be encoded!" % kind.__name__)
+
+
+    def indexed(self, value):
+        """Return the parts of a top level dict with an index of its keys."""
+        entries = []
+        for key, item in value.items():
+            index = _COUNT.unpack(self.string(key)[1:])[0]
+            entries.append((self.table[index][1:], index, item))
+        entries.sort()
+
+        values = []
+        offsets = []
+        offset = _COUNT.size + 1 + _ENTRY.size * len(entries)
+        for name, index, item in entries:
+            offsets.append(offset)
+            parts = []
+            self.encode(item, parts)
+            encoded = ''.join(parts)
+            values.append(encoded)
+            offset += len(encoded)
+
+        parts = [_TAGGED_COUNT.pack('M', len(entries))]
+        for (name, index, item), offset in zip(entries, offsets):
+            parts.append(_ENTRY.pack(index, offset))
+        parts.extend(values)
+        return parts
+
+
+def dumps(value):
+    """Return the encoded form of the value as a byte string."""
+    encoder = _Encoder()
+    if type(value) == types.DictType and not [
+        key for key in value if type(key) not in types.StringTypes
+    ]:
+        parts = encoder.indexed(value)
+    else:
+        parts = []
+        encoder.encode(value, parts)
+
+    table = encoder.table
+    header = [MAGIC, _COUNT.pack(len(table))]
+    offset = 0
+    for string in table:
+        header.append(_COUNT.pack(offset))
+        offset += len(string)
+    header.append(_COUNT.pack(offset))
+
+    return ''.join(header + table + parts)
+
+
+class _Strings(object):
+    """The string table of encoded data, each string decoded when first
+    asked for.
+    """
+    def __init__(self, data):
+        if data[:4] != MAGIC:
+            raise CodecError("The data isn't in a format this can decode!")
+        self.data = data
+        self.count = _COUNT.unpack_from(data, 4)[0]
+        # The offsets are only read as each string is asked for:
+        self.start = 8 + 4 * (self.count + 1)
+        self.value_start = self.start + _COUNT.unpack_from(data, 8 + 4 * self.count)[0]
+        self.found = {}
+
+
+    def raw(self, index):
+        """Return the kind and bytes of a string without decoding it."""
+        start, end = _ENTRY.unpack_from(self.data, 8 + 4 * index)
+        start += self.start
+        return self.data[start], self.data[start + 1:self.start + end]
+
+
+    def __getitem__(self, index):
+        found = self.found.get(index)
+        if found is None:
+            kind, raw = self.raw(index)
+            found = self.found[index] = raw.decode('utf-8') if kind == 'u' else raw
+        return found
+
+
+    def all(self):
+        """Return every string, in a list."""
+        returned = []
+        data = self.data
+        start = self.start
+        offsets = struct.unpack_from('>%dI' % (self.count + 1), data, 8)
+        for index in range(self.count):
+            string = data[start + offsets[index] + 1:start + offsets[index + 1]]
+            if data[start + offsets[index]] == 'u':
+                string = string.decode('utf-8')
+            returned.append(string)
+        return returned
+
+
+def _decode(data, position, strings, _unpack_count=_COUNT.unpack_from):
+    """Return (value, position after it) for the value at position."""
+    tag = data[position]
+    if tag == 'S':
+        return strings[_unpack_count(data, position + 1)[0]], position + 5
+
+    elif tag == 'i' or tag == 'l':
+        value = _INT.unpack_from(data, position)[1]
+        if tag == 'l':
+            value = long(value)
+        return value, position + 9
+
+    elif tag == 'D':
+        count = _unpack_count(data, position + 1)[0]
+        position += 5
+        returned = {}
+        for index in xrange(count):
+            # Strings are by far the most common, so are read here:
+            if data[position] == 'S':
+                key = strings[_unpack_count(data, position + 1)[0]]
+                position += 5
+            else:
+                key, position = _decode(data, position, strings)
+
+            if data[position] == 'S':
+                returned[key] = strings[_unpack_count(data, position + 1)[0]]
+                position += 5
+            else:
+                returned[key], position = _decode(data, position, strings)
+        return returned, position
+
+    elif tag == 'L' or tag == 'T':
+        count = _COUNT.unpack_from(data, position + 1)[0]
+        position += 5
+        returned = []
+        append = returned.append
+        for index in xrange(count):
+            value, position = _decode(data, position, strings)
+            append(value)
+        if tag == 'T':
+            returned = tuple(returned)
+        return returned, position
+
+    elif tag == 'N':
+        return None, position + 1
+
+    elif tag == 'Y':
+        return True, position + 1
+
+    elif tag == 'F':
+        return False, position + 1
+
+    elif tag == 'd':
+        return _FLOAT.unpack_from(data, position)[1], position + 9
+
+    elif tag == 'B':
+        return long(strings[_COUNT.unpack_from(data, position + 1)[0]]), position + 5
+
+    elif tag == 'M':
+        count = _COUNT.unpack_from(data, position + 1)[0]
+        entries = struct.unpack_from('>%dI' % (count * 2), data, position + 5)
+        position += 5 + _ENTRY.size * count
+        returned = {}
+        for index in xrange(count):
+            returned[strings[entries[index * 2]]], position = _decode(data, position, strings)
+        return returned, position
+
+    raise CodecError("Unknown tag '%r' at %d!" % (tag, position))
+
+
+def loads(data):
+    """Return the value the data from :py:func:`dumps` holds."""
+    strings = _Strings(data)
+    try:
+        return _decode(data, strings.value_start, strings.all())[0]
+
+    except (IndexError, struct.error) as error:
+        raise CodecError("The data is cut short or damaged: %s" % error)
+
+
+def _find(data, strings, key):
+    """Return the position of the top level key's value, or None."""
+    position = strings.value_start
+    if data[position] != 'M':
+        raise CodecError("The data doesn't hold a dict with string keys!")
+
+    wanted = key
+    if type(key) == types.UnicodeType:
+        wanted = key.encode('utf-8')
+
+    count = _COUNT.unpack_from(data, position + 1)[0]
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        index, offset = _ENTRY.unpack_from(data, position + 5 + _ENTRY.size * middle)
+        found = strings.raw(index)[1]
+        if found < wanted:
+            low = middle + 1
+        elif found > wanted:
+            high = middle
+        else:
+            return position + offset
+
+    return None
+
+
+def load_key(data, key, default=KeyError):
+    """Return the value of one top level key without decoding the rest.
+
+    :param data: the result of dumps() for a dict with string keys.
+
+    :param key: the key wanted.
+
+    :param default: what to return if the key isn't present, by default
+    KeyError is raised.
+
+    """
+    strings = _Strings(data)
+    position = _find(data, strings, key)
+    if position is not None:
+        return _decode(data, position, strings)[0]
+
+    if default is KeyError:
+        raise KeyError(key)
+    return default
+
+
+def load_keys(data, keys):
+    """Return a dict of the values of some top level keys, without decoding
+    the rest. Keys which aren't present are left out.
+
+    The strings the values share are only decoded once, which makes this
+    quicker than a load_key call for each.
+
+    """
+    strings = _Strings(data)
+    returned = {}
+    for key in keys:
+        position = _find(data, strings, key)
+        if position is not None:
+            returned[key] = _decode(data, position, strings)[0]
+    return returned
@@ -11,8 +11,11 @@
 __all__ = ['TemplateError', 'Template']
 
 import types
+import thread
 
 from boaconstructor import utils
+from boaconstructor import provenance
+from boaconstructor import fingerprint
 
 
 
@@ -21,6 +24,10 @@ class TemplateError(Exception):
     """Raised for problems render or otherwise processing templates."""
 
 
+# The default for _publish's digest, keep the digest if the content is kept:
+_KEEP = object()
+
+
 class Template(object):
     """Template represents a dict which may or may not refer to data from
     other dicts.
@@ -77,8 +84,34 @@ class Template(object):
       * In host2.render(...) above the reference 'host' was used as an alias to
         'host1'.
 
+      * The version goes up every time the content, references or extends
+        are changed. If the content dict is changed in place then call
+        changed() so anything kept from earlier renders isn't reused.
+
+      * The references dict is copied when given. The references attribute
+        can't be changed in place, TypeError is raised, assign a new dict
+        instead.
+
+    Thread safety:
+
+      * A template can be rendered from many threads while others change it.
+        The content, references and the compiled (flattened) references are
+        held in an immutable snapshot. Each render reads the current snapshot
+        once and uses it throughout, without taking a lock.
+
+      * Writers use set(), update(), remove() or assign content, references or
+        extends. These work on a copy and swap in a new snapshot in one step,
+        so a render sees either all of a change or none of it.
+
+      * Changing the content dict in place is not thread safe.
+
+      * The snapshot of every template a render can reach is taken when it
+        starts, so each is seen at one version throughout the render. Renders
+        given keys read the current snapshot at each hop instead, so a
+        template reached twice may be seen at two versions.
+
     """
-    def __init__(self, name, content, references={}):
+    def __init__(self, name, content, references=None, extends=None, schema=None):
         """
         :param name: the string name used to identify this template
         if references.
@@ -90,15 +123,200 @@ class Template(object):
         mappings. This is used to resolve references to other
         templates.
 
+        :param extends: an optional Template this one inherits from.
+
+        When rendered the keys from the template extended, and any it extends
+        in turn, are added to ours. Ours win over theirs, theirs win over any
+        extendwith. Each extended template is rendered using its own references
+        and those given at render time. The result is kept and reused by every
+        template extending it, until the template or something it used changes.
+        Plain dicts and objects it used are assumed not to change, call
+        changed() on it if they do. Inherited keys are only added to the render,
+        they can't be referred to like the template's own content.
+
+        :param schema: an optional :py:class:`boaconstructor.schema.Schema`,
+        or the dict to make one from, every render must meet.
+
         """
         self.name = name
+        if references is None:
+            references = {}
         if type(content) != types.DictType:
             raise TemplateError("The content given is not a Dict!")
-        self.content = content
-        self.references = references
 
+        # Held by writers while they work out the next snapshot:
+        self._lock = thread.allocate_lock()
+        self._snapshot = _Snapshot(content, _References(references), 0)
+        self._extends = extends
+        self._inherited = None
+        self._output = None
+        self._schema = None
+        # (snapshot, schema, plan) for the last content checked:
+        self._plan = None
+        if schema is not None:
+            self.schema = schema
+
+
+    def snapshot(self):
+        """Return the current immutable snapshot of the content and references.
+
+        Everything a render needs from the template is taken from a single
+        snapshot, recovered without taking any lock.
+
+        """
+        return self._snapshot
+
+
+    def _publish(self, content=None, references=None, digest=_KEEP):
+        """Swap in a new snapshot, call with the writer lock held.
+
+        The content digest is worked out again when next needed, unless the
+        new one is given or the content is unchanged.
+
+        """
+        current = self._snapshot
+        if content is None:
+            content = current.content
+            if digest is _KEEP:
+                digest = current._digest
+        elif digest is _KEEP:
+            digest = None
+        if references is None:
+            references = current.references
+        elif type(references) is not _References:
+            references = _References(references)
+        self._snapshot = _Snapshot(
+            content, references, current.version + 1, digest
+        )
+
+
+    def _get_version(self):
+        return self._snapshot.version
+
+    version = property(_get_version)
+
+
+    def _get_content(self):
+        return self._snapshot.content
+
+    def _set_content(self, content):
+        if type(content) != types.DictType:
+            raise TemplateError("The content given is not a Dict!")
+        self._lock.acquire()
+        try:
+            self._publish(content=content)
+
+        finally:
+            self._lock.release()
+
+    content = property(_get_content, _set_content)
+
+
+    def _get_references(self):
+        return self._snapshot.references
+
+    def _set_references(self, references):
+        self._lock.acquire()
+        try:
+            self._publish(references=references)
+            _references_changed()
+
+        finally:
+            self._lock.release()
+
+    references = property(_get_references, _set_references)
+
+
+    def _get_extends(self):
+        return self._extends
+
+    def _set_extends(self, extends):
+        self._lock.acquire()
+        try:
+            self._extends = extends
+            self._publish()
+
+        finally:
+            self._lock.release()
+
+    extends = property(_get_extends, _set_extends)
+
+
+    def _get_schema(self):
+        return self._schema
 
-    def render(self, references={}, extendwith={}):
+    def _set_schema(self, schema):
+        if schema is not None:
+            from boaconstructor.schema import Schema
+            if not isinstance(schema, Schema):
+                schema = Schema(schema)
+        self._schema = schema
+
+    schema = property(_get_schema, _set_schema)
+
+
+    def changed(self):
+        """Note the content dict, or dicts and objects it refers to, were
+        changed in place.
+
+        This increases the version and stops anything kept from earlier
+        renders being reused.
+
+        """
+        self._lock.acquire()
+        try:
+            self._publish(digest=None)
+            _references_changed()
+
+        finally:
+            self._lock.release()
+
+
+    def set(self, key, value):
+        """Set a content key to the value."""
+        self._lock.acquire()
+        try:
+            current = self._snapshot
+            content = dict(current.content)
+            digest = _update_digest(current, content, {key: value})
+            content[key] = value
+            self._publish(content=content, digest=digest)
+
+        finally:
+            self._lock.release()
+
+
+    def update(self, content):
+        """Update the content keys from the given dict."""
+        self._lock.acquire()
+        try:
+            current = self._snapshot
+            updated = dict(current.content)
+            digest = _update_digest(current, updated, content)
+            updated.update(content)
+            self._publish(content=updated, digest=digest)
+
+        finally:
+            self._lock.release()
+
+
+    def remove(self, key):
+        """Remove a key from the content. KeyError is raised if it isn't present."""
+        self._lock.acquire()
+        try:
+            current = self._snapshot
+            content = dict(current.content)
+            value = content.pop(key)
+            digest = current._digest
+            if digest is not None:
+                digest ^= fingerprint.item_digest(key, value)
+            self._publish(content=content, digest=digest)
+
+        finally:
+            self._lock.release()
+
+
+    def render(self, references=None, extendwith=None, instrument=None, trace=False, keys=None, interner=None):
         """Generate a data dict from this template and any it references.
 
         :param references: this is a dict of string to template mappings.
@@ -113,23 +331,355 @@ class Template(object):
         any common keys in the rendered extendwith.
 
 
+        :param instrument: an optional :py:class:`boaconstructor.instrument.Instrument`.
+
+        If given the time taken, hop counts and cache statistics are recorded
+        in it under this template's name.
+
+        :param trace: If True record which references supplied each value.
+
+        This is recorded in the same pass as the render. See
+        :py:mod:`boaconstructor.provenance` for the map returned.
+
+        :param keys: If given only render these keys.
+
+        Only the keys asked for, and the references they lead to, are looked
+        at so the cost depends on the keys rather than the template size. The
+        template's own references are flattened once and kept, as for a full
+        render. Those given at render time are flattened, all of them, if a
+        key looks one up.
+
+        :param interner: If True, or an Interner, the rendered values are
+        shared with those of other renders and can't be changed.
+
+        See :py:mod:`boaconstructor.interning`.
+
+        If the template has a schema the render is checked against it and
+        :py:class:`boaconstructor.schema.SchemaError` raised if it doesn't
+        match.
+
+
         :returns: This returns a 'rendered' dict.
 
         All references  will have been replaced with the value the point at.
 
+        If trace is True then (rendered dict, provenance map) is returned.
+
+        """
+        if references is None:
+            references = {}
+        if extendwith is None:
+            extendwith = {}
+        return self._render(references, extendwith, instrument, trace, keys, interner)
+
+
+    def _render(self, references, extendwith, instrument=None, trace=False, keys=None, interner=None, reference_cache=None, snapshot=None):
+        """The work behind :py:meth:`render`.
+
+        :param reference_cache: what utils.render is to resolve this
+        template's content with, rather than building it from the
+        references. The templates extended are still rendered with the
+        references.
+
+        :param snapshot: the snapshot to render, by default the current one.
+
         """
-        return utils.render(
-            self.content.items(),
-            int_refs=self.references,
+        if snapshot is None:
+            snapshot = self._snapshot
+        content = snapshot.content
+        int_cache = snapshot.flattened()
+        if keys is None:
+            items = content.items()
+        else:
+            items = [(key, content[key]) for key in keys if key in content]
+
+        extends = self._extends
+        if extends is None:
+            returned = utils.render(
+                items,
+                int_refs=snapshot.references,
+                ext_refs=references,
+                extendwith=extendwith,
+                instrument=instrument,
+                name=self.name,
+                trace=trace,
+                keys=keys,
+                int_cache=int_cache,
+                interner=interner,
+                reference_cache=reference_cache,
+            )
+            if self._schema is not None:
+                self.check(returned[0] if trace else returned, keys, snapshot)
+            return returned
+
+        base = extends._inherit(references, instrument)
+
+        tracer = None
+        if trace:
+            tracer = provenance.Trace()
+
+        returned = utils.render(
+            items,
+            int_refs=snapshot.references,
             ext_refs=references,
             extendwith=extendwith,
+            instrument=instrument,
+            name=self.name,
+            trace=tracer,
+            keys=keys,
+            int_cache=int_cache,
+            reference_cache=reference_cache,
         )
+        if tracer:
+            returned, found = returned
+
+        wanted = base.rendered
+        if keys is not None:
+            wanted = dict([(key, wanted[key]) for key in keys if key in wanted])
+        inherited = set([key for key in wanted if key not in content])
+        for key in inherited:
+            returned[key] = _copied(wanted[key])
+
+        if interner:
+            from boaconstructor import interning
+            interning.get_interner(interner).intern_values(returned)
+
+        if tracer:
+            # Drop the provenance of any extendwith keys inherited over:
+            for path, top in tracer.tops.items():
+                if top in inherited:
+                    del found[path]
+            for path, chain in base.provenance.items():
+                if base.tops[path] in inherited:
+                    found[path] = chain
+            returned = (returned, found)
+
+        if self._schema is not None:
+            self.check(returned[0] if trace else returned, keys, snapshot)
+
+        return returned
+
+
+    def iter_render(self, references=None, extendwith=None, keys=None):
+        """Render a key at a time as the results are read, see
+        :py:func:`boaconstructor.utils.iter_render`.
+
+        The arguments are as for :py:meth:`render`. Only the keys read are
+        worked out, so :py:class:`boaconstructor.utils.Lazy` values of keys
+        not reached are never called. Keys this template gives come first,
+        then those inherited from the templates it extends and then those
+        from extendwith.
+
+        The schema, if there is one, isn't checked.
+
+        :returns: a generator of (key, rendered value) pairs.
+
+        """
+        if references is None:
+            references = {}
+
+        snapshot = self._snapshot
+        content = snapshot.content
+        if keys is None:
+            items = content.items()
+        else:
+            items = [(key, content[key]) for key in keys if key in content]
+
+        extends = self._extends
+        if extends is None:
+            for item in utils.iter_render(items, snapshot.references, references, extendwith, keys):
+                yield item
+            return
+
+        for item in utils.iter_render(items, snapshot.references, references):
+            yield item
+
+        for key, value in extends.iter_render(references, extendwith, keys):
+            if key not in content:
+                yield key, value
+
+
+    def check(self, rendered, keys=None, snapshot=None):
+        """Raise SchemaError if a render of this template doesn't meet its
+        schema.
+
+        :param rendered: the rendered dict.
+
+        :param keys: the keys rendered, if only some were.
+
+        :param snapshot: the snapshot rendered, by default the current one.
+
+        Only values which come from references are checked. Those from the
+        content are checked once per change of content. Nothing is done if
+        the template has no schema.
+
+        """
+        schema = self._schema
+        if schema is None:
+            return
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        plan = self._plan
+        if plan is None or plan[0] is not snapshot or plan[1] is not schema:
+            plan = self._plan = (snapshot, schema, schema.plan(snapshot.content))
+
+        problems = plan[2].check(rendered, keys)
+        if problems:
+            from boaconstructor.schema import SchemaError
+            raise SchemaError(self.name, problems)
+
+
+    def _inherit(self, references, instrument=None):
+        """Return the merged render of this template and those it extends.
+
+        The one kept from an earlier render is returned if nothing it used has
+        changed, otherwise it is worked out again.
+
+        """
+        parent = None
+        extends = self._extends
+        if extends is not None:
+            parent = extends._inherit(references, instrument)
+
+        inherited = self._inherited
+        if inherited is not None and inherited.valid(self, parent, references):
+            if instrument is not None:
+                instrument.count(self.name, 'cache_hits')
+            return inherited
+
+        if instrument is not None:
+            instrument.count(self.name, 'cache_misses')
+
+        snapshot = self._snapshot
+        tracer = provenance.Trace()
+        rendered, found = utils.render(
+            snapshot.content.items(),
+            int_refs=snapshot.references,
+            ext_refs=references,
+            instrument=instrument,
+            name=self.name,
+            trace=tracer,
+            int_cache=snapshot.flattened(),
+        )
+
+        inherited = self._inherited = _Inherited(
+            snapshot, parent, references, rendered, tracer
+        )
+        return inherited
+
+
+    def render_async(self, providers, references=None, extendwith=None):
+        """Render in the background with references supplied by providers.
+
+        The provider lookups needed are made concurrently. See
+        :py:mod:`boaconstructor.asyncrender` for details.
+
+        :param providers: a ProviderPool or a dict of reference name to provider.
+
+        :returns: a Pending, call its get() for the rendered dict.
+
+        """
+        from boaconstructor import asyncrender
+
+        if references is None:
+            references = {}
+        if extendwith is None:
+            extendwith = {}
+        return asyncrender.render_async(self, providers, references, extendwith)
+
+
+    def digest(self):
+        """Return the content digest as an int, see :py:meth:`fingerprint`."""
+        return self._snapshot.digest()
+
+
+    def fingerprint(self):
+        """Return a fingerprint string which changes when the content does.
+
+        See :py:mod:`boaconstructor.fingerprint`.
+
+        """
+        return self._snapshot.fingerprint()
+
+
+    def output_fingerprint(self, references=None, extendwith=None):
+        """Return a fingerprint string which changes when the output of
+        render(references, extendwith) could have.
+
+        The fingerprints of what the last render used are checked and the
+        template is only rendered when one of these has changed. See
+        :py:mod:`boaconstructor.fingerprint`.
+
+        """
+        if references is None:
+            references = {}
+        if extendwith is None:
+            extendwith = {}
+
+        output = self._output
+        if output is not None:
+            digest = self._output_digest(output.names, references, extendwith)
+            if digest == output.digest:
+                return fingerprint.as_hex(digest)
+
+        rendered, found = self.render(references, extendwith, trace=True)
+        names = set()
+        for chain in found.values():
+            names.update([name for name, attribute in chain])
+
+        digest = self._output_digest(names, references, extendwith)
+        if digest is None:
+            # Something used can't be fingerprinted, use the output itself.
+            self._output = None
+            return fingerprint.as_hex(fingerprint.content_digest(rendered))
+
+        self._output = _Output(names, digest)
+        return fingerprint.as_hex(digest)
+
+
+    def _output_digest(self, names, references, extendwith):
+        """Combine the digests of the template and the references used.
+
+        :returns: the digest or None if a reference can't be fingerprinted.
+
+        """
+        snapshot = self._snapshot
+        if snapshot.lazy():
+            # What a Lazy will give isn't known without calling it.
+            return None
+        found = utils.build_ref_cache(snapshot.references, references, lazy=True)
+
+        parts = ["self:%x" % snapshot.digest()]
+        sources = [('extendwith', extendwith)]
+        for name in sorted(names):
+            # Either can supply an attribute, the external one first:
+            sources.append(('ext:%s' % name, found['ext'].get(name)))
+            sources.append(('int:%s' % name, found['int'].get(name)))
+
+        for label, source in sources:
+            if source is None:
+                parts.append("%s:-" % label)
+                continue
+            if _lazy_source(source):
+                return None
+            digest = fingerprint.source_digest(source)
+            if digest is None:
+                return None
+            parts.append("%s:%x" % (label, digest))
+
+        if self._extends is not None:
+            parts.append(
+                "extends:%s" % self._extends.output_fingerprint(references)
+            )
+
+        return fingerprint.item_digest('output', "\n".join(parts))
 
 
     def items(self):
         """Used in an all-inclusion render to return our contained content dict.
         """
-        return self.content.items()
+        return self._snapshot.content.items()
 
 
     def __str__(self):
@@ -142,3 +692,225 @@ class Template(object):
         """Show the template name and content we hold.
         """
         return "'Template <%s>: %s'" % (self.name, self.content)
+
+
+def _update_digest(snapshot, content, changes):
+    """Return the snapshot's content digest with the changes applied, or None
+    if it isn't known yet.
+    """
+    digest = snapshot._digest
+    if digest is not None:
+        for key, value in changes.items():
+            if key in content:
+                digest ^= fingerprint.item_digest(key, content[key])
+            digest ^= fingerprint.item_digest(key, value)
+    return digest
+
+
+# This goes up whenever any template's references change, so the flattened
+# references kept in snapshots are known to be out of date.
+_generation = [0]
+_generation_lock = thread.allocate_lock()
+
+
+def _references_changed():
+    _generation_lock.acquire()
+    try:
+        _generation[0] += 1
+
+    finally:
+        _generation_lock.release()
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(
+        "A template's references can't be changed in place, assign them instead!"
+    )
+
+
+class _References(dict):
+    """A template's references, which can't be changed once made.
+
+    The flattened references are kept in the snapshot, so changing the dict
+    in place would go unseen.
+
+    """
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (_References, (dict(self),))
+
+
+class _Snapshot(object):
+    """The content and references of a template at one version.
+
+    These are never changed once made. The flattened references are worked
+    out on first use and kept, along with the references generation they are
+    good for, as one tuple so readers always see a matching pair.
+
+    """
+    __slots__ = ('content', 'references', 'version', '_flattened', '_digest', '_lazy')
+
+    def __init__(self, content, references, version, digest=None):
+        self.content = content
+        self.references = references
+        self.version = version
+        self._flattened = (-1, None)
+        self._digest = digest
+        self._lazy = None
+
+
+    def digest(self):
+        """Return the content digest, see :py:mod:`boaconstructor.fingerprint`.
+        """
+        digest = self._digest
+        if digest is None:
+            digest = self._digest = fingerprint.content_digest(self.content)
+        return digest
+
+
+    def fingerprint(self):
+        """Return the content fingerprint string."""
+        return fingerprint.as_hex(self.digest())
+
+
+    def lazy(self):
+        """True if the content holds a :py:class:`boaconstructor.utils.Lazy`."""
+        lazy = self._lazy
+        if lazy is None:
+            lazy = self._lazy = _holds_lazy(self.content)
+        return lazy
+
+
+    def items(self):
+        """Used in an all-inclusion render, as for Template.items()."""
+        return self.content.items()
+
+
+    def flattened(self):
+        """Return the references flattened as build_ref_cache does."""
+        generation, flattened = self._flattened
+        current = _generation[0]
+        if generation != current:
+            flattened = utils.build_ref_cache(self.references, {})['int']
+            self._flattened = (current, flattened)
+        return flattened
+
+
+class _Output(object):
+    """The references used by the last render for output_fingerprint, and
+    the digest they gave.
+    """
+    def __init__(self, names, digest):
+        self.names = names
+        self.digest = digest
+
+
+def _version(source):
+    """The version of a Template, or None for other references."""
+    return getattr(source, 'version', None)
+
+
+def _holds_lazy(value):
+    """True if the value is a utils.Lazy or a dict, list or tuple holding one.
+    """
+    if type(value) is utils.Lazy:
+        return True
+    if isinstance(value, dict):
+        value = value.values()
+    elif type(value) not in (types.ListType, types.TupleType):
+        return False
+    for item in value:
+        if _holds_lazy(item):
+            return True
+    return False
+
+
+def _lazy_source(source):
+    """True if the values of a reference source hold a utils.Lazy."""
+    snapshot = getattr(source, '_snapshot', source)
+    if type(snapshot) is _Snapshot:
+        return snapshot.lazy()
+    if isinstance(source, dict):
+        return _holds_lazy(source)
+    return _holds_lazy(getattr(source, '__dict__', None))
+
+
+def _copied(value):
+    """A copy of the lists and dicts in an inherited value.
+
+    The render of a template extended is kept and given to every template
+    extending it, so each is given its own copy to change.
+
+    """
+    kind = type(value)
+    if kind == types.DictType:
+        return dict([(key, _copied(item)) for key, item in value.items()])
+    if kind == types.ListType:
+        return [_copied(item) for item in value]
+    return value
+
+
+class _Inherited(object):
+    """The render of a template merged with the renders of those it extends.
+
+    The references the template's render used are noted, with the version of
+    each, so valid() can tell if it can be reused.
+
+    """
+    def __init__(self, snapshot, parent, references, rendered, tracer):
+        self.version = snapshot.version
+        self.parent = parent
+
+        self.rendered = rendered
+        self.provenance = tracer.provenance
+        self.tops = tracer.tops
+        if parent is not None:
+            self.rendered = dict(parent.rendered)
+            self.rendered.update(rendered)
+            self.provenance = dict(tracer.provenance)
+            self.tops = dict(tracer.tops)
+            for path, chain in parent.provenance.items():
+                top = parent.tops[path]
+                if top not in rendered:
+                    self.provenance[path] = chain
+                    self.tops[path] = top
+
+        names = set()
+        for used in tracer.dependencies.values():
+            names.update(used)
+
+        self.sources = []
+        self.volatile = False
+        found = utils.build_ref_cache(snapshot.references, references, lazy=True)
+        for name in names:
+            ext_source = found['ext'].get(name)
+            int_source = found['int'].get(name)
+            self.sources.append((
+                name,
+                ext_source, _version(ext_source),
+                int_source, _version(int_source),
+            ))
+            if hasattr(ext_source, 'get_many') or hasattr(int_source, 'get_many'):
+                # Provider values can change at any time.
+                self.volatile = True
+
+
+    def valid(self, template, parent, references):
+        """Return True if nothing used in working this out has changed."""
+        snapshot = template.snapshot()
+        if self.volatile or self.version != snapshot.version or self.parent is not parent:
+            return False
+
+        if self.sources:
+            found = utils.build_ref_cache(snapshot.references, references, lazy=True)
+            for name, ext_source, ext_version, int_source, int_version in self.sources:
+                source = found['ext'].get(name)
+                if source is not ext_source or _version(source) != ext_version:
+                    return False
+                source = found['int'].get(name)
+                if source is not int_source or _version(source) != int_version:
+                    return False
+
+        return True
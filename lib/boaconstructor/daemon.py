@@ -0,0 +1,359 @@
+"""
+.. module::`daemon`
+    :platform: Unix
+    :synopsis: Serve renders of a template directory over a Unix socket.
+
+Rather than every process on a machine loading and rendering the same
+templates, one :py:class:`RenderServer` loads the directory and serves
+renders over a Unix domain socket. Processes ask it with a
+:py:class:`RenderClient`:
+
+.. code-block:: python
+
+    from boaconstructor.daemon import RenderServer
+
+    server = RenderServer('/var/run/boaconstructor.sock', 'conf/')
+    server.serve_forever()
+
+    # In each process:
+    from boaconstructor.daemon import RenderClient
+
+    client = RenderClient('/var/run/boaconstructor.sock')
+
+    >> client.render('host1', keys=['timeout'])
+    {u'timeout': 42}
+
+    >> client.render_many(['host1', ('host2', ['port'])])
+    [{u'host': u'1.2.3.4', u'timeout': 42}, {u'port': 8080}]
+
+The templates are held in a
+:py:class:`boaconstructor.directory.TemplateDirectory`, so each is loaded and
+its references flattened once. Renders are kept along with their encoded
+responses, both reused until a template they used changes. At most
+'max_responses' are kept, those least recently asked for are forgotten
+first, in a :py:class:`boaconstructor.cache.Cache` registered as
+'daemon_responses' for :py:func:`boaconstructor.cache.configure` and
+:py:func:`boaconstructor.cache.stats`. Only the latest RenderServer made is
+registered under the name. The directory is looked at for changed files at
+most once every 'interval' seconds, as requests come in, and only the
+changed files are loaded again.
+
+The client keeps a pool of connections which threads share. render_many()
+sends all of its requests before reading any of the responses, so only one
+round trip is waited for.
+
+Each request and response is a frame of a 4 byte request id, a 4 byte length
+and then the JSON encoded body. The server answers the requests on a
+connection in the order they are sent. JSON is used rather than
+:py:mod:`boaconstructor.codec` as each response is read in full, which
+json.loads does quicker.
+
+Errors rendering are raised by the client as the same exception: a
+ReferenceError or AttributeError from :py:mod:`boaconstructor.utils`, or a
+TemplateError for anything else.
+
+.. autoclass:: RenderServer
+    :members:
+
+.. autoclass:: RenderClient
+    :members:
+
+"""
+__all__ = ['RenderServer', 'RenderClient']
+
+import os
+import json
+import time
+import socket
+import struct
+import threading
+import SocketServer
+
+from boaconstructor import core
+from boaconstructor import cache
+from boaconstructor import utils
+from boaconstructor import directory
+
+
+# The request id and body length in front of each frame:
+HEADER = struct.Struct('>II')
+
+# The most requests sent ahead of reading responses:
+WINDOW = 64
+
+# The exceptions recreated by the client, by name:
+ERRORS = {
+    'boaconstructor.utils.ReferenceError': utils.ReferenceError,
+    'boaconstructor.utils.AttributeError': utils.AttributeError,
+}
+
+
+def _encode(body):
+    return json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+
+def _read(stream, size):
+    """Read exactly size bytes, or return '' if the stream has ended."""
+    data = stream.read(size)
+    while data and len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise socket.error("The connection closed in the middle of a frame!")
+        data += more
+    return data
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """Answers the requests on one connection until it is closed."""
+
+    def handle(self):
+        respond = self.server.respond
+        while True:
+            header = _read(self.rfile, HEADER.size)
+            if not header:
+                break
+            number, size = HEADER.unpack(header)
+            body = respond(_read(self.rfile, size))
+            self.wfile.write(HEADER.pack(number, len(body)) + body)
+
+
+class RenderServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Serves renders of the templates in a directory, a thread for each
+    connection.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, templates, interval=1.0, max_responses=1000):
+        """
+        :param path: the socket file to listen on. One left by an earlier
+        server is removed.
+
+        :param templates: the template directory, or a TemplateDirectory.
+
+        :param interval: the least seconds between looking for changed
+        files. 0 looks on every request, None never does.
+
+        :param max_responses: the most encoded responses to keep, None for
+        no limit.
+
+        """
+        if not isinstance(templates, directory.TemplateDirectory):
+            templates = directory.TemplateDirectory(templates)
+        self.templates = templates
+        self.interval = interval
+        self._checked = time.time()
+        # (name, keys) -> (rendered, encoded response body)
+        self._responses = cache.register(
+            cache.Cache('daemon_responses', max_entries=max_responses)
+        )
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+
+    def server_close(self):
+        """Stop listening and remove the socket file."""
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def respond(self, request):
+        """Return the encoded response body for an encoded request body."""
+        interval = self.interval
+        if interval is not None and time.time() - self._checked >= interval:
+            self._checked = time.time()
+            self.templates.refresh()
+
+        try:
+            request = json.loads(request)
+            operation = request.get('op')
+            if operation == 'render':
+                return self._render(request['name'], request.get('keys'))
+            elif operation == 'names':
+                return _encode(dict(result=self.templates.names()))
+            raise core.TemplateError("Unknown request '%s'!" % operation)
+
+        except Exception as error:
+            kind = "%s.%s" % (error.__class__.__module__, error.__class__.__name__)
+            return _encode(dict(error=str(error), kind=kind))
+
+
+    def _render(self, name, keys):
+        if keys is not None:
+            keys = tuple(keys)
+        rendered = self.templates.render(name, keys)
+
+        found = self._responses.get((name, keys))
+        if found is not None and found[0] is rendered:
+            return found[1]
+
+        body = _encode(dict(result=rendered))
+        self._responses.put((name, keys), (rendered, body))
+        return body
+
+
+class _Connection(object):
+    """One connection to the server."""
+
+    def __init__(self, path, timeout):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+        self.stream = self.socket.makefile('rb')
+        self.number = 0
+
+
+    def send(self, bodies):
+        """Send the request bodies in one go, returning their ids."""
+        numbers = []
+        frames = []
+        for body in bodies:
+            self.number = (self.number + 1) & 0xffffffff
+            numbers.append(self.number)
+            frames.append(HEADER.pack(self.number, len(body)) + body)
+        self.socket.sendall(b''.join(frames))
+        return numbers
+
+
+    def receive(self, number):
+        """Return the decoded body of the next response, which must be the
+        one for the given request id.
+        """
+        header = _read(self.stream, HEADER.size)
+        if not header:
+            raise socket.error("The server closed the connection!")
+        got, size = HEADER.unpack(header)
+        if got != number:
+            raise socket.error("Response %d came for request %d!" % (got, number))
+        return json.loads(_read(self.stream, size))
+
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+
+class RenderClient(object):
+    """Asks a :py:class:`RenderServer` for renders, over a pool of
+    connections which is safe to share between threads.
+    """
+    def __init__(self, path, connections=4, timeout=None):
+        """
+        :param path: the server's socket file.
+
+        :param connections: the most connections to have open at once.
+        Threads wait for one to be free when all are in use.
+
+        :param timeout: seconds to wait on the socket, None to wait forever.
+
+        """
+        self.path = path
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._free = threading.Semaphore(connections)
+
+
+    def render(self, name, keys=None):
+        """Return the named template rendered by the server.
+
+        :param keys: if given only these keys are rendered.
+
+        """
+        return self.render_many([(name, keys)])[0]
+
+
+    def render_many(self, requests):
+        """Return the renders for a list of requests, in the same order.
+
+        Each request is a template name or a (name, keys) tuple. They are all
+        sent before any response is read. If any fail the error for the first
+        is raised, once all the responses are in.
+
+        """
+        bodies = []
+        for request in requests:
+            if isinstance(request, basestring):
+                request = (request, None)
+            name, keys = request
+            if keys is not None:
+                keys = list(keys)
+            bodies.append(_encode(dict(op='render', name=name, keys=keys)))
+
+        return [self._result(body) for body in self._exchange(bodies)]
+
+
+    def names(self):
+        """Return the sorted names of the templates the server has."""
+        return self._result(self._exchange([_encode(dict(op='names'))])[0])
+
+
+    def close(self):
+        """Close the idle connections."""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, []
+
+        finally:
+            self._lock.release()
+
+        for connection in idle:
+            connection.close()
+
+
+    def _exchange(self, bodies):
+        """Send the request bodies on one connection and return the decoded
+        response bodies.
+        """
+        self._free.acquire()
+        try:
+            self._lock.acquire()
+            try:
+                connection = None
+                if self._idle:
+                    connection = self._idle.pop()
+
+            finally:
+                self._lock.release()
+
+            if connection is None:
+                connection = _Connection(self.path, self.timeout)
+
+            try:
+                # Requests go in batches, the next sent before the responses
+                # to the last are read. The batches are small enough to sit
+                # in the socket's buffer, so neither end waits on the other.
+                responses = []
+                sent = []
+                for start in range(0, len(bodies), WINDOW):
+                    numbers = connection.send(bodies[start:start + WINDOW])
+                    responses.extend([connection.receive(number) for number in sent])
+                    sent = numbers
+                responses.extend([connection.receive(number) for number in sent])
+
+            except:
+                # It is in an unknown state, don't use it again.
+                connection.close()
+                raise
+
+            self._lock.acquire()
+            try:
+                self._idle.append(connection)
+
+            finally:
+                self._lock.release()
+
+        finally:
+            self._free.release()
+
+        return responses
+
+
+    def _result(self, response):
+        if 'error' in response:
+            error = ERRORS.get(response.get('kind'), core.TemplateError)
+            raise error(response['error'])
+        return response['result']
@@ -0,0 +1,304 @@
+"""
+.. module::`directory`
+    :platform: Unix, Windows
+    :synopsis: A directory of JSON template files held in memory.
+
+The boaconstructor command, the render daemon and the watcher all work from
+a directory holding a name.json file per template, the file being the
+template's content. Every template can refer to the others by name.
+
+A :py:class:`TemplateDirectory` loads the files once and keeps the renders
+it has done. :py:meth:`TemplateDirectory.refresh` looks for files which have
+changed, by size and modification time, and only loads those again:
+
+.. code-block:: python
+
+    from boaconstructor.directory import TemplateDirectory
+
+    conf = TemplateDirectory('conf/')
+
+    >> conf.render('host1', keys=['timeout'])
+    {'timeout': 42}
+
+    # Later, after conf/common.json was edited:
+    >> conf.refresh()
+    set(['common'])
+
+Renders are kept with the version of every template they used, and reused
+while these are unchanged. A changed file is loaded into the Template already
+held for it, so only the renders using it are done again. At most
+'max_renders' renders are kept, those least recently used are forgotten
+first. They are kept in a :py:class:`boaconstructor.cache.Cache` registered
+as 'directory_renders', so :py:func:`boaconstructor.cache.configure` and
+:py:func:`boaconstructor.cache.stats` reach it. Only the latest
+TemplateDirectory made is registered under the name.
+
+:py:meth:`TemplateDirectory.dependents` uses what the kept renders used to
+tell which templates changes to some files affect. The
+:py:class:`boaconstructor.watch.Watcher` uses this to render only those again.
+
+.. autoclass:: TemplateDirectory
+    :members:
+
+.. autofunction:: load
+
+.. autofunction:: signature
+
+"""
+__all__ = ['TemplateDirectory', 'load', 'signature']
+
+import os
+import json
+import threading
+
+from boaconstructor import core
+from boaconstructor import cache
+from boaconstructor import provenance
+
+
+# The ending of template file names:
+SUFFIX = '.json'
+
+
+def signature(path):
+    """Return what is compared to tell if a file has changed."""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime)
+
+
+def load(path):
+    """Return the content dict held in a template file.
+
+    TemplateError is raised if it isn't valid JSON or isn't a dict.
+
+    """
+    stream = open(path)
+    try:
+        try:
+            content = json.load(stream)
+
+        except ValueError as error:
+            raise core.TemplateError("The file isn't valid JSON: %s" % error)
+
+    finally:
+        stream.close()
+
+    if not isinstance(content, dict):
+        raise core.TemplateError("The content given is not a Dict!")
+
+    return content
+
+
+class TemplateDirectory(object):
+    """The templates in a directory and the renders done from them.
+
+    :ivar templates: a dict of name to Template. Don't change it, it is
+    replaced as files are added or removed.
+
+    :ivar errors: a dict of name to the problem loading its file.
+
+    """
+    def __init__(self, directory, max_renders=1000):
+        """
+        :param directory: the directory holding the name.json files.
+
+        :param max_renders: the most renders to keep, None for no limit.
+        Each name and set of keys rendered is one.
+
+        """
+        self.directory = directory
+        self.templates = {}
+        self.errors = {}
+        self._signatures = {}
+        # (name, keys) -> ({used name: (Template, version)}, rendered)
+        self._renders = cache.register(
+            cache.Cache('directory_renders', max_entries=max_renders)
+        )
+        # The names of the templates whose last render failed:
+        self._failed = set()
+        # Goes up as a refresh starts and again as it finishes changing
+        # things, so it is odd while templates are being changed:
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+
+    def names(self):
+        """Return the sorted template names."""
+        return sorted(self.templates)
+
+
+    def scan(self):
+        """Return a dict of name to the signature of each template file
+        present now. Nothing is loaded.
+        """
+        signatures = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(SUFFIX):
+                path = os.path.join(self.directory, filename)
+                try:
+                    signatures[filename[:-len(SUFFIX)]] = signature(path)
+
+                except OSError:
+                    # Removed since it was listed.
+                    pass
+
+        return signatures
+
+
+    def refresh(self, signatures=None):
+        """Load the files added or changed since the last refresh and forget
+        those removed.
+
+        :param signatures: what :py:meth:`scan` returned, if it was just
+        called.
+
+        :returns: the set of names added, changed or removed.
+
+        """
+        if signatures is None:
+            signatures = self.scan()
+
+        self._lock.acquire()
+        try:
+            changed = set()
+            for name in set(self._signatures) - set(signatures):
+                changed.add(name)
+            for name, found in signatures.items():
+                if self._signatures.get(name) != found:
+                    changed.add(name)
+
+            if not changed:
+                return changed
+
+            self._generation += 1
+            try:
+                templates = dict(self.templates)
+                for name in changed:
+                    self.errors.pop(name, None)
+                    if name not in signatures:
+                        templates.pop(name, None)
+                        continue
+
+                    try:
+                        content = load(os.path.join(self.directory, name + SUFFIX))
+
+                    except (IOError, core.TemplateError) as error:
+                        self.errors[name] = str(error)
+                        templates.pop(name, None)
+                        continue
+
+                    template = templates.get(name)
+                    if template is None:
+                        templates[name] = core.Template(name, content)
+                    else:
+                        template.content = content
+
+                self._signatures = signatures
+                self.templates = templates
+                for (name, keys), found in self._renders.items():
+                    if name not in templates:
+                        self._renders.pop((name, keys))
+
+            finally:
+                self._generation += 1
+
+            return changed
+
+        finally:
+            self._lock.release()
+
+
+    def render(self, name, keys=None):
+        """Render the named template, or reuse the last render of it if
+        nothing it used has changed.
+
+        Every template in the directory is given as a reference. The dict
+        returned may be returned again, so don't change it.
+
+        """
+        templates = self.templates
+        if keys is not None:
+            keys = tuple(keys)
+
+        found = self._renders.get((name, keys))
+        if found is not None:
+            used, rendered = found
+            for used_name, (template, version) in used.items():
+                if templates.get(used_name) is not template or template.version != version:
+                    break
+            else:
+                return rendered
+
+        template = templates.get(name)
+        if template is None:
+            raise core.TemplateError(
+                self.errors.get(name, "There is no template '%s'!" % name)
+            )
+
+        generation = self._generation
+        tracer = provenance.Trace()
+        try:
+            rendered, found = template.render(templates, trace=tracer, keys=keys)
+
+        except:
+            self._failed.add(name)
+            raise
+
+        self._failed.discard(name)
+        if generation % 2 or generation != self._generation:
+            # Templates were changed meanwhile, the versions used aren't
+            # known.
+            return rendered
+
+        used = {}
+        for names in tracer.dependencies.values() + [[name]]:
+            for used_name in names:
+                source = templates.get(used_name)
+                if source is not None:
+                    used[used_name] = (source, source.version)
+
+        self._renders.put((name, keys), (used, rendered))
+        return rendered
+
+
+    def dependents(self, names):
+        """Return the names of the templates whose renders could be changed
+        by changes to the named ones.
+
+        These are the named templates present, those whose kept renders used
+        them and those whose last render failed.
+
+        """
+        names = set(names)
+        templates = self.templates
+        returned = set([name for name in names if name in templates])
+        for (name, keys), (used, rendered) in self._renders.items():
+            if not names.isdisjoint(used):
+                returned.add(name)
+        returned.update([name for name in self._failed if name in templates])
+        return returned
+
+
+    def render_again(self, names):
+        """Render the named templates again, for each set of keys they were
+        rendered with before, or all keys if they weren't.
+
+        :returns: a dict of the name to the error for those which failed.
+
+        """
+        wanted = dict([(name, set()) for name in names])
+        for (name, keys), found in self._renders.items():
+            if name in wanted:
+                wanted[name].add(keys)
+
+        errors = {}
+        for name, renders in wanted.items():
+            for keys in renders or [None]:
+                try:
+                    self.render(name, keys)
+
+                except Exception as error:
+                    errors[name] = error
+
+        return errors
@@ -0,0 +1,111 @@
+"""
+.. module::`fingerprint`
+    :platform: Unix, Windows
+    :synopsis: Fingerprints of template content for cheap change detection.
+
+Every Template has a content fingerprint, a hex string which changes when its
+content does. This is the XOR of a digest of each key and value, so set(),
+update() and remove() keep it up to date by only digesting the keys they
+change.
+
+Template.output_fingerprint() goes further. It changes when anything the
+rendered output depends on does, so it can be used like an HTTP ETag to skip
+renders and pushes:
+
+.. code-block:: python
+
+    etag = host1.output_fingerprint(references)
+    if etag != last_pushed:
+        push(host1.render(references))
+        last_pushed = etag
+
+It is worked out from the fingerprints of the template and of the references
+actually used the last time it was rendered. While these are unchanged the
+output must be too, and no render is done. If any have changed the template
+is rendered again, to find what it now uses. References whose values can't be
+fingerprinted without looking them up, like reference providers, mean the
+output is always rendered and its fingerprint taken. The same goes for
+templates holding :py:class:`boaconstructor.utils.Lazy` values, as what
+these give can change without their content changing.
+
+Fingerprints are stable within the process. Values are digested using their
+repr() for anything but dicts, lists and tuples, so objects which only have
+the default repr will give different fingerprints in different processes.
+
+.. autofunction:: item_digest
+
+.. autofunction:: content_digest
+
+.. autofunction:: source_digest
+
+.. autofunction:: as_hex
+
+"""
+__all__ = ['item_digest', 'content_digest', 'source_digest', 'as_hex']
+
+# hashlib.sha1, imported when first needed:
+_sha1 = None
+
+
+def _import_sha1():
+    global _sha1
+    from hashlib import sha1 as _sha1
+    return _sha1
+
+
+def _encode(value):
+    """A string which is the same for equal values of the same types."""
+    if isinstance(value, dict):
+        items = sorted([
+            "%s:%s" % (_encode(key), _encode(item)) for key, item in value.items()
+        ])
+        return "{%s}" % ",".join(items)
+
+    if isinstance(value, (list, tuple)):
+        return "[%s]" % ",".join([_encode(item) for item in value])
+
+    return "%s:%r" % (type(value).__name__, value)
+
+
+def item_digest(key, value):
+    """Return the digest of one content key and its value as a 128 bit int.
+    """
+    encoded = "%s=%s" % (_encode(key), _encode(value))
+    if isinstance(encoded, unicode):
+        encoded = encoded.encode('utf-8')
+    sha1 = _sha1 or _import_sha1()
+    return int(sha1(encoded).hexdigest()[:32], 16)
+
+
+def content_digest(content):
+    """Return the XOR of the item digests of a content dict."""
+    returned = 0
+    for key, value in content.items():
+        returned ^= item_digest(key, value)
+    return returned
+
+
+def source_digest(source):
+    """Return the digest of a reference source, or None if it can't be
+    worked out without looking up its values.
+
+    Templates and snapshots use their kept fingerprint, dicts are digested
+    and objects are digested from their __dict__.
+
+    """
+    digest = getattr(source, 'digest', None)
+    if digest is not None and hasattr(source, 'content'):
+        return digest()
+
+    if isinstance(source, dict):
+        return content_digest(source)
+
+    if hasattr(source, 'get_many') or not hasattr(source, '__dict__'):
+        return None
+
+    return content_digest(vars(source))
+
+
+def as_hex(digest):
+    """Return the fingerprint string for a digest."""
+    return "%032x" % digest
@@ -0,0 +1,295 @@
+"""
+.. module::`index`
+    :platform: Unix, Windows
+    :synopsis: Find the templates and keys which use a reference attribute.
+
+Before changing a value it helps to know what uses it. A
+:py:class:`ConsumerIndex` is built in one pass over the content of a set of
+templates, without rendering them, and answers that directly:
+
+.. code-block:: python
+
+    from boaconstructor.index import ConsumerIndex
+
+    index = ConsumerIndex([common, host1, host2, webservers])
+
+    >> index.consumers('common', 'timeout')
+    set([('host1', 'timeout')])
+
+    >> index.consumers('common', 'timeout', transitive=True)
+    set([('host1', 'timeout'), ('host2', 'timeout'), ('webservers', 'all')])
+
+Each consumer is a (template name, top level key) pair. The direct consumers
+of an attribute are the keys whose value, or an entry in its list, is a
+reference to it or an all-inclusion of the whole reference. Transitive
+consumers follow on from these to the keys using them in turn, including
+keys inherited through extends.
+
+Reference names are resolved with each template's own references, so a
+reference to a template under another name is found. A name which isn't in
+the references but is the name of an indexed template is taken to mean it,
+as it would be if given at render time. Other names, like providers, are
+kept as they are.
+
+Use the attribute '*' to ask what includes the whole of a reference.
+
+The index is kept up to date with :py:meth:`ConsumerIndex.update`, which only
+looks at the template given, and at those whose references reach it if its
+references changed. :py:meth:`ConsumerIndex.watch` does this for every
+commit to a :py:class:`boaconstructor.store.TemplateStore`.
+
+.. autoclass:: ConsumerIndex
+    :members:
+
+"""
+__all__ = ['ConsumerIndex']
+
+import types
+import threading
+
+from boaconstructor import utils
+from boaconstructor import provenance
+
+
+class ConsumerIndex(object):
+    """A map from each (reference, attribute) to the keys which use it.
+    """
+    def __init__(self, templates=()):
+        """
+        :param templates: the Template instances to index.
+
+        """
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._snapshots = {}
+        # (name, attribute) -> set of (template name, key)
+        self._direct = {}
+        # template name -> [((name, attribute), (template name, key)), ...]
+        self._contributed = {}
+        # base template name -> set of the names of templates extending it
+        self._children = {}
+        # template name -> the name of the template it extends
+        self._extends = {}
+        # template name -> set of the names of templates whose flattened
+        # references include it
+        self._reached_by = {}
+        # template name -> the template names in its flattened references
+        self._reaches = {}
+
+        self._lock.acquire()
+        try:
+            for template in templates:
+                self._templates[template.name] = template
+            for name in self._templates:
+                self._index(name)
+
+        finally:
+            self._lock.release()
+
+
+    def consumers(self, name, attribute, transitive=False):
+        """Return the (template name, key) pairs using the attribute.
+
+        :param name: the template, or other reference, name.
+
+        :param attribute: the attribute, or '*' for the all-inclusions of the
+        whole reference.
+
+        :param transitive: If True also return the keys using those keys,
+        and so on.
+
+        """
+        self._lock.acquire()
+        try:
+            found = set(self._direct.get((name, attribute), ()))
+            if attribute != provenance.ALL:
+                found.update(self._direct.get((name, provenance.ALL), ()))
+
+            if not transitive:
+                return found
+
+            returned = set()
+            waiting = list(found)
+            if attribute != provenance.ALL:
+                waiting.extend(self._inherited(name, attribute))
+            while waiting:
+                consumer = waiting.pop()
+                if consumer in returned:
+                    continue
+                returned.add(consumer)
+
+                template_name, key = consumer
+                waiting.extend(self._direct.get(consumer, ()))
+                waiting.extend(self._direct.get((template_name, provenance.ALL), ()))
+                waiting.extend(self._inherited(template_name, key))
+
+            return returned
+
+        finally:
+            self._lock.release()
+
+
+    def update(self, template):
+        """Index the template again after it changed, or add it.
+
+        Nothing is done if it hasn't changed since it was last indexed.
+
+        """
+        self._lock.acquire()
+        try:
+            name = template.name
+            old = self._snapshots.get(name)
+            if self._templates.get(name) is template and old is template.snapshot():
+                return
+
+            self._templates[name] = template
+            self._reindex(name, old)
+
+        finally:
+            self._lock.release()
+
+
+    def remove(self, name):
+        """Stop indexing the named template."""
+        self._lock.acquire()
+        try:
+            self._unindex(name)
+            self._templates.pop(name, None)
+            self._reindex_reaching(name)
+
+        finally:
+            self._lock.release()
+
+
+    def refresh(self):
+        """Index again every template which changed since it was indexed."""
+        for template in list(self._templates.values()):
+            self.update(template)
+
+
+    def watch(self, store):
+        """Index a :py:class:`boaconstructor.store.TemplateStore`'s templates
+        and keep up with its commits.
+        """
+        version = store.pin()
+        for name in version.templates:
+            self.update(version.templates[name])
+
+        def committed(version, names):
+            for name in names:
+                self.update(version.templates[name])
+
+        store.subscribe(committed)
+
+
+    def _inherited(self, name, key):
+        """The (template name, key) of the templates which inherit the key
+        from the named one, with the lock held.
+        """
+        return [
+            (child, key) for child in self._children.get(name, ())
+            if key not in self._templates[child].content
+        ]
+
+
+    def _reindex(self, name, old):
+        """Index the template again, with the lock held."""
+        self._unindex(name)
+        self._index(name)
+
+        if old is None or old.references is not self._snapshots[name].references:
+            # The names others reach through this template's references
+            # may now be something else.
+            self._reindex_reaching(name)
+
+
+    def _reindex_reaching(self, name):
+        for other in list(self._reached_by.get(name, ())):
+            if other != name and other in self._templates:
+                self._unindex(other)
+                self._index(other)
+
+
+    def _index(self, name):
+        """Add the references in the template's content, with the lock held.
+        """
+        template = self._templates[name]
+        snapshot = template.snapshot()
+        self._snapshots[name] = snapshot
+
+        flattened = snapshot.flattened()
+        reaches = set()
+        for source in flattened.values():
+            reached = self._name_of(source)
+            if reached is not None:
+                reaches.add(reached)
+                self._reached_by.setdefault(reached, set()).add(name)
+        self._reaches[name] = reaches
+
+        contributed = self._contributed[name] = []
+        for key, value in snapshot.content.items():
+            for reference, attribute in _references_in(value):
+                target = (self._resolve(reference, flattened), attribute)
+                consumer = (name, key)
+                self._direct.setdefault(target, set()).add(consumer)
+                contributed.append((target, consumer))
+
+        extends = template.extends
+        if extends is not None:
+            self._extends[name] = extends.name
+            self._children.setdefault(extends.name, set()).add(name)
+
+
+    def _unindex(self, name):
+        """Remove what the template added to the index, with the lock held.
+        """
+        for target, consumer in self._contributed.pop(name, ()):
+            consumers = self._direct.get(target)
+            if consumers is not None:
+                consumers.discard(consumer)
+                if not consumers:
+                    del self._direct[target]
+
+        for reached in self._reaches.pop(name, ()):
+            self._reached_by.get(reached, set()).discard(name)
+
+        base = self._extends.pop(name, None)
+        if base is not None:
+            self._children[base].discard(name)
+
+        self._snapshots.pop(name, None)
+
+
+    def _name_of(self, source):
+        """The name of an indexed template or None."""
+        name = getattr(source, 'name', None)
+        if name is not None and self._templates.get(name) is source:
+            return name
+        return None
+
+
+    def _resolve(self, reference, flattened):
+        """The name a reference in a template is indexed under."""
+        source = flattened.get(reference)
+        if source is not None:
+            name = self._name_of(source)
+            if name is not None:
+                return name
+        return reference
+
+
+def _references_in(value):
+    """Yield the (reference, attribute) of each reference in a content value,
+    with '*' as the attribute for all-inclusions.
+    """
+    if type(value) in types.StringTypes:
+        found, reference, attribute, allfrom = utils._parse(value)
+        if found == 'refatt':
+            yield reference, attribute
+        elif found == 'all':
+            yield allfrom, provenance.ALL
+
+    elif hasattr(value, '__iter__') and type(value) != types.DictType:
+        for item in value:
+            for found in _references_in(item):
+                yield found
@@ -0,0 +1,180 @@
+"""
+.. module::`instrument`
+    :platform: Unix, Windows
+    :synopsis: Opt-in render instrumentation for boaconstructor.
+
+Instrumentation is switched on by passing an :py:class:`Instrument` to
+:py:meth:`boaconstructor.Template.render` or :py:func:`boaconstructor.utils.render`.
+When it is not given the render path only pays for a couple of 'is None'
+checks.
+
+Example:
+
+.. code-block:: python
+
+    from boaconstructor.instrument import Instrument
+
+    instrument = Instrument()
+    host1.render(instrument=instrument)
+
+    >> instrument.snapshot()['host1']['hops']
+    2
+
+    >> print(instrument.to_prometheus())
+    # HELP boaconstructor_renders_total Number of renders of each template.
+    # TYPE boaconstructor_renders_total counter
+    boaconstructor_renders_total{template="host1"} 1
+    ...
+
+.. autoclass:: Instrument
+    :members:
+
+"""
+__all__ = ['Instrument', 'METRICS', 'UNNAMED']
+
+import threading
+
+
+# The per-template metrics recorded and their Prometheus help text. The wall
+# time is kept as 'seconds' and all the others are simple counts.
+#
+METRICS = (
+    ('renders', 'Number of renders of each template.'),
+    ('seconds', 'Wall time in seconds spent rendering each template.'),
+    ('hops', 'Number of hunt_n_resolve resolution hops.'),
+    ('parse_value_calls', 'Number of parse_value calls.'),
+    ('allinc_expansions', 'Number of all-inclusion expansions.'),
+    ('cache_hits', 'Number of cache hits.'),
+    ('cache_misses', 'Number of cache misses.'),
+)
+
+# The template label used when utils.render is called without a name:
+UNNAMED = '<unnamed>'
+
+
+class Instrument(object):
+    """Collects per-template render statistics.
+
+    Each render accumulates its counts in a private dict (see
+    :py:meth:`counters`) which is merged in by :py:meth:`record` when the
+    render finishes. Only the merge takes the lock, so a single Instrument
+    can be shared by renders running in several threads.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+
+    def counters(self):
+        """Return a fresh zeroed dict of counters for a render to update."""
+        return dict([(metric, 0) for metric, help in METRICS])
+
+
+    def record(self, name, counters, seconds):
+        """Merge the counters of a finished render into the totals.
+
+        :param name: the template name the render was for. If this is None
+        the render is recorded under UNNAMED.
+
+        :param counters: the dict returned by :py:meth:`counters`.
+
+        :param seconds: the wall time the render took.
+
+        """
+        if name is None:
+            name = UNNAMED
+
+        self._lock.acquire()
+        try:
+            totals = self._stats.get(name)
+            if totals is None:
+                totals = self._stats[name] = self.counters()
+
+            for metric in counters:
+                totals[metric] += counters[metric]
+            totals['renders'] += 1
+            totals['seconds'] += seconds
+
+        finally:
+            self._lock.release()
+
+
+    def count(self, name, metric, amount=1):
+        """Add to a metric outside of a render e.g. for a cache lookup.
+        """
+        if name is None:
+            name = UNNAMED
+
+        self._lock.acquire()
+        try:
+            totals = self._stats.get(name)
+            if totals is None:
+                totals = self._stats[name] = self.counters()
+            totals[metric] += amount
+
+        finally:
+            self._lock.release()
+
+
+    def snapshot(self):
+        """Return a copy of the statistics recorded so far.
+
+        :returns: a dict of template name to a dict of metric to value.
+
+        """
+        self._lock.acquire()
+        try:
+            return dict([
+                (name, dict(totals)) for name, totals in self._stats.items()
+            ])
+
+        finally:
+            self._lock.release()
+
+
+    def reset(self):
+        """Throw away all the statistics recorded so far."""
+        self._lock.acquire()
+        try:
+            self._stats = {}
+
+        finally:
+            self._lock.release()
+
+
+    def to_prometheus(self, prefix='boaconstructor'):
+        """Export the statistics in the Prometheus text exposition format.
+
+        :param prefix: the string each metric name starts with.
+
+        :returns: a string ending with a new line.
+
+        """
+        stats = self.snapshot()
+        names = sorted(stats.keys())
+
+        lines = []
+        for metric, help in METRICS:
+            metric_name = "%s_%s_total" % (prefix, metric)
+            lines.append("# HELP %s %s" % (metric_name, help))
+            lines.append("# TYPE %s counter" % metric_name)
+            for name in names:
+                lines.append('%s{template="%s"} %s' % (
+                    metric_name, _escape(name), _number(stats[name][metric])
+                ))
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(label):
+    """Escape a label value as the Prometheus text format requires."""
+    label = "%s" % label
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    """Format integers without a trailing '.0' and floats with full precision."""
+    if isinstance(value, float):
+        return repr(value)
+    return "%d" % value
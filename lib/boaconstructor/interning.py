@@ -0,0 +1,193 @@
+"""
+.. module::`interning`
+    :platform: Unix, Windows
+    :synopsis: Share identical rendered values between renders.
+
+Rendering thousands of templates which all include the same blocks from a
+common template gives thousands of equal, but separate, dicts and lists. With
+interning these are replaced by one shared immutable copy:
+
+.. code-block:: python
+
+    fleet = [host.render(interner=True) for host in hosts]
+
+    >> fleet[0]['ntp'] is fleet[1]['ntp']
+    True
+
+Each value in the rendered dict is interned. The dicts and lists in it become
+a :py:class:`FrozenDict` or :py:class:`FrozenList`, which can't be changed.
+Copy them with dict() or list() to get something that can. The rendered dict
+itself is an ordinary dict.
+
+The intern table holds its values weakly, so a value is only kept for as long
+as some rendered result still uses it. interner=True uses the table shared by
+the whole process, a separate :py:class:`Interner` can be given instead.
+
+Values which are equal but of different types, like 1 and 1.0 or True, are
+not merged. Dicts and lists holding values which can't be hashed are left as
+they are.
+
+.. autoclass:: FrozenDict
+
+.. autoclass:: FrozenList
+
+.. autoclass:: Interner
+    :members:
+
+.. autofunction:: get_interner
+
+"""
+__all__ = ['FrozenDict', 'FrozenList', 'Interner', 'get_interner', 'default']
+
+import types
+import weakref
+import threading
+
+
+# Values of these types are never interned, they are used as they are:
+SCALARS = frozenset([
+    types.StringType, types.UnicodeType, types.IntType, types.LongType,
+    types.FloatType, types.BooleanType, types.NoneType,
+])
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError("%s can't be changed!" % self.__class__.__name__)
+
+
+class FrozenDict(dict):
+    """A dict which can't be changed after it is made."""
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A list which can't be changed after it is made."""
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+class Interner(object):
+    """A weak valued table of the frozen dicts and lists handed out.
+
+    Each is looked up by its contents. Children are interned first, so the
+    contents of a dict or list can be compared using the identity of the
+    frozen values in it rather than comparing them in depth.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+
+    def stats(self):
+        """Return a dict of the hits, misses and entries held."""
+        return dict(hits=self.hits, misses=self.misses, entries=len(self._table))
+
+
+    def intern(self, value):
+        """Return the shared copy of the value.
+
+        Dicts and lists are returned frozen, anything else as given. Frozen
+        values are taken to be shared already and returned as given.
+
+        """
+        kind = type(value)
+        if kind is FrozenDict or kind is FrozenList:
+            return value
+
+        intern = self.intern
+        if isinstance(value, dict):
+            kind = FrozenDict
+            contents = [
+                (key, item if type(item) in SCALARS else intern(item))
+                for key, item in value.items()
+            ]
+            key = (kind, frozenset([
+                ((type(key), key), _tag(item)) for key, item in contents
+            ]))
+
+        elif isinstance(value, list):
+            kind = FrozenList
+            contents = [
+                item if type(item) in SCALARS else intern(item) for item in value
+            ]
+            key = (kind, tuple([_tag(item) for item in contents]))
+
+        else:
+            return value
+
+        try:
+            hash(key)
+
+        except TypeError:
+            # Holds something unhashable, it can't be shared.
+            return value
+
+        self._lock.acquire()
+        try:
+            shared = self._table.get(key)
+            if shared is None:
+                self.misses += 1
+                self._table[key] = shared = kind(contents)
+            else:
+                self.hits += 1
+
+        finally:
+            self._lock.release()
+
+        return shared
+
+
+    def intern_values(self, rendered):
+        """Intern each value of a rendered dict in place."""
+        for key, value in rendered.items():
+            rendered[key] = self.intern(value)
+        return rendered
+
+
+def _tag(value):
+    """What a value is known by in the contents part of an intern table key.
+
+    The shared frozen values are known by identity. This is safe as each
+    entry's frozen value holds on to those it contains, and the entry goes
+    when the frozen value does.
+
+    """
+    kind = type(value)
+    if kind is FrozenDict or kind is FrozenList:
+        return (kind, id(value))
+    return (kind, value)
+
+
+# The table used by interner=True:
+default = Interner()
+
+
+def get_interner(interner):
+    """Return the Interner to use for a render's interner argument.
+
+    :returns: None if interner is None or False, the shared table if it is
+    True and otherwise the Interner given.
+
+    """
+    if interner is True:
+        return default
+    if interner is False:
+        return None
+    return interner
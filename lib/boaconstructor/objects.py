@@ -0,0 +1,233 @@
+"""
+.. module::`objects`
+    :platform: Unix, Windows
+    :synopsis: Read each attribute of an object reference once per render.
+
+Object instances can be given as references, their attributes being looked
+up with hasattr and getattr. When these are computed properties, as on many
+ORM or settings objects, they are worked out again at every hop which reads
+them. Wrapping the object in :py:class:`Attributes` reads each attribute
+once per render instead:
+
+.. code-block:: python
+
+    from boaconstructor.objects import Attributes
+
+    settings = Attributes(django_settings)
+
+    for template in templates:
+        template.render({'settings': settings})
+
+    # Or share what was read by every render in the next 30 seconds:
+    settings = Attributes(django_settings, ttl=30)
+
+At the start of each render the wrapper gives a fresh
+:py:class:`AttributeSnapshot`, a dict which reads each attribute from the
+object the first time it is asked for and keeps it. With a ttl the same one
+is given to every render until it is ttl seconds old.
+
+Attributes are read without going through getattr where the object's class
+allows. If the class doesn't define the name, or defines it as something
+other than a data descriptor, it is looked for in the instance __dict__
+first. Names declared in __slots__ are read with the slot's own descriptor.
+What to do is worked out once per class and attribute name, see
+:py:func:`reader`.
+
+.. autoclass:: Attributes
+    :members:
+
+.. autoclass:: AttributeSnapshot
+    :members:
+
+.. autofunction:: reader
+
+"""
+__all__ = ['Attributes', 'AttributeSnapshot', 'reader']
+
+import time
+import types
+
+
+# Returned by readers for attributes the object doesn't have:
+MISSING = object()
+
+# (class, name) -> the function reading the attribute from its instances
+_readers = {}
+
+# The type of the descriptors made for names in __slots__:
+_SLOT_TYPE = type(type('_Slotted', (object,), {'__slots__': ('slot',)}).slot)
+
+
+def reader(kind, name):
+    """Return a function which reads the named attribute from an instance of
+    kind, returning MISSING if it isn't present.
+    """
+    found = _readers.get((kind, name))
+    if found is None:
+        found = _readers[(kind, name)] = _make_reader(kind, name)
+    return found
+
+
+def _make_reader(kind, name):
+    descriptor = MISSING
+    for klass in getattr(kind, '__mro__', ()):
+        if name in klass.__dict__:
+            descriptor = klass.__dict__[name]
+            break
+
+    if type(descriptor) is _SLOT_TYPE:
+        read_slot = descriptor.__get__
+
+        def read(source):
+            try:
+                return read_slot(source, kind)
+
+            except AttributeError:
+                # The slot was never set.
+                return MISSING
+
+    elif descriptor is MISSING or not hasattr(descriptor, '__set__'):
+        # What the instance __dict__ holds wins, if there is one:
+        def read(source):
+            found = getattr(source, '__dict__', {}).get(name, MISSING)
+            if found is MISSING:
+                found = getattr(source, name, MISSING)
+            return found
+
+    else:
+        # A property or other data descriptor, it has to be called:
+        def read(source):
+            return getattr(source, name, MISSING)
+
+    return read
+
+
+class AttributeSnapshot(dict):
+    """A dict of an object's attributes, each read the first time it is
+    asked for.
+
+    Iterating or listing it reads every attribute in the instance __dict__
+    and the __slots__ set, for use in all-inclusions.
+
+    """
+    def __init__(self, source):
+        dict.__init__(self)
+        self.source = source
+        self._kind = type(source)
+        self._missing = set()
+
+
+    def _read(self, name):
+        """Read the attribute into the dict, returning True if present."""
+        if dict.__contains__(self, name):
+            return True
+        if name in self._missing:
+            return False
+
+        found = reader(self._kind, name)(self.source)
+        if found is MISSING:
+            self._missing.add(name)
+            return False
+
+        dict.__setitem__(self, name, found)
+        return True
+
+
+    def __contains__(self, name):
+        return type(name) in types.StringTypes and self._read(name)
+
+
+    def __getitem__(self, name):
+        if not self.__contains__(name):
+            raise KeyError(name)
+        return dict.__getitem__(self, name)
+
+
+    def get(self, name, default=None):
+        if not self.__contains__(name):
+            return default
+        return dict.__getitem__(self, name)
+
+
+    def _everything(self):
+        source = self.source
+        names = list(getattr(source, '__dict__', {}))
+        for klass in getattr(self._kind, '__mro__', ()):
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in ('__dict__', '__weakref__'):
+                    names.append(name)
+
+        for name in names:
+            if not name.startswith('_'):
+                self._read(name)
+        return self
+
+
+    def __iter__(self):
+        return dict.__iter__(self._everything())
+
+
+    def __len__(self):
+        return dict.__len__(self._everything())
+
+
+    def keys(self):
+        return dict.keys(self._everything())
+
+
+    def values(self):
+        return dict.values(self._everything())
+
+
+    def items(self):
+        return dict.items(self._everything())
+
+
+class Attributes(object):
+    """Wraps an object given as a reference so each of its attributes is
+    read once per render, or once per ttl seconds.
+    """
+    __slots__ = ('source', 'ttl', '_current')
+
+    def __init__(self, source, ttl=None):
+        """
+        :param source: the object instance.
+
+        :param ttl: None to read the attributes again in every render,
+        otherwise the seconds every render shares what was read for.
+
+        """
+        self.source = source
+        self.ttl = ttl
+        # (when made, AttributeSnapshot)
+        self._current = (0, None)
+
+
+    def snapshot(self):
+        """Return the AttributeSnapshot for a render to read from.
+
+        Renders call this once at the start, as they do for Templates.
+
+        """
+        if self.ttl is None:
+            return AttributeSnapshot(self.source)
+
+        now = time.time()
+        made, current = self._current
+        if current is None or now - made >= self.ttl:
+            current = AttributeSnapshot(self.source)
+            self._current = (now, current)
+        return current
+
+
+    def expire(self):
+        """Read the attributes again from the next render on."""
+        self._current = (0, None)
+
+
+    def _get_content(self):
+        return self.snapshot()
+
+    # Used by keys= renders, which don't call snapshot() first. Without a
+    # ttl each hop then reads through a snapshot of its own.
+    content = property(_get_content)
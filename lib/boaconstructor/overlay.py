@@ -0,0 +1,219 @@
+"""
+.. module::`overlay`
+    :platform: Unix, Windows
+    :synopsis: Render templates for many tenants, each overriding a few references.
+
+Rendering the same templates for many tenants, each giving a few references
+of its own, resolves everything again for every tenant. With an
+:py:class:`Overlay` each template is resolved once with the base references
+and each tenant's render only resolves the keys its overrides can change:
+
+.. code-block:: python
+
+    from boaconstructor.overlay import Overlay
+
+    overlay = Overlay(references={'common': common, 'db': shared_db})
+
+    for tenant in tenants:
+        rendered = overlay.render(webserver, {'db': tenant.db})
+
+This gives the same as webserver.render(dict(references, db=tenant.db)),
+including checking the template's schema.
+
+When a template is first rendered its keys are resolved with the base
+references, noting the reference names each key's chain of references
+passed through. A tenant's overrides, along with any child references they
+have, are compared with the base references. Only the keys which used a name
+the tenant gives something else for are resolved again, along with any
+which couldn't be resolved without the tenant's references. The rest are
+taken from the base render, so the cost of a tenant's render grows with the
+number of keys its overrides affect rather than the size of the template.
+
+Templates extended are rendered through the overlay too, so only their keys
+which the overrides affect are resolved again.
+
+The base render is done again if the template, or anything it used, has
+changed version since. The values taken from it are the same objects for
+every tenant, so copy any you want to change.
+
+At most 'max_templates' base renders are kept, those least recently used are
+dropped first. They are kept in a :py:class:`boaconstructor.cache.Cache`
+registered as 'overlay_bases', so it can be limited and watched with
+:py:func:`boaconstructor.cache.configure` and
+:py:func:`boaconstructor.cache.stats`. Only the latest Overlay made is
+registered under the name.
+
+.. autoclass:: Overlay
+    :members:
+
+"""
+__all__ = ['Overlay']
+
+from boaconstructor import cache
+from boaconstructor import utils
+from boaconstructor import provenance
+
+
+class _Overlaid(dict):
+    """The flattened overrides, falling back to the base references."""
+
+    def __init__(self, overrides, base):
+        dict.__init__(self, overrides)
+        self.base = base
+
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.base
+
+
+    def __getitem__(self, name):
+        if dict.__contains__(self, name):
+            return dict.__getitem__(self, name)
+        return self.base[name]
+
+
+    def get(self, name, default=None):
+        if dict.__contains__(self, name):
+            return dict.__getitem__(self, name)
+        return self.base.get(name, default)
+
+
+class _Base(object):
+    """A template resolved with the base references."""
+
+    def __init__(self, template, references):
+        self.snapshot = snapshot = template.snapshot()
+        found = utils.build_ref_cache(
+            snapshot.references, references, int_cache=snapshot.flattened()
+        )
+        self.reference_cache = utils.pin_snapshots(found)
+
+        tracer = provenance.Trace()
+        traced = dict(self.reference_cache, trace=tracer)
+
+        self.shared = {}
+        self.failed = set()
+        for key, value in snapshot.content.items():
+            tracer.enter(key)
+            try:
+                self.shared[key] = utils.hunt_n_resolve(value, traced)
+
+            except (utils.ReferenceError, utils.AttributeError):
+                # This may work with the tenant's references.
+                self.failed.add(key)
+
+            tracer.unwind()
+
+        # reference name -> the keys whose chains used it
+        self.users = {}
+        for key, names in tracer.dependencies.items():
+            for name in names:
+                self.users.setdefault(name, set()).add(key)
+
+        # The version of each template used, to tell when this is stale:
+        self.versions = []
+        for name in self.users:
+            for dest in ('ext', 'int'):
+                source = found[dest].get(name)
+                version = getattr(source, 'version', None)
+                if version is not None:
+                    self.versions.append((source, version))
+
+
+    def valid(self, template):
+        if template.snapshot() is not self.snapshot:
+            return False
+        for source, version in self.versions:
+            if source.version != version:
+                return False
+        return True
+
+
+class Overlay(object):
+    """Renders templates with the base references plus each tenant's
+    overrides, resolving each template with the base references only once.
+    """
+    def __init__(self, references=None, max_templates=1000):
+        """
+        :param references: the render time references every tenant shares.
+
+        :param max_templates: the most base renders to keep, None for no
+        limit.
+
+        """
+        if references is None:
+            references = {}
+        self.references = references
+        # id(template) -> (template, base render)
+        self._bases = cache.register(
+            cache.Cache('overlay_bases', max_entries=max_templates)
+        )
+
+        # The keys resolved again for tenants, for seeing what overrides cost:
+        self.resolved = 0
+
+
+    def render(self, template, overrides=None):
+        """Return the template rendered with the base references and the
+        overrides.
+
+        :param template: the Template to render.
+
+        :param overrides: a dict of reference name to the tenant's reference,
+        these win over the base references.
+
+        """
+        base = self._base(template)
+
+        returned = dict(base.shared)
+        if overrides:
+            overridden = utils.pin_snapshots(
+                {'int': {}, 'ext': utils.build_ref_cache({}, overrides)['ext']}
+            )['ext']
+            base_ext = base.reference_cache['ext']
+
+            keys = set(base.failed)
+            for name, source in overridden.items():
+                if base_ext.get(name) is not source:
+                    keys.update(base.users.get(name, ()))
+
+            if keys:
+                reference_cache = {
+                    'int': base.reference_cache['int'],
+                    'ext': _Overlaid(overridden, base_ext),
+                }
+                content = base.snapshot.content
+                for key in keys:
+                    returned[key] = utils.hunt_n_resolve(content[key], reference_cache)
+                self.resolved += len(keys)
+
+        elif base.failed:
+            # Raise the error the render would:
+            for key in base.failed:
+                utils.hunt_n_resolve(base.snapshot.content[key], base.reference_cache)
+
+        extends = template.extends
+        if extends is not None:
+            inherited = self.render(extends, overrides)
+            for key, value in inherited.items():
+                if key not in base.snapshot.content:
+                    returned[key] = value
+
+        template.check(returned, None, base.snapshot)
+        return returned
+
+
+    def forget(self, template):
+        """Drop the base render kept for the template."""
+        self._bases.pop(id(template))
+
+
+    def _base(self, template):
+        """Return the template's base render, working it out if needed."""
+        found = self._bases.get(id(template))
+        if found is not None and found[0] is template and found[1].valid(template):
+            return found[1]
+
+        base = _Base(template, self.references)
+        self._bases.put(id(template), (template, base))
+        return base
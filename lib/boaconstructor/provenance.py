@@ -0,0 +1,100 @@
+"""
+.. module::`provenance`
+    :platform: Unix, Windows
+    :synopsis: Records which references supplied each rendered value.
+
+This is used by ``render(trace=True)``. The hops are recorded by
+:py:func:`boaconstructor.utils.hunt_n_resolve` as it resolves each value, so
+no second walk over the templates is done.
+
+The provenance map returned is keyed on the path of the rendered value. Top
+level keys are used as-is, keys inside all-inclusions are joined with '.' and
+list entries use '[index]'. Each entry is the list of (reference, attribute)
+hops taken in the order they were followed, the last hop is the one which
+supplied the value. All-inclusions are recorded as (reference, '*'). Values
+which needed no resolving are not present.
+
+Example:
+
+.. code-block:: python
+
+    result, provenance = host2.render(trace=True)
+
+    >> provenance
+    {
+        'timeout': [('host', 'timeout'), ('common', 'timeout')],
+        'users': [('auth', '*')],
+        'users.name': [('people', 'bob')],
+    }
+
+.. autoclass:: Trace
+    :members:
+
+"""
+__all__ = ['Trace', 'ALL']
+
+
+# The attribute recorded for an all-inclusion hop:
+ALL = '*'
+
+
+class Trace(object):
+    """Collects the provenance map during one render.
+
+    The render calls :py:meth:`enter` and :py:meth:`leave` around each value
+    it resolves and :py:meth:`hop` is called for every reference followed.
+    A value can be entered 'muted' so its hops aren't kept, this is used for
+    extendwith keys the main template overwrites.
+
+    As well as the provenance map, 'dependencies' is kept. This is a dict of
+    top level key to the set of reference names used anywhere in its value.
+    'tops' is a dict of provenance path to the top level key it is under.
+
+    """
+    def __init__(self):
+        self.provenance = {}
+        self.dependencies = {}
+        self.tops = {}
+        self._stack = []
+
+
+    def enter(self, key, muted=False):
+        """Start resolving the value for key inside the current path."""
+        if self._stack:
+            path, parent_muted, top = self._stack[-1]
+            if isinstance(key, int):
+                path = "%s[%d]" % (path, key)
+            else:
+                path = "%s.%s" % (path, key)
+            muted = muted or parent_muted
+
+        else:
+            path = top = key
+
+        self._stack.append((path, muted, top))
+
+
+    def leave(self):
+        """Finish resolving the current value."""
+        self._stack.pop()
+
+
+    def unwind(self):
+        """Leave every value entered, used when resolving a value raised."""
+        del self._stack[:]
+
+
+    def hop(self, reference, attribute):
+        """Record a reference followed while resolving the current value."""
+        path, muted, top = self._stack[-1]
+        if not muted:
+            chain = self.provenance.get(path)
+            if chain is None:
+                chain = self.provenance[path] = []
+                self.tops[path] = top
+            chain.append((reference, attribute))
+
+            names = self.dependencies.get(top)
+            if names is None:
+                names = self.dependencies[top] = set()
+            names.add(reference)
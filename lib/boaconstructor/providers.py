@@ -0,0 +1,463 @@
+"""
+.. module::`providers`
+    :platform: Unix, Windows
+    :synopsis: Reference providers backed by environment variables, SQLite
+    tables or other stores, looked up in batches.
+
+A reference provider is any object with a ``get_many(attributes)`` method. It
+returns a dict of the attributes it has values for, leaving out the ones it
+doesn't. If attributes is None it returns everything it has, this is used by
+all-inclusions. Providers are used as references like dicts or Templates:
+
+.. code-block:: python
+
+    from boaconstructor.providers import EnvironProvider, SQLiteProvider
+
+    host1 = Template('host1', {
+            'home': 'env.$.HOME',
+            'timeout': 'common.$.timeout',
+        },
+        references={
+            'env': EnvironProvider(),
+            'common': SQLiteProvider('settings.db', 'common', ttl=30),
+        }
+    )
+
+Rather than making one lookup per reference-attribute, a render first works
+out all the attributes it needs from each provider and fetches them with a
+single get_many call. Values fetched can refer to other providers in turn, so
+this is repeated until nothing is missing. See :py:func:`prefetch`.
+
+The :py:class:`Provider` base class also keeps a cache of what it fetched
+for 'ttl' seconds, which is shared by all renders using the provider. Its
+size can be limited, see :py:mod:`boaconstructor.cache`.
+
+.. autoclass:: Provider
+    :members:
+
+.. autoclass:: EnvironProvider
+
+.. autoclass:: SQLiteProvider
+
+.. autoclass:: View
+    :members:
+
+.. autofunction:: prefetch
+
+.. autofunction:: with_views
+
+"""
+__all__ = [
+    'Provider', 'EnvironProvider', 'SQLiteProvider', 'View', 'prefetch',
+    'fetch_views', 'with_views', 'is_provider',
+]
+
+import os
+import re
+import time
+import threading
+
+from boaconstructor import cache
+from boaconstructor import utils
+
+
+# Fetched attributes a provider did not have are cached as this:
+ABSENT = object()
+
+# Returned by the cache for attributes it doesn't have:
+MISSING = object()
+
+# Table and column names must look like this as they can't be SQL parameters:
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# SQLite's default limit on the parameters in a statement:
+SQLITE_MAX_PARAMS = 999
+
+
+def is_provider(reference):
+    """Return True if the reference supports the get_many provider protocol.
+    """
+    return hasattr(reference, 'get_many')
+
+
+class Provider(object):
+    """The base for providers which caches what was fetched for a time.
+
+    Subclasses implement :py:meth:`fetch_many` which talks to the store.
+
+    """
+    def __init__(self, ttl=None, max_entries=None, max_bytes=None):
+        """
+        :param ttl: seconds to keep fetched values for. If this is None or 0
+        nothing is cached between get_many calls.
+
+        :param max_entries: the most attributes to cache, None for no limit.
+
+        :param max_bytes: roughly the most bytes to cache, None for no limit.
+
+        The cache is a :py:class:`boaconstructor.cache.Cache`, available as
+        'cache' for its statistics.
+
+        """
+        self.ttl = ttl
+        self.cache = cache.Cache(
+            self.__class__.__name__,
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            ttl=ttl,
+        )
+        self._lock = threading.Lock()
+        self._all_expires = 0
+        self._all_evictions = 0
+
+
+    def fetch_many(self, attributes):
+        """Recover the attributes from the store, by-passing the cache.
+
+        :param attributes: a list of attribute strings or None for all of them.
+
+        :returns: a dict of attribute to value, for the ones the store has.
+
+        """
+        raise NotImplementedError("fetch_many must be implemented!")
+
+
+    def get_many(self, attributes):
+        """Return the attributes, only fetching those not cached.
+
+        :param attributes: a list of attribute strings or None for all of them.
+
+        :returns: a dict of attribute to value, for the ones the store has.
+
+        """
+        if not self.ttl:
+            return self.fetch_many(attributes)
+
+        # Everything is known to be cached if all of them were fetched and
+        # none have been evicted since:
+        all_cached = (
+            self._all_expires > time.time() and
+            self.cache.evictions == self._all_evictions
+        )
+        if attributes is None:
+            if all_cached:
+                return self._present(self.cache.items())
+            wanted = None
+
+        else:
+            found = {}
+            wanted = []
+            for attribute in attributes:
+                value = self.cache.get(attribute, MISSING)
+                if value is MISSING:
+                    if not all_cached:
+                        wanted.append(attribute)
+                elif value is not ABSENT:
+                    found[attribute] = value
+            if not wanted:
+                return found
+
+        fetched = self.fetch_many(wanted)
+
+        self._lock.acquire()
+        try:
+            if wanted is None:
+                self.cache.clear()
+                self._all_expires = time.time() + self.ttl
+                self._all_evictions = self.cache.evictions
+                for attribute, value in fetched.items():
+                    self.cache.put(attribute, value)
+
+            else:
+                for attribute in wanted:
+                    self.cache.put(attribute, fetched.get(attribute, ABSENT))
+
+        finally:
+            self._lock.release()
+
+        if wanted is None:
+            return fetched
+
+        found.update(fetched)
+        return found
+
+
+    def invalidate(self):
+        """Throw away everything cached."""
+        self._lock.acquire()
+        try:
+            self.cache.clear()
+            self._all_expires = 0
+
+        finally:
+            self._lock.release()
+
+
+    def _present(self, items):
+        return dict([(a, value) for a, value in items if value is not ABSENT])
+
+
+class EnvironProvider(Provider):
+    """Provide environment variables, optionally only those with a prefix.
+
+    With prefix='MYAPP_' the reference-attribute 'env.$.PORT' is the value of
+    the MYAPP_PORT environment variable.
+
+    """
+    def __init__(self, prefix='', environ=None, ttl=None, max_entries=None, max_bytes=None):
+        """
+        :param prefix: the string the variable names start with.
+
+        :param environ: the dict to use instead of os.environ.
+
+        :param ttl, max_entries, max_bytes: see :py:class:`Provider`.
+
+        """
+        Provider.__init__(self, ttl, max_entries, max_bytes)
+        self.prefix = prefix
+        self.environ = environ if environ is not None else os.environ
+
+
+    def fetch_many(self, attributes):
+        prefix = self.prefix
+        environ = self.environ
+
+        if attributes is None:
+            return dict([
+                (name[len(prefix):], value) for name, value in environ.items()
+                if name.startswith(prefix)
+            ])
+
+        returned = {}
+        for attribute in attributes:
+            name = prefix + attribute
+            if name in environ:
+                returned[attribute] = environ[name]
+        return returned
+
+
+class SQLiteProvider(Provider):
+    """Provide the rows of a two column key / value SQLite table.
+
+    The attributes are looked up with one query per batch rather than one per
+    reference-attribute.
+
+    """
+    def __init__(self, database, table, key_column='name', value_column='value', ttl=None, max_entries=None, max_bytes=None):
+        """
+        :param database: the SQLite database filename or a callable which
+        returns a new sqlite3 connection.
+
+        :param table: the table name.
+
+        :param key_column: the column the attribute names are in.
+
+        :param value_column: the column the values are in.
+
+        :param ttl, max_entries, max_bytes: see :py:class:`Provider`.
+
+        """
+        Provider.__init__(self, ttl, max_entries, max_bytes)
+        for identifier in (table, key_column, value_column):
+            if not IDENTIFIER_RE.match(identifier):
+                raise ValueError("'%s' is not a valid SQL identifier!" % identifier)
+
+        self.database = database
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+
+
+    def connect(self):
+        """Return a new connection. One is made per fetch as sqlite3
+        connections can't be shared between threads.
+        """
+        if callable(self.database):
+            return self.database()
+
+        import sqlite3
+        return sqlite3.connect(self.database)
+
+
+    def fetch_many(self, attributes):
+        query = "SELECT %s, %s FROM %s" % (
+            self.key_column, self.value_column, self.table
+        )
+
+        returned = {}
+        connection = self.connect()
+        try:
+            if attributes is None:
+                returned.update(connection.execute(query).fetchall())
+
+            else:
+                attributes = list(attributes)
+                for start in range(0, len(attributes), SQLITE_MAX_PARAMS):
+                    batch = attributes[start:start + SQLITE_MAX_PARAMS]
+                    rows = connection.execute(
+                        "%s WHERE %s IN (%s)" % (
+                            query, self.key_column, ",".join(["?"] * len(batch))
+                        ),
+                        batch
+                    ).fetchall()
+                    returned.update(rows)
+
+        finally:
+            connection.close()
+
+        return returned
+
+
+class View(dict):
+    """The values fetched from a provider for the duration of one render.
+
+    This stands in for the provider in the reference cache. While
+    :py:func:`prefetch` is working out what is needed 'missing' is a set: any
+    attribute not fetched yet is added to it and looks present with a None
+    value. An all-inclusion of a view which isn't 'complete' adds None to
+    missing.
+
+    Otherwise attributes which weren't prefetched are fetched when asked for,
+    so a reference cache holding views can be reused to resolve other values.
+
+    """
+    def __init__(self, name, provider):
+        dict.__init__(self)
+        self.name = name
+        self.provider = provider
+        self.absent = set()
+        self.complete = False
+        self.missing = None
+
+
+    def add(self, attributes, values):
+        """Store what was fetched for the attributes (None being all of them).
+        """
+        self.update(values)
+        if attributes is None:
+            self.complete = True
+        else:
+            self.absent.update([a for a in attributes if a not in values])
+
+
+    def __contains__(self, attribute):
+        if dict.__contains__(self, attribute):
+            return True
+        if self.complete or attribute in self.absent:
+            return False
+
+        if self.missing is not None:
+            self.missing.add(attribute)
+            return True
+
+        if is_provider(self.provider):
+            self.add([attribute], self.provider.get_many([attribute]))
+            return dict.__contains__(self, attribute)
+
+        return False
+
+
+    def __getitem__(self, attribute):
+        if dict.__contains__(self, attribute):
+            return dict.__getitem__(self, attribute)
+        if attribute in self:
+            # Being worked out by prefetch, it has been noted as missing.
+            return None
+        raise KeyError(attribute)
+
+
+    def items(self):
+        if not self.complete:
+            if self.missing is not None:
+                self.missing.add(None)
+            elif is_provider(self.provider):
+                self.add(None, self.provider.get_many(None))
+        return dict.items(self)
+
+
+def fetch_views(wanted):
+    """Fetch what each view is missing with one get_many call per provider.
+
+    :param wanted: a list of (View, set of attributes it is missing).
+
+    """
+    for view, attributes in wanted:
+        if None in attributes:
+            attributes = None
+        else:
+            attributes = sorted(attributes)
+        view.add(attributes, view.provider.get_many(attributes))
+
+
+def prefetch(values, reference_cache, views, fetch=fetch_views):
+    """Fill in the views with everything needed to resolve the values.
+
+    The values are resolved, with the results thrown away, and what the views
+    were missing is fetched in one go. This is repeated until a pass doesn't
+    miss anything, which takes one pass more than the depth of references
+    from provider to provider.
+
+    :py:class:`boaconstructor.utils.Lazy` values are not called, so each is
+    only called once by the render itself. What they give is fetched from
+    the providers as it is resolved.
+
+    :param values: the content values which will be resolved.
+
+    :param reference_cache: a reference cache with the views standing in for
+    the providers.
+
+    :param views: the list of :py:class:`View` to fill in.
+
+    :param fetch: called with a list of (View, set of attributes it is missing).
+
+    """
+    # A bare cache so the instrument or trace don't see the extra passes:
+    bare = {
+        'int': reference_cache['int'],
+        'ext': reference_cache['ext'],
+        'prefetch': True,
+    }
+
+    retries = 20
+    while retries:
+        retries -= 1
+
+        for view in views:
+            view.missing = set()
+
+        try:
+            for value in values:
+                utils.hunt_n_resolve(value, bare)
+
+        finally:
+            wanted = [(view, view.missing) for view in views if view.missing]
+            for view in views:
+                view.missing = None
+
+        if not wanted:
+            break
+
+        fetch(wanted)
+
+
+def with_views(reference_cache):
+    """Return a copy of the reference cache with providers replaced by views.
+
+    :returns: (reference cache, [views...]), there are no views if there were
+    no providers in the reference cache.
+
+    """
+    views = {}
+    returned = dict(reference_cache)
+    for dest in ('int', 'ext'):
+        references = reference_cache[dest]
+        for name, source in references.items():
+            if is_provider(source):
+                if references is reference_cache[dest]:
+                    references = returned[dest] = dict(references)
+                view = views.get(id(source))
+                if view is None:
+                    view = views[id(source)] = View(name, source)
+                references[name] = view
+
+    return returned, list(views.values())
@@ -0,0 +1,289 @@
+"""
+.. module::`schema`
+    :platform: Unix, Windows
+    :synopsis: Check rendered dicts against a schema as part of the render.
+
+A Template can be given a :py:class:`Schema` which every render it does must
+meet. If it doesn't :py:class:`SchemaError` is raised, listing every problem:
+
+.. code-block:: python
+
+    host1 = Template('host1', {
+            'host': '1.2.3.4',
+            'port': 'common.$.port',
+            'ntp': ['ntp1.example.com', 'common.$.ntp'],
+        },
+        references={'common': common},
+        schema=Schema({
+                'host': basestring,
+                'port': int,
+                'ntp': [basestring],
+                'logging': {'level': basestring, 'days': (int, long)},
+            },
+            required=['host', 'port'],
+        ),
+    )
+
+    >> host1.render()
+    SchemaError: host1: ['port']: expected int, got str '80'
+
+A plain dict is taken as Schema(dict). A schema is a dict of key to what its
+value must be:
+
+  * a type, or a tuple of types, the value must be an instance of.
+
+  * a list holding one of these, for a list whose items all match it.
+
+  * a dict of these, for a dict with all of these keys. Use a Schema for a
+    dict where only some are required.
+
+Use object to allow any value. Only the keys listed in required must be
+present, all of them if it isn't given. Other keys may be present as well.
+
+The schema is compiled into a check function per key. When a template's
+content changes the keys are sorted: values which have no references in them
+are checked there and then, only once, as they render as they are. The
+problems found are kept and raised by each render. Per render only the keys
+whose values come from references, or from the templates extended, are
+checked.
+
+.. autoclass:: Schema
+    :members:
+
+.. autoclass:: Plan
+    :members:
+
+.. autoclass:: SchemaError
+
+"""
+__all__ = ['Schema', 'Plan', 'SchemaError']
+
+import types
+
+from boaconstructor import core
+from boaconstructor import utils
+
+
+class SchemaError(core.TemplateError):
+    """Raised when a render doesn't meet the template's schema.
+
+    :ivar problems: the list of problem strings.
+
+    """
+    def __init__(self, name, problems):
+        self.problems = problems
+        core.TemplateError.__init__(
+            self, "%s: %s" % (name, "; ".join(problems))
+        )
+
+
+class Schema(object):
+    """What a rendered dict must hold, compiled to check functions."""
+
+    def __init__(self, spec, required=None):
+        """
+        :param spec: a dict of key to type, tuple of types, [item spec] or
+        {key: spec} dict.
+
+        :param required: the keys which must be present, by default all of
+        those in spec.
+
+        """
+        if type(spec) != types.DictType:
+            raise core.TemplateError("The schema given is not a Dict!")
+
+        if required is None:
+            required = spec.keys()
+        self.spec = spec
+        self.required = frozenset(required)
+
+        self._checks = {}
+        for key in self.required:
+            self._checks[key] = _present
+        for key, value in spec.items():
+            self._checks[key] = _compile(value)
+
+
+    def check(self, rendered):
+        """Return a list of the problems with a rendered dict, or [] if it
+        matches.
+        """
+        problems = []
+        for key, check in self._checks.items():
+            if key in rendered:
+                problem = check(rendered[key])
+                if problem is not None:
+                    problems.append(_problem(key, problem))
+
+            elif key in self.required:
+                problems.append("[%r]: missing" % (key,))
+
+        return problems
+
+
+    def plan(self, content):
+        """Return the :py:class:`Plan` of the checks to make when rendering
+        the content.
+        """
+        static = {}
+        dynamic = []
+        for key, check in self._checks.items():
+            required = key in self.required
+            if key in content:
+                value = content[key]
+                if _literal(value):
+                    problem = check(value)
+                    if problem is not None:
+                        static[key] = _problem(key, problem)
+                    continue
+
+            dynamic.append((key, check, required))
+
+        return Plan(static, dynamic)
+
+
+class Plan(object):
+    """The checks a Schema makes on the renders of one version of a
+    template's content.
+
+    :ivar static: a dict of key to the problem found with its literal value.
+
+    :ivar dynamic: a list of (key, check, required) for the keys whose values
+    are only known once rendered.
+
+    """
+    def __init__(self, static, dynamic):
+        self.static = static
+        self.dynamic = dynamic
+
+
+    def check(self, rendered, keys=None):
+        """Return the list of problems with a render.
+
+        :param keys: If given only these keys were rendered, only they are
+        checked.
+
+        """
+        if keys is None:
+            problems = list(self.static.values())
+            dynamic = self.dynamic
+
+        else:
+            wanted = set(keys)
+            problems = [
+                problem for key, problem in self.static.items() if key in wanted
+            ]
+            dynamic = [checks for checks in self.dynamic if checks[0] in wanted]
+
+        for key, check, required in dynamic:
+            if key in rendered:
+                problem = check(rendered[key])
+                if problem is not None:
+                    problems.append(_problem(key, problem))
+
+            elif required:
+                problems.append("[%r]: missing" % (key,))
+
+        problems.sort()
+        return problems
+
+
+def _problem(key, problem):
+    path, message = problem
+    return "[%r]%s: %s" % (key, path, message)
+
+
+def _literal(value):
+    """True if the value renders as it is."""
+    if type(value) is utils.Lazy:
+        return False
+
+    if type(value) in types.StringTypes:
+        return utils._parse(value)[0] is None
+
+    if type(value) == types.ListType:
+        for item in value:
+            if not _literal(item):
+                return False
+        return True
+
+    # Other iterables render as lists.
+    return type(value) == types.DictType or not hasattr(value, '__iter__')
+
+
+def _present(value):
+    return None
+
+
+def _name(kinds):
+    if isinstance(kinds, tuple):
+        return " or ".join([kind.__name__ for kind in kinds])
+    return kinds.__name__
+
+
+def _compile(spec):
+    """Return a function which returns None if a value matches the spec, or
+    a (path, message) tuple if it doesn't.
+    """
+    if isinstance(spec, Schema):
+        return _compile_schema(spec)
+
+    if type(spec) == types.DictType:
+        return _compile_schema(Schema(spec))
+
+    if type(spec) == types.ListType:
+        if len(spec) != 1:
+            raise core.TemplateError("A list schema must hold one item spec!")
+        return _compile_list(_compile(spec[0]))
+
+    kinds = spec
+    if isinstance(kinds, tuple):
+        for kind in kinds:
+            if not isinstance(kind, (type, types.ClassType)):
+                raise core.TemplateError("%r is not a type!" % (kind,))
+    elif not isinstance(kinds, (type, types.ClassType)):
+        raise core.TemplateError("%r is not a type or schema!" % (kinds,))
+
+    if kinds is object:
+        return _present
+
+    expected = "expected %s" % _name(kinds)
+
+    def check(value):
+        if isinstance(value, kinds):
+            return None
+        return '', "%s, got %s %r" % (expected, type(value).__name__, value)
+
+    return check
+
+
+def _compile_list(item_check):
+    def check(value):
+        if not isinstance(value, list):
+            return '', "expected list, got %s %r" % (type(value).__name__, value)
+        for index, item in enumerate(value):
+            problem = item_check(item)
+            if problem is not None:
+                return "[%d]%s" % (index, problem[0]), problem[1]
+        return None
+
+    return check
+
+
+def _compile_schema(schema):
+    checks = schema._checks.items()
+    required = schema.required
+
+    def check(value):
+        if not isinstance(value, dict):
+            return '', "expected dict, got %s %r" % (type(value).__name__, value)
+        for key, item_check in checks:
+            if key in value:
+                problem = item_check(value[key])
+                if problem is not None:
+                    return "[%r]%s" % (key, problem[0]), problem[1]
+            elif key in required:
+                return "[%r]" % (key,), "missing"
+        return None
+
+    return check
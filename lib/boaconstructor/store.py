@@ -0,0 +1,772 @@
+"""
+.. module::`store`
+    :platform: Unix, Windows
+    :synopsis: A versioned store of templates changed in batches.
+
+Changing several templates one at a time lets a render running meanwhile see
+some of the changes and not others. A :py:class:`TemplateStore` holds a set
+of templates and applies a :py:class:`Batch` of changes to any number of them
+as one new version:
+
+.. code-block:: python
+
+    from boaconstructor.store import TemplateStore
+
+    store = TemplateStore([common, host1, host2])
+
+    with store.batch() as batch:
+        batch.update('common', {'timeout': 30, 'retries': 5})
+        batch.set('host1', 'port', 8080)
+
+    >> store.render('host1')
+    {'host': '1.2.3.4', 'port': 8080, 'timeout': 30, ...}
+
+A render through the store pins the current :py:class:`Version`. Every
+template it reaches is seen as it was in that version, whatever is committed
+while the render runs. A version can also be pinned for longer:
+
+.. code-block:: python
+
+    version = store.pin()
+    host1 = version.render('host1')
+    host2 = version.render('host2')  # consistent with host1
+
+The store only holds on to the current version. Older ones are kept for as
+long as something still refers to them, :py:meth:`TemplateStore.retained`
+lists these.
+
+Committing a batch publishes the new snapshot of each template changed and
+invalidates what was kept from earlier renders once for the batch, however
+many keys it changed. Anything registered with
+:py:meth:`TemplateStore.subscribe` is then called once.
+
+What changed in the renders between two versions is found by
+:py:func:`diff_render`. A render of each template in a version records the
+(reference, attribute) hops each key took. Only keys whose hops reach a
+template key which changed between the versions are rendered again:
+
+.. code-block:: python
+
+    before = store.pin()
+    with store.batch() as batch:
+        batch.set('common', 'timeout', 30)
+
+    >> diff_render(before, store.pin())
+    {'host1': [('changed', 'timeout', 42, 30)]}
+
+The render of the new version is kept for the next diff. Plain dicts and
+other objects used as references are assumed not to change.
+
+The templates are still Template instances and can be rendered directly,
+though this does not give a consistent view across templates. Changes made
+to them directly are included in the store's next version.
+
+.. autoclass:: TemplateStore
+    :members:
+
+.. autoclass:: Batch
+    :members:
+
+.. autoclass:: Version
+    :members:
+
+.. autoclass:: Traced
+
+.. autofunction:: diff_render
+
+"""
+__all__ = ['TemplateStore', 'Batch', 'Version', 'Traced', 'diff_render']
+
+import types
+import weakref
+import threading
+
+from boaconstructor import core
+from boaconstructor import utils
+from boaconstructor import provenance
+
+
+class TemplateStore(object):
+    """A set of templates, by name, changed together in versions.
+    """
+    def __init__(self, templates=()):
+        """
+        :param templates: a list of Template instances to start with.
+
+        """
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._retained = weakref.WeakValueDictionary()
+
+        named = {}
+        for template in templates:
+            named[template.name] = template
+        self._current = self._version(0, named)
+
+
+    def _get_version(self):
+        """The current version number."""
+        return self._current.number
+
+    version = property(_get_version)
+
+
+    def get(self, name):
+        """Return the template stored under the name, raising KeyError if
+        there isn't one.
+        """
+        return self._current.templates[name]
+
+
+    def names(self):
+        """Return the names of the templates in the current version."""
+        return self._current.templates.keys()
+
+
+    def pin(self):
+        """Return the current :py:class:`Version`.
+
+        This stays as it is for as long as it is held, whatever is committed
+        later.
+
+        """
+        return self._current
+
+
+    def retained(self):
+        """Return the numbers of the versions still held, the current one
+        included, in order.
+        """
+        return sorted(self._retained.keys())
+
+
+    def render(self, name, references=None, extendwith=None, instrument=None, keys=None):
+        """Render the named template as it is in the current version.
+
+        See :py:meth:`Version.render`.
+
+        """
+        return self.pin().render(name, references, extendwith, instrument, keys)
+
+
+    def batch(self):
+        """Return a new :py:class:`Batch` to gather changes in.
+
+        Used in a with statement, the batch is committed if no exception is
+        raised.
+
+        """
+        return Batch(self)
+
+
+    def add(self, template):
+        """Add or replace a template on its own as a new version.
+
+        :returns: the new version number.
+
+        """
+        batch = self.batch()
+        batch.add(template)
+        return batch.commit()
+
+
+    def subscribe(self, callback):
+        """Call callback(version, names) after each commit.
+
+        The version is the new :py:class:`Version` and names the set of
+        template names added or changed by the batch.
+
+        """
+        self._lock.acquire()
+        try:
+            self._subscribers.append(callback)
+
+        finally:
+            self._lock.release()
+
+
+    def unsubscribe(self, callback):
+        """Stop calling a callback given to :py:meth:`subscribe`."""
+        self._lock.acquire()
+        try:
+            self._subscribers.remove(callback)
+
+        finally:
+            self._lock.release()
+
+
+    def _commit(self, added, changes):
+        """Apply a batch and make the new current version.
+
+        :param added: a dict of name to Template for the templates added.
+
+        :param changes: a list of (operation, name, arguments) in the order
+        they were made.
+
+        :returns: the new version number.
+
+        """
+        self._lock.acquire()
+        try:
+            templates = dict(self._current.templates)
+            templates.update(added)
+
+            # Work out every new content and references before publishing
+            # any, so a bad change leaves the store as it was.
+            contents = {}
+            references = {}
+            for operation, name, arguments in changes:
+                if name not in templates:
+                    raise KeyError("No template '%s' in the store!" % name)
+
+                if operation == 'references':
+                    references[name] = arguments[0]
+                    continue
+
+                if name not in contents:
+                    contents[name] = dict(templates[name].content)
+                content = contents[name]
+
+                if operation == 'set':
+                    content[arguments[0]] = arguments[1]
+                elif operation == 'update':
+                    content.update(arguments[0])
+                elif operation == 'remove':
+                    del content[arguments[0]]
+                else:
+                    if type(arguments[0]) != types.DictType:
+                        raise core.TemplateError("The content given is not a Dict!")
+                    contents[name] = dict(arguments[0])
+
+            names = sorted(set(contents) | set(references))
+            locked = dict([(id(templates[name]), templates[name]) for name in names])
+            locked = [locked[key] for key in sorted(locked)]
+            for template in locked:
+                template._lock.acquire()
+            try:
+                for name in names:
+                    templates[name]._publish(
+                        content=contents.get(name),
+                        references=references.get(name),
+                    )
+
+            finally:
+                for template in locked:
+                    template._lock.release()
+
+            if references or added:
+                # Once for the batch, however many templates it changed.
+                core._references_changed()
+
+            version = self._current = self._version(
+                self._current.number + 1, templates
+            )
+            subscribers = list(self._subscribers)
+
+        finally:
+            self._lock.release()
+
+        changed = set(names) | set(added)
+        for callback in subscribers:
+            callback(version, changed)
+
+        return version.number
+
+
+    def _version(self, number, templates):
+        version = Version(number, templates)
+        self._retained[number] = version
+        return version
+
+
+class Batch(object):
+    """Changes to several templates in the store, made in one go on commit.
+
+    Nothing is changed until :py:meth:`commit`. The changes are applied in
+    the order they were made. If any of them fails none are applied.
+
+    """
+    def __init__(self, store):
+        self.store = store
+        self.added = {}
+        self.changes = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+
+    def add(self, template):
+        """Add a template to the store, replacing any with the same name."""
+        self.added[template.name] = template
+
+
+    def set(self, name, key, value):
+        """Set a content key of the named template."""
+        self.changes.append(('set', name, (key, value)))
+
+
+    def update(self, name, content):
+        """Update the content keys of the named template from a dict."""
+        self.changes.append(('update', name, (content,)))
+
+
+    def remove(self, name, key):
+        """Remove a content key of the named template."""
+        self.changes.append(('remove', name, (key,)))
+
+
+    def replace(self, name, content):
+        """Replace all the content of the named template."""
+        self.changes.append(('replace', name, (content,)))
+
+
+    def set_references(self, name, references):
+        """Replace the references of the named template."""
+        self.changes.append(('references', name, (references,)))
+
+
+    def commit(self):
+        """Apply the changes as one new version.
+
+        KeyError is raised for a template or content key which isn't there.
+
+        :returns: the new version number.
+
+        """
+        returned = self.store._commit(self.added, self.changes)
+        self.added = {}
+        self.changes = []
+        return returned
+
+
+class Version(object):
+    """The templates in the store at one version.
+
+    The snapshot of every template is taken when the version is made. The
+    flattened references used to render each template are worked out on
+    first use and kept with the version, so a new version starts afresh.
+
+    """
+    def __init__(self, number, templates):
+        """
+        :param number: the version number.
+
+        :param templates: a dict of name to Template.
+
+        """
+        self.number = number
+        self.templates = templates
+        self.snapshots = dict([
+            (name, template.snapshot()) for name, template in templates.items()
+        ])
+        self._pinned = dict([
+            (id(template), self.snapshots[name])
+            for name, template in templates.items()
+        ])
+        self._names = dict([
+            (id(snapshot), name) for name, snapshot in self.snapshots.items()
+        ])
+        self._flattened = {}
+        self._traced = {}
+
+
+    def content(self, name):
+        """Return the content of the named template in this version."""
+        return self.snapshots[name].content
+
+
+    def render(self, name, references=None, extendwith=None, instrument=None, keys=None):
+        """Render the named template as it is in this version.
+
+        References to templates in the store are resolved against this
+        version. Other templates are pinned when the render starts, as for
+        Template.render.
+
+        The arguments are as for Template.render, apart from trace which
+        isn't supported.
+
+        """
+        if references is None:
+            references = {}
+        if extendwith is None:
+            extendwith = {}
+
+        returned = self._render(name, references, extendwith, instrument, keys)
+        template = self.templates[name]
+        if template.schema is not None:
+            template.check(returned, keys, self.snapshots[name])
+        return returned
+
+
+    def _render(self, name, references, extendwith, instrument, keys):
+        """Render the named template, without checking its schema."""
+        template = self.templates[name]
+        snapshot = self.snapshots[name]
+        items = snapshot.content.items()
+
+        reference_cache = {
+            'int': self._int_refs(name), 'ext': self._flatten(references)
+        }
+        reference_cache = utils.prefetch_providers(
+            items, extendwith, reference_cache
+        )
+
+        returned = utils.render(
+            items,
+            reference_cache=reference_cache,
+            extendwith=extendwith,
+            instrument=instrument,
+            name=name,
+            keys=keys,
+        )
+
+        extends = template.extends
+        if extends is not None:
+            if self.templates.get(extends.name) is extends:
+                base = self._render(extends.name, references, {}, instrument, keys)
+            else:
+                base = extends.render(references, instrument=instrument, keys=keys)
+
+            for key, value in base.items():
+                if key not in snapshot.content:
+                    returned[key] = value
+
+        return returned
+
+
+    def traced(self, name):
+        """Return the render of the named template, with no render time
+        references, and what each key used.
+
+        This is worked out once per version and kept. See :py:func:`diff_render`.
+
+        :returns: a :py:class:`Traced`.
+
+        """
+        traced = self._traced.get(name)
+        if traced is None:
+            rendered, checks = self._trace(name)
+            traced = self._traced[name] = Traced(rendered, checks)
+        return traced
+
+
+    def _trace(self, name, keys=None):
+        """Render the template recording what each top level key used.
+
+        :returns: (rendered dict, dict of key to its list of checks)
+
+        A check is (template name, None, key) for a content key of a template
+        or (template name, reference, attribute) for a reference followed
+        while rendering that template.
+
+        """
+        template = self.templates[name]
+        content = self.snapshots[name].content
+        items = content.items()
+
+        reference_cache = {'int': self._int_refs(name), 'ext': {}}
+        reference_cache = utils.prefetch_providers(items, {}, reference_cache)
+
+        tracer = provenance.Trace()
+        rendered, found = utils.render(
+            items,
+            reference_cache=reference_cache,
+            name=name,
+            trace=tracer,
+            keys=keys,
+        )
+
+        checks = dict([(key, [(name, None, key)]) for key in rendered])
+        for path, chain in found.items():
+            checks[tracer.tops[path]].extend([
+                (name, reference, attribute) for reference, attribute in chain
+            ])
+
+        extends = template.extends
+        if extends is not None:
+            if self.templates.get(extends.name) is extends:
+                base = self.traced(extends.name)
+                base_rendered, base_checks = base.rendered, base.checks
+            else:
+                # Outside the store, what it used isn't known.
+                base_rendered, base_checks = extends.render(keys=keys), None
+
+            for key, value in base_rendered.items():
+                if key in content or (keys is not None and key not in keys):
+                    continue
+                rendered[key] = value
+                if base_checks is None:
+                    checks[key] = [(name, None, key), UNKNOWN]
+                else:
+                    checks[key] = [(name, None, key)] + base_checks[key]
+
+        return rendered, checks
+
+
+    def _int_refs(self, name):
+        """The flattened references of the named template in this version."""
+        int_refs = self._flattened.get(name)
+        if int_refs is None:
+            snapshot = self.snapshots[name]
+            int_refs = self._flattened[name] = self._flatten(snapshot.references)
+        return int_refs
+
+
+    def _flatten(self, references):
+        """Flatten the references as build_ref_cache does, with the templates
+        swapped for their snapshots in this version.
+        """
+        returned = {}
+
+        def recover(items):
+            for name, source in items:
+                pinned = self._pinned.get(id(source))
+                if pinned is None and hasattr(source, 'snapshot'):
+                    pinned = source.snapshot()
+                if pinned is not None:
+                    source = pinned
+                returned[name] = source
+                if hasattr(source, 'references'):
+                    recover(source.references.items())
+
+        recover(references.items())
+        return returned
+
+
+class Traced(object):
+    """The render of a template in a version and what each key used.
+
+    'rendered' is the rendered dict and 'checks' a dict of top level key to
+    the list of checks made by :py:func:`diff_render`.
+
+    """
+    def __init__(self, rendered, checks):
+        self.rendered = rendered
+        self.checks = checks
+
+
+# A check which always fails, for keys where what was used isn't known:
+UNKNOWN = (None, None, None)
+
+
+def diff_render(old, new, names=None):
+    """Return what changed in the renders of the templates between versions.
+
+    Only the keys which used something that changed are rendered again.
+
+    :param old: the earlier :py:class:`Version`.
+
+    :param new: the later :py:class:`Version`.
+
+    :param names: the template names to compare, all of those in either
+    version by default.
+
+    :returns: a dict of template name to its list of changes, templates with
+    no changes are left out. Each change is (operation, path, old, new) with
+    operation 'changed', 'added' or 'removed' and None for the missing value.
+    The path is in the form used by :py:mod:`boaconstructor.provenance`.
+
+    """
+    if names is None:
+        names = set(old.templates) | set(new.templates)
+
+    changes = _Changes(old, new)
+    returned = {}
+    for name in _bases_first(names, new):
+        if name not in new.templates:
+            found = []
+            for key, value in old.traced(name).rendered.items():
+                found.append(('removed', key, value, None))
+
+        elif name not in old.templates:
+            found = []
+            for key, value in new.traced(name).rendered.items():
+                found.append(('added', key, None, value))
+
+        else:
+            found = _diff_template(name, old, new, changes)
+
+        if found:
+            returned[name] = sorted(found, key=lambda change: change[1])
+
+    return returned
+
+
+def _bases_first(names, version):
+    """Order the names so templates come after those they extend, letting
+    each use the new traced render of its base.
+    """
+    returned = []
+    seen = set()
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+        template = version.templates.get(name)
+        if template is not None and template.extends is not None:
+            base = template.extends.name
+            if version.templates.get(base) is template.extends:
+                visit(base)
+        if name in names:
+            returned.append(name)
+
+    for name in sorted(names):
+        visit(name)
+
+    return returned
+
+
+def _diff_template(name, old, new, changes):
+    """Re-render the keys which used something changed and diff them."""
+    before = old.traced(name)
+
+    affected = set(changes.keys(name))
+    template = new.templates[name]
+    while template.extends is not None and template.extends.name in new.templates:
+        # Keys the templates extended gained or lost:
+        affected.update(changes.keys(template.extends.name))
+        template = template.extends
+
+    for key, checks in before.checks.items():
+        if key not in affected and changes.affects(checks):
+            affected.add(key)
+
+    rendered = dict(before.rendered)
+    checks = dict(before.checks)
+    found = []
+    if affected:
+        partial, partial_checks = new._trace(name, keys=sorted(affected))
+        for key in affected:
+            if key in partial:
+                rendered[key] = partial[key]
+                checks[key] = partial_checks[key]
+            else:
+                rendered.pop(key, None)
+                checks.pop(key, None)
+
+            _diff(key, before.rendered.get(key, _MISSING), partial.get(key, _MISSING), found)
+
+    # What is known about this version's render is kept for the next diff:
+    if name not in new._traced:
+        new._traced[name] = Traced(rendered, checks)
+
+    return found
+
+
+_MISSING = object()
+
+
+def _diff(path, before, after, found):
+    """Add the changes between two rendered values to found."""
+    if before is after:
+        return
+
+    if after is _MISSING:
+        found.append(('removed', path, before, None))
+
+    elif before is _MISSING:
+        found.append(('added', path, None, after))
+
+    elif isinstance(before, dict) and isinstance(after, dict):
+        for key in set(before) | set(after):
+            _diff(
+                "%s.%s" % (path, key),
+                before.get(key, _MISSING), after.get(key, _MISSING), found
+            )
+
+    elif isinstance(before, list) and isinstance(after, list) and len(before) == len(after):
+        for index in range(len(before)):
+            _diff("%s[%d]" % (path, index), before[index], after[index], found)
+
+    elif type(before) is not type(after) or before != after:
+        found.append(('changed', path, before, after))
+
+
+class _Changes(object):
+    """What changed in the templates between two versions, worked out as it
+    is asked for.
+    """
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self._keys = {}
+
+
+    def keys(self, name):
+        """The content keys of the named template added, removed or changed.
+        """
+        keys = self._keys.get(name)
+        if keys is None:
+            before = self.old.snapshots.get(name)
+            after = self.new.snapshots.get(name)
+            if before is after:
+                keys = set()
+            elif before is None or after is None:
+                keys = ALL_KEYS
+            else:
+                before, after = before.content, after.content
+                keys = set([
+                    key for key in set(before) | set(after)
+                    if key not in before or key not in after
+                    or _differ(before[key], after[key])
+                ])
+            self._keys[name] = keys
+        return keys
+
+
+    def affects(self, checks):
+        """True if any of the checks for a key fails."""
+        for check in checks:
+            name, reference, attribute = check
+            if check is UNKNOWN:
+                return True
+
+            if reference is None:
+                if attribute in self.keys(name):
+                    return True
+                continue
+
+            if name not in self.new.templates:
+                return True
+
+            before = self.old._int_refs(name).get(reference)
+            after = self.new._int_refs(name).get(reference)
+            if before is after:
+                continue
+
+            source = self.old._names.get(id(before))
+            if source is None or source != self.new._names.get(id(after)):
+                # Now something else, or outside the store.
+                return True
+
+            keys = self.keys(source)
+            if keys and (attribute == provenance.ALL or attribute in keys):
+                return True
+
+        return False
+
+
+class _AllKeys(object):
+    """Stands in for every key of a template added or removed."""
+    def __contains__(self, key):
+        return True
+
+    def __iter__(self):
+        return iter(())
+
+    def __nonzero__(self):
+        return True
+
+
+ALL_KEYS = _AllKeys()
+
+
+def _differ(before, after):
+    return type(before) is not type(after) or before != after
@@ -0,0 +1,177 @@
+"""
+Tests to verify rendering with asynchronous reference providers.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import time
+import threading
+import unittest
+
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.asyncrender import ProviderPool
+
+
+class FakeProvider(object):
+    """An in-process provider which is slow and counts what it is asked for.
+    """
+    def __init__(self, data, delay=0.05):
+        self.data = data
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, attribute):
+        self.lock.acquire()
+        self.calls.append((name, attribute))
+        self.active += 1
+        self.most_active = max(self.most_active, self.active)
+        self.lock.release()
+
+        time.sleep(self.delay)
+
+        self.lock.acquire()
+        self.active -= 1
+        self.lock.release()
+
+        if attribute is None:
+            return dict(self.data)
+        if attribute not in self.data:
+            raise utils.AttributeError("No '%s' in '%s'" % (attribute, name))
+        return self.data[attribute]
+
+
+class AsyncRenderTests(unittest.TestCase):
+
+
+    def testConcurrentLookups(self):
+        """Test independent lookups are gathered and chains are followed.
+        """
+        kv = FakeProvider(dict(
+            timeout=42, region='eu', zone='kv.$.region', port=8080,
+        ))
+        common = Template('common', dict(retry='kv.$.port', keep='yes'))
+
+        host1 = Template('host1', {
+                'timeout': 'kv.$.timeout',
+                'region': 'kv.$.region',
+                'zone': 'kv.$.zone',
+                'retry': 'common.$.retry',
+                'all': 'common.*',
+                'names': ['kv.$.region', 'literal'],
+                'port': 80,
+            },
+            references=dict(common=common),
+        )
+
+        pool = ProviderPool(dict(kv=kv), workers=4)
+        try:
+            result = host1.render_async(pool).get(timeout=5)
+        finally:
+            pool.close()
+
+        self.assertEquals(result, {
+            'timeout': 42,
+            'region': 'eu',
+            'zone': 'eu',
+            'retry': 8080,
+            'all': dict(retry=8080, keep='yes'),
+            'names': ['eu', 'literal'],
+            'port': 80,
+        })
+
+        # Each key was only looked up once, in two rounds: zone points at
+        # region which was then already fetched.
+        self.assertEquals(
+            sorted(kv.calls),
+            sorted([('kv', 'timeout'), ('kv', 'region'), ('kv', 'zone'), ('kv', 'port')])
+        )
+        self.assertTrue(kv.most_active > 1)
+
+
+    def testInflightDeduplication(self):
+        """Test concurrent renders sharing a pool share in flight lookups.
+        """
+        kv = FakeProvider(dict(timeout=42), delay=0.2)
+        pool = ProviderPool(dict(kv=kv), workers=4)
+        try:
+            templates = [
+                Template('host%d' % i, dict(timeout='kv.$.timeout'))
+                for i in range(4)
+            ]
+            pending = [t.render_async(pool) for t in templates]
+            results = [p.get(timeout=5) for p in pending]
+        finally:
+            pool.close()
+
+        self.assertEquals(results, [dict(timeout=42)] * 4)
+        self.assertEquals(kv.calls, [('kv', 'timeout')])
+
+
+    def testErrorsAndPriority(self):
+        """Test provider errors are raised by get() and render time references
+        beat providers.
+        """
+        kv = FakeProvider(dict(timeout=42), delay=0)
+
+        host1 = Template('host1', dict(timeout='kv.$.missing'))
+        pending = host1.render_async(dict(kv=kv))
+        self.assertRaises(utils.AttributeError, pending.get, 5)
+        self.assertTrue(pending.ready())
+
+        host1 = Template('host1', dict(timeout='kv.$.timeout'))
+        result = host1.render_async(
+            dict(kv=kv), references=dict(kv=dict(timeout=1))
+        ).get(timeout=5)
+        self.assertEquals(result, dict(timeout=1))
+
+
+    def testSameAsRender(self):
+        """Test templates which extend others or have a schema render as
+        render() does.
+        """
+        from boaconstructor.schema import SchemaError
+
+        kv = FakeProvider(dict(timeout=42, region='eu'), delay=0)
+        base = Template('base', dict(region='kv.$.region', port=80))
+        host1 = Template('host1', dict(timeout='kv.$.timeout'), extends=base, schema=dict(timeout=int))
+
+        self.assertEquals(
+            host1.render_async(dict(kv=kv)).get(timeout=5),
+            host1.render(dict(kv=dict(timeout=42, region='eu'))),
+        )
+
+        host1.schema = dict(timeout=basestring)
+        self.assertRaises(SchemaError, host1.render_async(dict(kv=kv)).get, 5)
+
+
+    def testErrorTraceback(self):
+        """Test get() raises the worker's error with its traceback.
+        """
+        import sys
+        import traceback
+
+        host1 = Template('host1', dict(timeout='kv.$.missing'))
+        pending = host1.render_async(dict(kv=FakeProvider({}, delay=0)))
+        try:
+            pending.get(timeout=5)
+
+        except utils.AttributeError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+
+        self.assertTrue('_render' in [frame[2] for frame in frames])
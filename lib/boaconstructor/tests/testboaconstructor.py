@@ -567,3 +567,192 @@ correct:
         )
         correct = {"host":"4.3.2.1","flag":False,"timeout":42}
         self.assertEquals(result, correct)
+
+
+class ChunkedLists(unittest.TestCase):
+
+
+    def setUp(self):
+        self.saved = (utils.CHUNK_SIZE, utils.PARALLEL_THRESHOLD)
+        utils.CHUNK_SIZE = 10
+
+
+    def tearDown(self):
+        utils.CHUNK_SIZE, utils.PARALLEL_THRESHOLD = self.saved
+
+
+    def testChunksKeepOrder(self):
+        """Test long lists resolve the same as short ones, in the same order.
+        """
+        common = Template('common', dict(a=1, b=dict(c=2)))
+        items = []
+        for i in range(95):
+            if i % 30 == 0:
+                items.append('common.$.a')
+            elif i == 47:
+                items.append('common.*')
+            elif i == 61:
+                items.append(['common.$.a', 3])
+            else:
+                items.append(i)
+        host = Template('host', dict(items=items, fixed=tuple(range(40))), references=dict(common=common))
+
+        correct = list(items)
+        for i in (0, 30, 60, 90):
+            correct[i] = 1
+        correct[47] = dict(a=1, b=dict(c=2))
+        correct[61] = [1, 3]
+
+        result = host.render()
+        self.assertEquals(result['items'], correct)
+        self.assertEquals(result['fixed'], list(range(40)))
+
+        # Only the chunks with references were resolved:
+        self.assertEquals(utils._scan(items, 10), [0, 30, 40, 60, 90])
+        self.assertEquals(utils._scan(tuple(range(40)), 10), [])
+
+        # The same again in the thread pool:
+        utils.PARALLEL_THRESHOLD = 20
+        self.assertEquals(host.render()['items'], correct)
+
+
+    def testChunkErrors(self):
+        """Test errors resolving a chunk in the pool are raised.
+        """
+        utils.PARALLEL_THRESHOLD = 1
+        items = list(range(50))
+        items[5] = 'common.$.a'
+        items[35] = 'missing.$.a'
+        host = Template('host', dict(items=items), references=dict(common=dict(a=1)))
+        self.assertRaises(utils.ReferenceError, host.render)
+
+
+    def testScanFollowsLength(self):
+        """Test a list grown since it was scanned is scanned again.
+        """
+        items = list(range(30))
+        self.assertEquals(utils._scan(items, 10), [])
+        items.append('common.$.a')
+        self.assertEquals(utils._scan(items, 10), [30])
+
+
+    def testScanFollowsContent(self):
+        """Test a list changed in place at the same length is scanned again.
+        """
+        items = list(range(30))
+        host = Template('host', dict(items=items), references=dict(common=dict(x=1)))
+        self.assertEquals(host.render()['items'], list(range(30)))
+
+        items[5] = 'common.$.x'
+        host.changed()
+        correct = list(range(30))
+        correct[5] = 1
+        self.assertEquals(host.render()['items'], correct)
+
+
+class LazyValues(unittest.TestCase):
+
+
+    def testOnlyRenderedKeysAreCalled(self):
+        """Test Lazy factories are only called for the keys rendered.
+        """
+        called = []
+
+        def names():
+            called.append('names')
+            return ['common.$.a', 'b']
+
+        def broken():
+            raise AssertionError("Shouldn't be called!")
+
+        common = Template('common', dict(a=1, lazy=boaconstructor.Lazy(lambda: 'from common')))
+        host = Template('host', dict(
+                names=boaconstructor.Lazy(names),
+                broken=boaconstructor.Lazy(broken),
+                other='common.$.lazy',
+            ),
+            references=dict(common=common),
+        )
+
+        self.assertEquals(host.render(keys=['names', 'other']), dict(names=[1, 'b'], other='from common'))
+        self.assertEquals(called, ['names'])
+
+        self.assertEquals(dict(host.iter_render(keys=['other'])), dict(other='from common'))
+        self.assertEquals(called, ['names'])
+
+
+    def testStreaming(self):
+        """Test generators are resolved as they are read by iter_render.
+        """
+        read = []
+
+        def rows():
+            for i in range(3):
+                read.append(i)
+                yield 'common.$.a'
+
+        common = Template('common', dict(a=1))
+        base = Template('base', dict(port=80, host='base'))
+        host = Template('host', dict(
+                rows=boaconstructor.Lazy(rows),
+                host='1.2.3.4',
+            ),
+            references=dict(common=common),
+            extends=base,
+        )
+
+        rendered = host.iter_render(extendwith=dict(port=8080, extra='e'))
+        found = dict(rendered)
+        self.assertEquals(read, [])
+        self.assertEquals(found['host'], '1.2.3.4')
+        self.assertEquals(found['port'], 80)
+        self.assertEquals(found['extra'], 'e')
+
+        rows = found['rows']
+        self.assertEquals(rows.next(), 1)
+        self.assertEquals(read, [0])
+        self.assertEquals(list(rows), [1, 1])
+
+        # render() gives the same as a list:
+        self.assertEquals(host.render()['rows'], [1, 1, 1])
+
+
+    def testFingerprintFollowsLazy(self):
+        """Test output_fingerprint changes when what a Lazy gives does.
+        """
+        current = [1]
+        common = Template('common', dict(a=boaconstructor.Lazy(lambda: current[0])))
+        host = Template('host', dict(a='common.$.a'), references=dict(common=common))
+        own = Template('own', dict(a=boaconstructor.Lazy(lambda: current[0])))
+
+        before = (host.output_fingerprint(), own.output_fingerprint())
+        self.assertEquals(before, (host.output_fingerprint(), own.output_fingerprint()))
+
+        current[0] = 2
+        self.assertEquals(host.render(), dict(a=2))
+        self.assertNotEquals(host.output_fingerprint(), before[0])
+        self.assertNotEquals(own.output_fingerprint(), before[1])
+
+
+    def testPrefetchDoesntCall(self):
+        """Test a Lazy is called once per render when providers are prefetched.
+        """
+        from boaconstructor.providers import Provider
+
+        class DictProvider(Provider):
+            def fetch_many(self, attributes):
+                return dict([(a, 'db-' + a) for a in attributes or ['a']])
+
+        called = []
+
+        def factory():
+            called.append(1)
+            return 'db.$.a'
+
+        host = Template('host', dict(
+                value=boaconstructor.Lazy(factory), other='db.$.b',
+            ),
+            references=dict(db=DictProvider()),
+        )
+        self.assertEquals(host.render(), dict(value='db-a', other='db-b'))
+        self.assertEquals(called, [1])
@@ -0,0 +1,156 @@
+"""
+Tests to verify bulk rendering from a parameter table.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from boaconstructor import Template
+from boaconstructor.bulk import iter_rows
+from boaconstructor.bulk import render_rows
+
+
+class CountingDict(dict):
+    """A dict reference noting the keys looked up in it.
+    """
+    looked_up = []
+
+    def __getitem__(self, key):
+        self.looked_up.append(key)
+        return dict.__getitem__(self, key)
+
+
+class BulkTests(unittest.TestCase):
+
+
+    def testRenderRows(self):
+        """Test rendering rows, with only the parameter keys re-resolved.
+        """
+        CountingDict.looked_up = []
+        common = CountingDict(timeout=30, region='eu')
+
+        webserver = Template('webserver', dict(
+            host='<per row>',
+            port=80,
+            url='webserver.$.host',
+            timeout='common.$.timeout',
+            region='params.$.region',
+        ))
+
+        table = dict(
+            host=['a.example.com', 'b.example.com', 'c.example.com'],
+            port=[80, 8080, 'common.$.timeout'],
+            region=['eu', 'us', 'common.$.region'],
+        )
+
+        rows = render_rows(
+            webserver,
+            table,
+            references={'webserver': webserver, 'common': common},
+            extendwith=dict(email='admin@example.com'),
+        )
+
+        self.assertEquals(rows, [
+            dict(host='a.example.com', port=80, url='a.example.com',
+                 timeout=30, region='eu', email='admin@example.com'),
+            dict(host='b.example.com', port=8080, url='b.example.com',
+                 timeout=30, region='us', email='admin@example.com'),
+            dict(host='c.example.com', port=30, url='c.example.com',
+                 timeout=30, region='eu', email='admin@example.com'),
+        ])
+
+        # The shared timeout was only worked out once, the rest by row 3:
+        self.assertEquals(sorted(CountingDict.looked_up), ['region', 'timeout', 'timeout'])
+
+        # The same as rendering a template per row:
+        for index, row in enumerate(rows):
+            content = dict(webserver.content)
+            for column in table:
+                content[column] = table[column][index]
+            single = Template('webserver', content)
+            self.assertEquals(
+                single.render(
+                    {'webserver': single, 'common': common},
+                    extendwith=dict(email='admin@example.com'),
+                ),
+                row
+            )
+
+        self.assertRaises(ValueError, render_rows, webserver, dict(a=[1], b=[]))
+
+
+    def testCSVRows(self):
+        """Test the rows read lazily from a CSV file.
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'hosts.csv')
+            fd = open(filename, 'wb')
+            fd.write("host,port\na.example.com,80\nb.example.com,8080\n")
+            fd.close()
+
+            webserver = Template('webserver', dict(host='', port=0, keep='yes'))
+            rows = iter_rows(webserver, filename)
+            self.assertEquals(
+                next(rows), dict(host='a.example.com', port='80', keep='yes')
+            )
+            self.assertEquals(
+                list(rows), [dict(host='b.example.com', port='8080', keep='yes')]
+            )
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+    def testExtendsAndSchema(self):
+        """Test rows of a template extending a base and with a schema match
+        rendering a template per row.
+        """
+        from boaconstructor.schema import Schema
+        from boaconstructor.schema import SchemaError
+
+        base = Template('base', dict(port=80, zone='eu', timeout=30))
+        webserver = Template(
+            'webserver',
+            dict(host='<per row>', port='base.$.timeout'),
+            references={'base': base},
+            extends=base,
+            schema=Schema(dict(host=str, port=int, zone=str)),
+        )
+
+        table = dict(host=['a.example.com', 'b.example.com'], zone=['us', 'eu'])
+        rows = render_rows(webserver, table)
+
+        for index, row in enumerate(rows):
+            content = dict(webserver.content)
+            for column in table:
+                content[column] = table[column][index]
+            single = Template(
+                'webserver', content, webserver.references, base, webserver.schema
+            )
+            self.assertEquals(single.render(), row)
+
+        self.assertEquals(rows[0], dict(
+            host='a.example.com', port=30, zone='us', timeout=30
+        ))
+
+        # The row values are checked against the schema:
+        self.assertRaises(
+            SchemaError, render_rows, webserver, dict(host=['a', 5])
+        )
@@ -0,0 +1,163 @@
+"""
+Tests to verify the bounded caches.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import time
+import unittest
+
+from boaconstructor import cache
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.providers import Provider
+
+
+class DictProvider(Provider):
+    """A dict backed provider counting each fetch_many call.
+    """
+    def __init__(self, data, **kwargs):
+        Provider.__init__(self, **kwargs)
+        self.data = data
+        self.calls = 0
+
+    def fetch_many(self, attributes):
+        self.calls += 1
+        if attributes is None:
+            return dict(self.data)
+        return dict([(a, self.data[a]) for a in attributes if a in self.data])
+
+
+class CacheTests(unittest.TestCase):
+
+
+    def testLeastRecentlyUsedEvicted(self):
+        """Test the least recently used entry goes when there are too many.
+        """
+        c = cache.Cache('test', max_entries=3)
+        for key in 'abc':
+            c.put(key, key.upper())
+
+        self.assertEquals(c.get('a'), 'A')
+        c.put('d', 'D')
+
+        self.assertEquals(c.get('b'), None)
+        self.assertEquals([key for key, value in c.items()], ['c', 'a', 'd'])
+
+        stats = c.stats()
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['evictions'], 1)
+        self.assertEquals(stats['entries'], 3)
+
+
+    def testByteLimit(self):
+        """Test entries are evicted to stay inside max_bytes.
+        """
+        c = cache.Cache('test', max_bytes=100, sizeof=lambda key, value: len(value))
+        c.put('a', 'x' * 40)
+        c.put('b', 'x' * 40)
+        c.put('c', 'x' * 40)
+
+        self.assertEquals(sorted([key for key, value in c.items()]), ['b', 'c'])
+        self.assertEquals(c.stats()['bytes'], 80)
+
+        # Too big to hold at all:
+        c.put('d', 'x' * 101)
+        self.assertEquals('d' in c, False)
+        self.assertEquals(len(c), 2)
+
+        c.configure(max_bytes=50)
+        self.assertEquals([key for key, value in c.items()], ['c'])
+        self.assertEquals(c.stats()['evictions'], 2)
+
+
+    def testTimeToLive(self):
+        """Test entries expire after the ttl.
+        """
+        c = cache.Cache('test', ttl=0.05)
+        c.put('a', 1)
+        self.assertEquals(c.get('a'), 1)
+
+        time.sleep(0.1)
+        self.assertEquals(c.get('a'), None)
+        self.assertEquals(c.stats()['expired'], 1)
+        self.assertEquals(len(c), 0)
+
+
+    def testRegistered(self):
+        """Test the chunk_scan cache is registered and configurable.
+        """
+        scanned = cache.get_cache('chunk_scan')
+        limit = scanned.max_entries
+        try:
+            cache.configure('chunk_scan', max_entries=1)
+            scanned.reset_stats()
+
+            size = utils.CHUNK_SIZE * 2
+            for name in ('host1', 'host2'):
+                Template(name, dict(
+                    values=range(size) + ['common.$.a']
+                )).render(references=dict(common=dict(a=1)))
+
+            stats = cache.stats()['chunk_scan']
+            self.assertEquals(stats['entries'], 1)
+            self.assertEquals(stats['evictions'] > 0, True)
+
+        finally:
+            cache.configure('chunk_scan', max_entries=limit)
+
+
+    def testParsedReferences(self):
+        """Test only reference strings are kept parsed, up to the limit.
+        """
+        limit = utils._PARSED_LIMIT
+        try:
+            utils._PARSED.clear()
+            Template('host1', dict(
+                a='common.$.a', b='common.$.b', plain='just text'
+            )).render(references=dict(common=dict(a=1, b=2)))
+            self.assertEquals(
+                sorted(utils._PARSED.keys()), ['common.$.a', 'common.$.b']
+            )
+
+            # Emptied when full:
+            utils._PARSED_LIMIT = 2
+            Template('host1', dict(
+                c='common.$.c'
+            )).render(references=dict(common=dict(c=3)))
+            self.assertEquals(utils._PARSED.keys(), ['common.$.c'])
+
+        finally:
+            utils._PARSED_LIMIT = limit
+
+
+    def testProviderCacheLimited(self):
+        """Test a provider's cache is limited and all-inclusions still see
+        everything after evictions.
+        """
+        db = DictProvider(dict(a=1, b=2, c=3), ttl=60, max_entries=2)
+
+        self.assertEquals(db.get_many(None), dict(a=1, b=2, c=3))
+        self.assertEquals(db.calls, 1)
+        self.assertEquals(len(db.cache), 2)
+
+        # Not everything could be held so it is fetched again:
+        self.assertEquals(db.get_many(None), dict(a=1, b=2, c=3))
+        self.assertEquals(db.calls, 2)
+
+        key, value = db.cache.items()[-1]
+        self.assertEquals(db.get_many([key]), {key: value})
+        self.assertEquals(db.calls, 2)
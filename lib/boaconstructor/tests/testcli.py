@@ -0,0 +1,160 @@
+"""
+Tests to verify the boaconstructor command.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from boaconstructor import cli
+from boaconstructor import codec
+
+
+class CliTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.write('common', dict(timeout=42, hosts=['a', 'b']))
+        self.write('host1', dict(host='1.2.3.4', timeout='common.$.timeout', all='common.*'))
+        self.write('host2', dict(timeout='host1.$.timeout', port=80))
+        self.write('alone', dict(name='alone'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.cache)
+
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, "%s.json" % name)
+        stream = open(path, 'w')
+        try:
+            json.dump(content, stream)
+
+        finally:
+            stream.close()
+
+        # Make sure the change is seen, whatever the mtime resolution:
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+    def testRender(self):
+        """Test every template in the directory is rendered.
+        """
+        rendered, errors, stats = cli.run(self.directory)
+        self.assertEquals(errors, {})
+        self.assertEquals(sorted(rendered), ['alone', 'common', 'host1', 'host2'])
+        self.assertEquals(rendered['host2'], dict(timeout=42, port=80))
+        self.assertEquals(rendered['host1']['all'], dict(timeout=42, hosts=['a', 'b']))
+
+        rendered, errors, stats = cli.run(self.directory, ['host1'], keys=['timeout'])
+        self.assertEquals(rendered, dict(host1=dict(timeout=42)))
+
+        rendered, errors, stats = cli.run(self.directory, ['host2', 'missing'], jobs=2)
+        self.assertEquals(rendered, dict(host2=dict(timeout=42, port=80)))
+        self.assertEquals(errors.keys(), ['missing'])
+
+
+    def testCache(self):
+        """Test unchanged renders come from the cache without parsing.
+        """
+        rendered, errors, stats = cli.run(self.directory, cache_dir=self.cache)
+        self.assertEquals((stats['parsed'], stats['rendered'], stats['cached']), (4, 4, 0))
+
+        again, errors, stats = cli.run(self.directory, cache_dir=self.cache)
+        self.assertEquals(again, rendered)
+        self.assertEquals((stats['parsed'], stats['rendered'], stats['cached']), (0, 0, 4))
+
+        # Only those using common are rendered again, only common is parsed:
+        self.write('common', dict(timeout=30, hosts=[]))
+        rendered, errors, stats = cli.run(self.directory, cache_dir=self.cache)
+        self.assertEquals((stats['parsed'], stats['rendered'], stats['cached']), (1, 3, 1))
+        self.assertEquals(rendered['host2']['timeout'], 30)
+
+        # Projections of a cached render are taken from it:
+        rendered, errors, stats = cli.run(self.directory, ['host1'], ['host'], cache_dir=self.cache)
+        self.assertEquals(rendered, dict(host1=dict(host='1.2.3.4')))
+        self.assertEquals(stats['cached'], 1)
+
+        # Only the renders asked for are decoded, not the whole cache:
+        loads = codec.loads
+        decoded = []
+        codec.loads = lambda data: decoded.append(data) or loads(data)
+        try:
+            rendered, errors, stats = cli.run(self.directory, ['host2'], cache_dir=self.cache)
+
+        finally:
+            codec.loads = loads
+
+        self.assertEquals(rendered['host2']['timeout'], 30)
+        self.assertEquals((stats['parsed'], stats['rendered'], stats['cached']), (0, 0, 1))
+        self.assertEquals(decoded, [])
+
+
+    def testErrors(self):
+        """Test problems are reported for the templates they stop rendering.
+        """
+        self.write('host2', dict(timeout='nothere.$.timeout'))
+        self.write('broken', [1, 2])
+        rendered, errors, stats = cli.run(self.directory, ['host1', 'host2', 'broken'])
+        self.assertEquals(sorted(rendered), ['host1'])
+        self.assertEquals(errors, {
+            'host2': "The reference 'nothere' could not be resolved!",
+            'broken': "The content given is not a Dict!",
+        })
+        self.assertEquals(stats['failed'], 2)
+
+
+    def testMain(self):
+        """Test the command writes the renders out.
+        """
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            output = os.path.join(self.cache, 'out')
+            code = cli.main([self.directory, '--output', output, '--keys', 'timeout,port', '--no-cache'])
+            self.assertEquals(code, 0)
+            self.assertEquals(sorted(os.listdir(output)), [
+                'alone.json', 'common.json', 'host1.json', 'host2.json'
+            ])
+            stream = open(os.path.join(output, 'host2.json'))
+            try:
+                self.assertEquals(json.load(stream), dict(timeout=42, port=80))
+
+            finally:
+                stream.close()
+
+            self.assertEquals(cli.main([self.directory, 'missing', '--output', output, '--no-cache']), 1)
+            self.assertEquals(sys.stdout.getvalue(), '')
+            self.assertEquals(
+                sys.stderr.getvalue(), "missing: There is no template 'missing'!\n"
+            )
+
+            # Without an output directory the render is printed:
+            code = cli.main([self.directory, 'host2', '--keys', 'port', '--no-cache'])
+            self.assertEquals(code, 0)
+            self.assertEquals(json.loads(sys.stdout.getvalue()), dict(port=80))
+
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
@@ -0,0 +1,90 @@
+"""
+Tests to verify the binary encoding of rendered dicts.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import codec
+
+
+class CodecTests(unittest.TestCase):
+
+
+    def testRoundTrip(self):
+        """Test values come back as they went in, types included.
+        """
+        value = {
+            u'host': u'1.2.3.4',
+            'name': 'host1',
+            u'caf\xe9': u'\u2603',
+            'ports': [80, 8080, -1, 2 ** 40],
+            'big': 2 ** 70,
+            'negative': -2 ** 70,
+            'long': long(3),
+            'weight': 0.25,
+            'flags': (True, False, None),
+            'nested': {u'a': [u'1.2.3.4', {1: (2, 3)}], (1, 'x'): 'y'},
+            'empty': {},
+        }
+        decoded = codec.loads(codec.dumps(value))
+        self.assertEquals(decoded, value)
+        self.assertEquals(type(decoded['name']), str)
+        self.assertEquals(type(decoded[u'host']), unicode)
+        self.assertEquals(type(decoded['long']), long)
+        self.assertEquals(type(decoded['ports'][0]), int)
+        self.assertEquals(type(decoded['flags']), tuple)
+
+        for other in (None, 1, [u'a', 'a'], {1: 2}, (), u''):
+            self.assertEquals(codec.loads(codec.dumps(other)), other)
+
+
+    def testStringTable(self):
+        """Test repeated strings are only stored once.
+        """
+        one = codec.dumps([u'a long repeated value'])
+        many = codec.dumps([u'a long repeated value'] * 100)
+        self.assertEquals(many.count('a long repeated value'), 1)
+        self.assertEquals(len(many) - len(one), 99 * 5)
+
+
+    def testLoadKey(self):
+        """Test single keys are decoded from the index.
+        """
+        value = dict([(u'key%d' % i, dict(value=i, name=u'n%d' % i)) for i in range(100)])
+        value[u'caf\xe9'] = u'x'
+        data = codec.dumps(value)
+        for i in range(100):
+            self.assertEquals(codec.load_key(data, u'key%d' % i), value[u'key%d' % i])
+        self.assertEquals(codec.load_key(data, 'key5'), value[u'key5'])
+        self.assertEquals(codec.load_key(data, u'caf\xe9'), u'x')
+        self.assertEquals(codec.load_key(data, u'missing', 'default'), 'default')
+        self.assertRaises(KeyError, codec.load_key, data, u'missing')
+        self.assertRaises(codec.CodecError, codec.load_key, codec.dumps([1]), u'key1')
+
+        self.assertEquals(
+            codec.load_keys(data, [u'key3', 'key5', u'missing']),
+            {u'key3': value[u'key3'], 'key5': value[u'key5']},
+        )
+
+
+    def testErrors(self):
+        """Test what can't be encoded or decoded raises CodecError.
+        """
+        self.assertRaises(codec.CodecError, codec.dumps, dict(a=object()))
+        self.assertRaises(codec.CodecError, codec.loads, 'not encoded')
+        data = codec.dumps(dict(a=[1, 2, 3]))
+        self.assertRaises(codec.CodecError, codec.loads, data[:-3])
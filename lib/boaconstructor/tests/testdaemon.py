@@ -0,0 +1,200 @@
+"""
+Tests to verify the template directory and the render daemon.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+
+from boaconstructor import core
+from boaconstructor import cache
+from boaconstructor import utils
+from boaconstructor.daemon import RenderClient
+from boaconstructor.daemon import RenderServer
+from boaconstructor.directory import TemplateDirectory
+
+
+def write(directory, name, content):
+    path = os.path.join(directory, "%s.json" % name)
+    stream = open(path, 'w')
+    try:
+        json.dump(content, stream)
+
+    finally:
+        stream.close()
+
+    # Make sure the change is seen, whatever the mtime resolution:
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+class DirectoryTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write(self.directory, 'common', dict(timeout=42))
+        write(self.directory, 'host1', dict(timeout='common.$.timeout', port=80))
+        write(self.directory, 'host2', dict(port=8080))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testRefresh(self):
+        """Test only changed files are loaded again and only the renders
+        using them are done again.
+        """
+        conf = TemplateDirectory(self.directory)
+        self.assertEquals(conf.names(), ['common', 'host1', 'host2'])
+        host1 = conf.render('host1')
+        host2 = conf.render('host2')
+        self.assertEquals(host1, dict(timeout=42, port=80))
+        self.assertTrue(conf.render('host1') is host1)
+
+        self.assertEquals(conf.refresh(), set())
+        write(self.directory, 'common', dict(timeout=30))
+        write(self.directory, 'broken', [])
+        self.assertEquals(conf.refresh(), set(['common', 'broken']))
+        self.assertEquals(conf.errors, dict(broken="The content given is not a Dict!"))
+
+        self.assertEquals(conf.render('host1'), dict(timeout=30, port=80))
+        self.assertTrue(conf.render('host2') is host2)
+
+        os.remove(os.path.join(self.directory, 'common.json'))
+        self.assertEquals(conf.refresh(), set(['common']))
+        self.assertRaises(utils.ReferenceError, conf.render, 'host1')
+        self.assertRaises(core.TemplateError, conf.render, 'broken')
+
+
+    def testRendersLimited(self):
+        """Test only max_renders renders are kept, however many projections
+        are asked for.
+        """
+        conf = TemplateDirectory(self.directory, max_renders=2)
+        for keys in (['port'], ['timeout'], ['port', 'timeout'], None):
+            conf.render('host1', keys)
+        self.assertEquals(len(conf._renders), 2)
+
+        # Those forgotten are rendered again when asked for:
+        self.assertEquals(conf.render('host1', ['port']), dict(port=80))
+        self.assertEquals(len(conf._renders), 2)
+
+        # The registered cache can be seen and limited by name:
+        self.assertEquals(cache.stats()['directory_renders']['entries'], 2)
+        cache.configure('directory_renders', max_entries=1)
+        self.assertEquals(len(conf._renders), 1)
+
+        server = RenderServer(
+            os.path.join(self.directory, 'render.sock'), conf, max_responses=1
+        )
+        try:
+            server._render('host1', ['port'])
+            server._render('host2', None)
+            self.assertEquals(len(server._responses), 1)
+            self.assertEquals(
+                cache.stats()['daemon_responses']['max_entries'], 1
+            )
+
+        finally:
+            server.server_close()
+
+
+class DaemonTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write(self.directory, 'common', dict(timeout=42, hosts=['a', 'b']))
+        write(self.directory, 'host1', dict(timeout='common.$.timeout', port=80))
+        write(self.directory, 'host2', dict(port=8080, missing='common.$.nothere'))
+
+        self.path = os.path.join(self.directory, 'render.sock')
+        self.server = RenderServer(self.path, self.directory, interval=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs=dict(poll_interval=0.05))
+        self.thread.start()
+        self.client = RenderClient(self.path, connections=2)
+
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+
+    def testRender(self):
+        """Test renders and errors come back as from rendering in process.
+        """
+        client = self.client
+        self.assertEquals(client.names(), ['common', 'host1', 'host2'])
+        self.assertEquals(client.render('host1'), dict(timeout=42, port=80))
+        self.assertEquals(client.render('host1', keys=['port']), dict(port=80))
+        self.assertEquals(client.render('host2', keys=['port']), dict(port=8080))
+        self.assertRaises(utils.AttributeError, client.render, 'host2')
+        self.assertRaises(core.TemplateError, client.render, 'host3')
+
+        # The connection is still usable after errors:
+        self.assertEquals(client.render('common', ['timeout']), dict(timeout=42))
+
+
+    def testPipelined(self):
+        """Test many requests sent at once are answered in order.
+        """
+        requests = ['host1', ('host2', ['port']), 'common'] * 50
+        expected = [
+            dict(timeout=42, port=80), dict(port=8080), dict(timeout=42, hosts=['a', 'b'])
+        ] * 50
+        self.assertEquals(self.client.render_many(requests), expected)
+
+        self.assertRaises(utils.AttributeError, self.client.render_many, ['host1', 'host2'])
+
+
+    def testConcurrent(self):
+        """Test threads share the pooled connections.
+        """
+        failures = []
+
+        def work():
+            try:
+                for i in range(50):
+                    if self.client.render('host1') != dict(timeout=42, port=80):
+                        failures.append('wrong')
+            except Exception as error:
+                failures.append(error)
+
+        threads = [threading.Thread(target=work) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(failures, [])
+        self.assertTrue(len(self.client._idle) <= 2)
+
+
+    def testChanges(self):
+        """Test changed files are picked up.
+        """
+        self.assertEquals(self.client.render('host1'), dict(timeout=42, port=80))
+        write(self.directory, 'common', dict(timeout=5))
+        self.assertEquals(self.client.render('host1'), dict(timeout=5, port=80))
@@ -0,0 +1,119 @@
+"""
+Tests to verify the content and output fingerprints.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+from boaconstructor import fingerprint
+from boaconstructor.providers import EnvironProvider
+
+
+class CountingTemplate(Template):
+    """A Template counting the times it is rendered.
+    """
+    def __init__(self, *args, **kwargs):
+        Template.__init__(self, *args, **kwargs)
+        self.renders = 0
+
+    def render(self, *args, **kwargs):
+        self.renders += 1
+        return Template.render(self, *args, **kwargs)
+
+
+class FingerprintTests(unittest.TestCase):
+
+
+    def testContentFingerprint(self):
+        """Test the fingerprint follows the content and is kept up to date
+        by set, update and remove.
+        """
+        host1 = Template('host1', dict(a=1, b=[1, 2], c=dict(d='x')))
+        same = Template('same', dict(c=dict(d='x'), b=[1, 2], a=1))
+        original = host1.fingerprint()
+        self.assertEquals(original, same.fingerprint())
+        self.assertEquals(len(original), 32)
+
+        host1.set('a', 2)
+        self.assertNotEquals(host1.fingerprint(), original)
+        self.assertEquals(
+            host1.digest(), fingerprint.content_digest(host1.content)
+        )
+
+        host1.update(dict(a=1, e=True))
+        host1.remove('e')
+        self.assertEquals(host1.fingerprint(), original)
+
+        # Types matter:
+        self.assertNotEquals(
+            Template('x', dict(a=1)).fingerprint(),
+            Template('x', dict(a=1.0)).fingerprint(),
+        )
+
+        # In place changes are picked up after changed():
+        host1.content['a'] = 5
+        host1.changed()
+        self.assertEquals(
+            host1.digest(), fingerprint.content_digest(dict(a=5, b=[1, 2], c=dict(d='x')))
+        )
+
+
+    def testOutputFingerprint(self):
+        """Test the output fingerprint only changes with what was used.
+        """
+        common = Template('common', dict(timeout=42, ntp='ntp1'))
+        unused = Template('unused', dict(x=1))
+        host1 = CountingTemplate('host1', dict(timeout='common.$.timeout'),
+            references=dict(common=common, unused=unused),
+        )
+
+        etag = host1.output_fingerprint()
+        self.assertEquals(host1.renders, 1)
+
+        # Nothing used has changed, no render is needed:
+        unused.set('x', 2)
+        self.assertEquals(host1.output_fingerprint(), etag)
+        self.assertEquals(host1.renders, 1)
+
+        common.set('ntp', 'ntp2')
+        changed = host1.output_fingerprint()
+        self.assertNotEquals(changed, etag)
+        self.assertEquals(host1.renders, 2)
+
+        # A render time reference standing in for common:
+        other = Template('other', dict(timeout=42, ntp='ntp2'))
+        self.assertNotEquals(
+            host1.output_fingerprint(references=dict(common=other)), changed
+        )
+
+        # Changing the template itself:
+        host1.set('port', 80)
+        self.assertNotEquals(host1.output_fingerprint(), changed)
+
+
+    def testProvidersUseOutput(self):
+        """Test references which can't be fingerprinted use the output.
+        """
+        environ = dict(HOME='/home/bob')
+        host1 = Template('host1', dict(home='env.$.HOME'),
+            references=dict(env=EnvironProvider(environ=environ)),
+        )
+        etag = host1.output_fingerprint()
+        self.assertEquals(etag, host1.output_fingerprint())
+
+        environ['HOME'] = '/home/alice'
+        self.assertNotEquals(etag, host1.output_fingerprint())
@@ -0,0 +1,110 @@
+"""
+Tests to verify the reverse reference index.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+from boaconstructor.index import ConsumerIndex
+from boaconstructor.store import TemplateStore
+
+
+class IndexTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(timeout=42, retries=3))
+        self.host1 = Template('host1', {
+                'timeout': 'common.$.timeout',
+                'checks': ['common.$.retries', 'ping'],
+            },
+            references=dict(common=self.common),
+        )
+        # Refers to host1 under another name:
+        self.host2 = Template('host2', {
+                'timeout': 'host.$.timeout',
+                'copy': 'host.*',
+            },
+            references=dict(host=self.host1),
+        )
+        self.child = Template('child', dict(port=80), extends=self.host1)
+        self.index = ConsumerIndex(
+            [self.common, self.host1, self.host2, self.child]
+        )
+
+
+    def testDirect(self):
+        """Test the keys using an attribute directly are found.
+        """
+        index = self.index
+        self.assertEquals(index.consumers('common', 'timeout'), set([('host1', 'timeout')]))
+        self.assertEquals(index.consumers('common', 'retries'), set([('host1', 'checks')]))
+        self.assertEquals(index.consumers('host1', 'timeout'), set([
+            ('host2', 'timeout'), ('host2', 'copy'),
+        ]))
+        self.assertEquals(index.consumers('host1', '*'), set([('host2', 'copy')]))
+        self.assertEquals(index.consumers('common', 'missing'), set())
+
+
+    def testTransitive(self):
+        """Test the keys using the keys which use an attribute are found.
+        """
+        self.assertEquals(self.index.consumers('common', 'timeout', transitive=True), set([
+            ('host1', 'timeout'),
+            ('host2', 'timeout'),
+            ('host2', 'copy'),
+            ('child', 'timeout'),
+        ]))
+
+
+    def testUpdate(self):
+        """Test the index follows changes to content and references.
+        """
+        index = self.index
+        self.host1.set('timeout', 30)
+        index.update(self.host1)
+        self.assertEquals(index.consumers('common', 'timeout'), set())
+        self.assertEquals(
+            index.consumers('host1', 'timeout', transitive=True),
+            set([('host2', 'timeout'), ('host2', 'copy'), ('child', 'timeout')])
+        )
+
+        # host2's 'host' is now common:
+        self.host2.references = dict(host=self.common)
+        index.update(self.host2)
+        self.assertEquals(index.consumers('host1', 'timeout'), set())
+        self.assertEquals(index.consumers('common', 'timeout'), set([
+            ('host2', 'timeout'), ('host2', 'copy'),
+        ]))
+
+        index.remove('host2')
+        self.assertEquals(index.consumers('common', 'timeout'), set())
+
+
+    def testWatchStore(self):
+        """Test commits to a store are indexed.
+        """
+        store = TemplateStore([self.common, self.host1])
+        index = ConsumerIndex()
+        index.watch(store)
+        self.assertEquals(index.consumers('common', 'timeout'), set([('host1', 'timeout')]))
+
+        with store.batch() as batch:
+            batch.set('host1', 'retry_timeout', 'common.$.timeout')
+            batch.remove('host1', 'timeout')
+
+        self.assertEquals(index.consumers('common', 'timeout'), set([('host1', 'retry_timeout')]))
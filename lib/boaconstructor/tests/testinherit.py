@@ -0,0 +1,141 @@
+"""
+Tests to verify templates extending other templates.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+from boaconstructor.instrument import Instrument
+
+
+class InheritTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(timeout=42, ntp='pool.ntp.org'))
+
+        self.top = Template('global', dict(
+                timeout='common.$.timeout', ntp='common.$.ntp', level='global',
+            ),
+            references=dict(common=self.common),
+        )
+        self.region = Template('region',
+            dict(level='region', region='eu'),
+            extends=self.top,
+        )
+        self.cluster = Template('cluster',
+            dict(level='cluster', cluster='c1', timeout=10),
+            extends=self.region,
+        )
+
+
+    def host(self, name):
+        return Template(name,
+            dict(level='host', host='%s.example.com' % name),
+            extends=self.cluster,
+        )
+
+
+    def testInheritance(self):
+        """Test the keys from the chain are merged, nearest winning.
+        """
+        self.assertEquals(self.host('host1').render(), dict(
+            timeout=10, ntp='pool.ntp.org', level='host', region='eu',
+            cluster='c1', host='host1.example.com',
+        ))
+
+        # extendwith loses to the inherited keys, which lose to ours:
+        result = self.host('host1').render(
+            extendwith=dict(region='not-used', extra='yes', level='nope'),
+        )
+        self.assertEquals(result['region'], 'eu')
+        self.assertEquals(result['extra'], 'yes')
+        self.assertEquals(result['level'], 'host')
+
+        result = self.host('host1').render(keys=['region', 'host', 'none'])
+        self.assertEquals(result, dict(region='eu', host='host1.example.com'))
+
+
+    def testBasesReused(self):
+        """Test the bases are worked out once and redone when changed.
+        """
+        instrument = Instrument()
+        for name in ('host1', 'host2', 'host3'):
+            self.host(name).render(instrument=instrument)
+
+        stats = instrument.snapshot()
+        for name in ('global', 'region', 'cluster'):
+            self.assertEquals(stats[name]['renders'], 1)
+            self.assertEquals(stats[name]['cache_hits'], 2)
+        self.assertEquals(stats['host3']['renders'], 1)
+
+        # Changing the region re-renders it and those below, not global:
+        self.region.set('region', 'us')
+        result = self.host('host4').render(instrument=instrument)
+        self.assertEquals(result['region'], 'us')
+        stats = instrument.snapshot()
+        self.assertEquals(stats['global']['renders'], 1)
+        self.assertEquals(stats['region']['renders'], 2)
+        self.assertEquals(stats['cluster']['renders'], 2)
+
+        # Changing a template global used is noticed:
+        self.common.set('ntp', 'time.example.com')
+        result = self.host('host5').render(instrument=instrument)
+        self.assertEquals(result['ntp'], 'time.example.com')
+        self.assertEquals(instrument.snapshot()['global']['renders'], 2)
+
+        # As are render time references replacing one used:
+        result = self.host('host6').render(dict(common=dict(ntp='x', timeout=1)))
+        self.assertEquals(result['ntp'], 'x')
+
+        # In place changes need changed():
+        self.top.content['level'] = 'changed'
+        self.top.content['new'] = 'key'
+        self.top.changed()
+        self.assertEquals(self.host('host7').render()['new'], 'key')
+
+
+    def testInheritedCopied(self):
+        """Test changing one render's inherited values leaves the others.
+        """
+        base = Template('base', dict(hosts=['a', 'b'], opts=dict(debug=False)))
+        leaf1 = Template('leaf1', dict(name='leaf1'), extends=base)
+        leaf2 = Template('leaf2', dict(name='leaf2'), extends=base)
+
+        result = leaf1.render()
+        result['hosts'].append('EVIL')
+        result['opts']['debug'] = True
+
+        self.assertEquals(leaf2.render()['hosts'], ['a', 'b'])
+        self.assertEquals(leaf2.render()['opts'], dict(debug=False))
+        self.assertEquals(leaf1.render()['hosts'], ['a', 'b'])
+
+
+    def testTrace(self):
+        """Test the provenance of inherited keys is kept.
+        """
+        host1 = self.host('host1')
+        host1.set('region', 'common.$.ntp')
+        host1.references = dict(common=self.common)
+        result, found = host1.render(
+            extendwith=dict(ntp='common.$.timeout'), trace=True
+        )
+        self.assertEquals(result['ntp'], 'pool.ntp.org')
+        self.assertEquals(found, {
+            'ntp': [('common', 'ntp')],
+            'region': [('common', 'ntp')],
+        })
@@ -0,0 +1,115 @@
+"""
+Tests to verify the render instrumentation.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.instrument import Instrument
+
+
+class InstrumentTests(unittest.TestCase):
+
+
+    def testRenderCounts(self):
+        """Test the hops, parse_value calls and all-inclusions recorded.
+        """
+        common = Template('common', dict(timeout=42, buffer='data.$.size'))
+        data = dict(size=2048)
+
+        host1 = Template('host1', {
+                "timeout": 'common.$.timeout',
+                "buffer": 'common.$.buffer',
+                "options": 'data.*',
+                "port": 80,
+            },
+            references=dict(common=common, data=data),
+        )
+
+        instrument = Instrument()
+        result = host1.render(instrument=instrument)
+        self.assertEquals(
+            result,
+            dict(timeout=42, buffer=2048, options=dict(size=2048), port=80)
+        )
+
+        stats = instrument.snapshot()
+        self.assertEquals(sorted(stats.keys()), ['data', 'host1'])
+
+        host1_stats = stats['host1']
+        self.assertEquals(host1_stats['renders'], 1)
+        # timeout: 1 hop, buffer: 2 hops, options: 1 hop.
+        self.assertEquals(host1_stats['hops'], 4)
+        self.assertEquals(host1_stats['allinc_expansions'], 1)
+        # One parse per hop plus one for each final value:
+        self.assertEquals(host1_stats['parse_value_calls'], 8)
+        self.assertEquals(host1_stats['cache_misses'], 1)
+        self.assertEquals(host1_stats['cache_hits'], 0)
+        self.assertTrue(host1_stats['seconds'] >= 0)
+
+        # The all-inclusion reused host1's reference cache:
+        self.assertEquals(stats['data']['renders'], 1)
+        self.assertEquals(stats['data']['cache_hits'], 1)
+
+        host1.render(instrument=instrument)
+        self.assertEquals(instrument.snapshot()['host1']['renders'], 2)
+
+        instrument.reset()
+        self.assertEquals(instrument.snapshot(), {})
+
+
+    def testUnnamedAndDisabled(self):
+        """Test utils.render without a name and without an instrument.
+        """
+        instrument = Instrument()
+        result = utils.render(
+            [('a', 'x.$.a')], int_refs=dict(x=dict(a=1)), ext_refs={},
+            instrument=instrument,
+        )
+        self.assertEquals(result, dict(a=1))
+        self.assertEquals(instrument.snapshot()['<unnamed>']['hops'], 1)
+
+        # No instrument, no counting and the same result:
+        result = utils.render(
+            [('a', 'x.$.a')], int_refs=dict(x=dict(a=1)), ext_refs={},
+        )
+        self.assertEquals(result, dict(a=1))
+
+
+    def testPrometheusExport(self):
+        """Test the Prometheus text format output.
+        """
+        instrument = Instrument()
+        instrument.record('host"1', dict(hops=3), 0.5)
+
+        text = instrument.to_prometheus()
+        self.assertTrue(text.endswith("\n"))
+
+        lines = text.splitlines()
+        self.assertTrue(
+            '# TYPE boaconstructor_hops_total counter' in lines
+        )
+        self.assertTrue(
+            'boaconstructor_hops_total{template="host\\"1"} 3' in lines
+        )
+        self.assertTrue(
+            'boaconstructor_seconds_total{template="host\\"1"} 0.5' in lines
+        )
+        self.assertTrue(
+            'boaconstructor_renders_total{template="host\\"1"} 1' in lines
+        )
@@ -0,0 +1,115 @@
+"""
+Tests to verify the interning of rendered values.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import gc
+import pickle
+import unittest
+
+from boaconstructor import Template
+from boaconstructor.interning import Interner
+from boaconstructor.interning import FrozenDict
+from boaconstructor.interning import FrozenList
+
+
+class InterningTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(
+            ntp=dict(servers=['ntp1', 'ntp2'], burst=True),
+            dns=['10.0.0.1', '10.0.0.2'],
+        ))
+        self.hosts = [
+            Template('host%d' % i, {
+                    'host': 'host%d' % i,
+                    'ntp': 'common.$.ntp',
+                    'dns': 'common.$.dns',
+                    'all': 'common.*',
+                },
+                references=dict(common=self.common),
+            )
+            for i in range(3)
+        ]
+
+
+    def testSharedAcrossRenders(self):
+        """Test equal values from different renders are the same object.
+        """
+        interner = Interner()
+        fleet = [host.render(interner=interner) for host in self.hosts]
+
+        self.assertEquals(fleet[0]['ntp'] is fleet[2]['ntp'], True)
+        self.assertEquals(fleet[0]['dns'] is fleet[1]['dns'], True)
+        self.assertEquals(fleet[0]['all']['ntp'] is fleet[0]['ntp'], True)
+        self.assertEquals(fleet[0]['ntp']['servers'] is fleet[1]['all']['ntp']['servers'], True)
+
+        # The same values as a plain render:
+        self.assertEquals(fleet[1], self.hosts[1].render())
+        self.assertEquals(type(fleet[1]), dict)
+
+        # The shared table is used with True:
+        self.assertEquals(
+            self.hosts[0].render(interner=True)['dns'] is
+            self.hosts[1].render(interner=True)['dns'],
+            True
+        )
+
+
+    def testFrozen(self):
+        """Test interned values can't be changed, but can be copied.
+        """
+        result = self.hosts[0].render(interner=Interner())
+
+        self.assertEquals(type(result['ntp']), FrozenDict)
+        self.assertEquals(type(result['dns']), FrozenList)
+        self.assertRaises(TypeError, result['ntp'].__setitem__, 'burst', False)
+        self.assertRaises(TypeError, result['ntp'].update, {})
+        self.assertRaises(TypeError, result['dns'].append, '10.0.0.3')
+
+        copied = pickle.loads(pickle.dumps(result['ntp']))
+        self.assertEquals(copied, result['ntp'])
+        self.assertEquals(type(copied), FrozenDict)
+
+        # The result itself can still be changed:
+        result['extra'] = 1
+
+
+    def testTypesNotMerged(self):
+        """Test equal values of different types aren't merged.
+        """
+        interner = Interner()
+        first = interner.intern([1, 2])
+        self.assertEquals(interner.intern([1.0, 2]) is first, False)
+        self.assertEquals(interner.intern([True, 2]) is first, False)
+        self.assertEquals(interner.intern([1, 2]) is first, True)
+
+        # Unhashable contents are left alone:
+        value = [set([1])]
+        self.assertEquals(interner.intern(value) is value, True)
+
+
+    def testWeaklyHeld(self):
+        """Test values are dropped from the table once no render uses them.
+        """
+        interner = Interner()
+        fleet = [host.render(interner=interner) for host in self.hosts]
+        self.assertEquals(interner.stats()['entries'], 4)
+
+        del fleet
+        gc.collect()
+        self.assertEquals(interner.stats()['entries'], 0)
@@ -0,0 +1,142 @@
+"""
+Tests to verify reading object references through Attributes.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+from boaconstructor import objects
+
+
+class Settings(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.name = 'plain'
+
+
+    def _get_timeout(self):
+        self.calls += 1
+        return 30
+
+    timeout = property(_get_timeout)
+
+
+class Slotted(object):
+    __slots__ = ('port', 'unset')
+
+    def __init__(self):
+        self.port = 8080
+
+
+class AttributesTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.templates = [
+            Template('host%d' % i, dict(
+                timeout='settings.$.timeout',
+                again='settings.$.timeout',
+                name='settings.$.name',
+            ))
+            for i in range(3)
+        ]
+
+
+    def testOncePerRender(self):
+        """Test each property is read once per render.
+        """
+        settings = Settings()
+        for template in self.templates:
+            self.assertEquals(
+                template.render(dict(settings=settings)),
+                dict(timeout=30, again=30, name='plain'),
+            )
+        unwrapped = settings.calls
+        # Once for every hop through it:
+        self.assertEquals(unwrapped, 6)
+
+        settings.calls = 0
+        wrapped = objects.Attributes(settings)
+        for template in self.templates:
+            self.assertEquals(
+                template.render(dict(settings=wrapped)),
+                dict(timeout=30, again=30, name='plain'),
+            )
+        self.assertEquals(settings.calls, 3)
+
+
+    def testTtl(self):
+        """Test renders within the ttl share what was read.
+        """
+        settings = Settings()
+        wrapped = objects.Attributes(settings, ttl=60)
+        for template in self.templates:
+            template.render(dict(settings=wrapped))
+            template.render(dict(settings=wrapped), keys=['timeout'])
+        self.assertEquals(settings.calls, 1)
+
+        settings.name = 'changed'
+        self.assertEquals(self.templates[0].render(dict(settings=wrapped))['name'], 'plain')
+        wrapped.expire()
+        self.assertEquals(self.templates[0].render(dict(settings=wrapped))['name'], 'changed')
+        self.assertEquals(settings.calls, 2)
+
+
+    def testMissing(self):
+        """Test missing attributes and unset slots raise AttributeError.
+        """
+        from boaconstructor import utils
+
+        template = Template('host', dict(port='s.$.port', unset='s.$.unset'))
+        wrapped = objects.Attributes(Slotted())
+        self.assertEquals(template.render(dict(s=wrapped), keys=['port']), dict(port=8080))
+        self.assertRaises(utils.AttributeError, template.render, dict(s=wrapped))
+        self.assertRaises(
+            utils.AttributeError,
+            Template('host', dict(x='s.$.nope')).render, dict(s=objects.Attributes(Settings())),
+        )
+
+
+    def testAllInclusion(self):
+        """Test an all-inclusion gives the public attributes.
+        """
+        template = Template('host', dict(everything='s.*'))
+        self.assertEquals(
+            template.render(dict(s=objects.Attributes(Slotted()))),
+            dict(everything=dict(port=8080)),
+        )
+        settings = Settings()
+        self.assertEquals(
+            template.render(dict(s=objects.Attributes(settings))),
+            dict(everything=dict(calls=0, name='plain')),
+        )
+
+
+    def testReaders(self):
+        """Test the readers for each class layout.
+        """
+        settings = Settings()
+        settings.__dict__['extra'] = 1
+        self.assertEquals(objects.reader(Settings, 'extra')(settings), 1)
+        self.assertEquals(objects.reader(Settings, 'timeout')(settings), 30)
+        self.assertEquals(objects.reader(Settings, 'nope')(settings), objects.MISSING)
+
+        slotted = Slotted()
+        self.assertEquals(objects.reader(Slotted, 'port')(slotted), 8080)
+        self.assertEquals(objects.reader(Slotted, 'unset')(slotted), objects.MISSING)
+        self.assertEquals(objects.reader(Slotted, 'port') is objects.reader(Slotted, 'port'), True)
@@ -0,0 +1,136 @@
+"""
+Tests to verify tenant renders through an Overlay.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import cache
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.overlay import Overlay
+
+
+class OverlayTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(timeout=42, retries=3))
+        self.db = Template('db', dict(host='db.example.com', port=5432, user='creds.$.user'),
+            references=dict(creds=dict(user='shared')),
+        )
+        self.base = Template('base', dict(loglevel='info', timeout='common.$.timeout'))
+        self.webserver = Template('webserver', {
+                'timeout': 'common.$.timeout',
+                'retries': 'common.$.retries',
+                'dbhost': 'db.$.host',
+                'dbuser': 'db.$.user',
+                'database': 'db.*',
+                'servers': ['a', 'db.$.port'],
+                'name': 'tenant.$.name',
+                'port': 80,
+            },
+            references=dict(common=self.common),
+            extends=self.base,
+        )
+        self.references = dict(common=self.common, db=self.db)
+        self.overlay = Overlay(self.references)
+
+
+    def render(self, overrides):
+        references = dict(self.references)
+        references.update(overrides)
+        return self.webserver.render(references)
+
+
+    def testSameAsRender(self):
+        """Test renders match rendering with the merged references.
+        """
+        tenant_db = Template('tenantdb', dict(host='t1.example.com', port=6543, user='creds.$.user'),
+            references=dict(creds=dict(user='tenant1')),
+        )
+        for overrides in [
+            dict(tenant=dict(name='t1')),
+            dict(tenant=dict(name='t2'), db=tenant_db),
+            dict(tenant=dict(name='t3'), creds=dict(user='t3')),
+            dict(tenant=dict(name='t4'), common=dict(timeout=1, retries=2)),
+        ]:
+            self.assertEquals(self.overlay.render(self.webserver, overrides), self.render(overrides))
+
+
+    def testOnlyAffectedKeys(self):
+        """Test only keys whose chains used an overridden name are resolved.
+        """
+        overlay = self.overlay
+        overlay.render(self.webserver, dict(tenant=dict(name='t1')))
+        # 'name' failed without the tenant so is always done:
+        self.assertEquals(overlay.resolved, 1)
+
+        overlay.resolved = 0
+        rendered = overlay.render(self.webserver, dict(tenant=dict(name='t1'), creds=dict(user='x')))
+        self.assertEquals(rendered['dbuser'], 'x')
+        self.assertEquals(rendered['database']['user'], 'x')
+        # name, dbuser and database, nothing in base:
+        self.assertEquals(overlay.resolved, 3)
+
+        # The same reference as the base changes nothing:
+        overlay.resolved = 0
+        overlay.render(self.webserver, dict(tenant=dict(name='t1'), db=self.db))
+        self.assertEquals(overlay.resolved, 1)
+
+
+    def testErrors(self):
+        """Test errors are raised as a render would.
+        """
+        self.assertRaises(utils.ReferenceError, self.overlay.render, self.webserver)
+        self.assertRaises(utils.AttributeError, self.overlay.render, self.webserver, dict(tenant={}))
+
+        # The schema is checked as by a render:
+        from boaconstructor.schema import SchemaError
+        template = Template('t', dict(port='common.$.port'), schema=dict(port=int))
+        overlay = Overlay(dict(common=dict(port=80)))
+        self.assertEquals(overlay.render(template), dict(port=80))
+        self.assertRaises(SchemaError, overlay.render, template, dict(common=dict(port='x')))
+        self.assertRaises(SchemaError, template.render, dict(common=dict(port='x')))
+
+
+    def testChanges(self):
+        """Test the base render is done again when something it used changes.
+        """
+        overrides = dict(tenant=dict(name='t1'))
+        self.assertEquals(self.overlay.render(self.webserver, overrides)['timeout'], 42)
+        self.common.set('timeout', 10)
+        self.assertEquals(self.overlay.render(self.webserver, overrides)['timeout'], 10)
+        self.webserver.set('port', 8080)
+        self.assertEquals(self.overlay.render(self.webserver, overrides), self.render(overrides))
+
+
+    def testBasesLimited(self):
+        """Test only max_templates base renders are kept, in a registered
+        cache.
+        """
+        overlay = Overlay(self.references, max_templates=1)
+        overrides = dict(tenant=dict(name='t1'))
+        self.assertEquals(overlay.render(self.webserver, overrides), self.render(overrides))
+        self.assertEquals(len(overlay._bases), 1)
+
+        cache.configure('overlay_bases', max_entries=2)
+        overlay.render(self.webserver, overrides)
+        self.assertEquals(len(overlay._bases), 2)
+        self.assertEquals(cache.stats()['overlay_bases']['entries'], 2)
+
+        overlay.forget(self.webserver)
+        self.assertEquals(len(overlay._bases), 1)
@@ -0,0 +1,148 @@
+"""
+Tests to verify the projection render.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import utils
+from boaconstructor import Template
+
+
+class WatchedTemplate(Template):
+    """A Template which notes when its child references are looked at.
+    """
+    looked_at = []
+
+    def _get_references(self):
+        self.looked_at.append(self.name)
+        return Template._get_references(self)
+
+    references = property(_get_references, Template._set_references)
+
+
+class ProjectionTests(unittest.TestCase):
+
+
+    def setUp(self):
+        WatchedTemplate.looked_at = []
+
+
+    def testKeysOnly(self):
+        """Test only the keys asked for, and what they refer to, are used.
+        """
+        common = WatchedTemplate('common', dict(timeout=42, buffer='data.$.size'),
+            references=dict(data=dict(size=2048)),
+        )
+        other = WatchedTemplate('other', dict(missing='nowhere.$.at_all'),
+            references=dict(deeper=dict(x=1)),
+        )
+
+        host1 = Template('host1', {
+                'timeout': 'common.$.timeout',
+                'broken': 'other.$.missing',
+                'host': '1.2.3.4',
+            },
+            references=dict(common=common, other=other),
+        )
+
+        # The unresolvable 'broken' key is never looked at:
+        result = host1.render(keys=['timeout', 'host', 'not-present'])
+        self.assertEquals(result, dict(timeout=42, host='1.2.3.4'))
+
+        # No references are flattened if none are needed:
+        WatchedTemplate.looked_at = []
+        self.assertEquals(host1.render(keys=['host']), dict(host='1.2.3.4'))
+        self.assertEquals(WatchedTemplate.looked_at, [])
+
+        host1.content['buffer'] = 'data.$.size'
+        result = host1.render(keys=['buffer'])
+        self.assertEquals(result, dict(buffer=2048))
+
+        # The full render still raises as before:
+        self.assertRaises(utils.ReferenceError, host1.render)
+
+
+    def testKeysExtendwith(self):
+        """Test extendwith keys are only resolved when they survive.
+        """
+        auth = dict(
+            target='broken.$.reference', user='common.$.user', unused='x.$.y',
+        )
+        test1 = Template('test1', dict(target='production', system='Live00'))
+
+        result = test1.render(
+            dict(common=dict(user='james')),
+            extendwith=auth,
+            keys=['target', 'user'],
+        )
+        self.assertEquals(result, dict(target='production', user='james'))
+
+        result, provenance = test1.render(
+            dict(common=dict(user='james')),
+            extendwith=auth,
+            keys=['user'],
+            trace=True,
+        )
+        self.assertEquals(result, dict(user='james'))
+        self.assertEquals(provenance, dict(user=[('common', 'user')]))
+
+
+    def testLazyReferences(self):
+        """Test the lazily flattened references match build_ref_cache's.
+        """
+        inner = Template('inner', {}, references=dict(common=dict(a=2), deep=dict(b=3)))
+        given = dict(common=dict(a=1), inner=inner)
+        refs = utils.LazyReferences(given)
+
+        self.assertTrue('common' in refs)
+        self.assertEquals(refs['common'], utils.build_ref_cache({}, given)['ext']['common'])
+        self.assertEquals(refs['deep'], dict(b=3))
+        self.assertFalse('nothing' in refs)
+        self.assertEquals(sorted(refs.keys()), ['common', 'deep', 'inner'])
+        self.assertEquals(dict(refs.items()), utils.build_ref_cache({}, given)['ext'])
+
+        # Cycles don't loop forever:
+        a = Template('a', {})
+        b = Template('b', {}, references=dict(a=a))
+        a.references = dict(b=b)
+        self.assertEquals(sorted(utils.LazyReferences(dict(a=a)).keys()), ['a', 'b'])
+
+
+    def testShadowedNames(self):
+        """Test rendering some keys gives the same as rendering them all when
+        a name is given at more than one level.
+        """
+        inner = Template('inner', dict(b='common.$.a'), references=dict(common=dict(a=2)))
+
+        # The inner template's name decides if it is flattened before or
+        # after the host's own 'common', try both:
+        for name in ('inner', 'zone'):
+            host = Template('host', dict(
+                    a='common.$.a',
+                    b='%s.$.b' % name,
+                    c='other.$.c',
+                ),
+                references={'common': dict(a=1), name: inner, 'other': dict(c=0)},
+            )
+            references = {'other': dict(c=3), 'common': dict(a=4), name: inner}
+
+            for given in (None, references):
+                rendered = host.render(given)
+                for keys in (['a'], ['b'], ['a', 'c'], ['a', 'b', 'c']):
+                    projected = dict([(key, rendered[key]) for key in keys])
+                    self.assertEquals(host.render(given, keys=keys), projected)
+                self.assertEquals(dict(host.iter_render(given)), rendered)
@@ -0,0 +1,74 @@
+"""
+Tests to verify the value provenance tracing.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+
+
+class ProvenanceTests(unittest.TestCase):
+
+
+    def testTraceChains(self):
+        """Test the (reference, attribute) hops recorded for each value.
+        """
+        common = Template('common', dict(timeout=42, keep='yes'))
+        people = dict(bob='Bob', alice='Alice')
+
+        host1 = Template('host1', {
+                "timeout": 'common.$.timeout',
+                "flag": False,
+            },
+            references=dict(common=common),
+        )
+
+        auth = Template('auth', dict(name='people.$.bob', level=3))
+
+        host2 = Template('host2', {
+                "host": "4.3.2.1",
+                "timeout": 'host.$.timeout',
+                "users": 'auth.*',
+                "names": ['people.$.alice', 'literal'],
+            },
+            references=dict(host=host1, auth=auth, people=people),
+        )
+
+        result, provenance = host2.render(trace=True)
+
+        self.assertEquals(result, host2.render())
+        self.assertEquals(provenance, {
+            'timeout': [('host', 'timeout'), ('common', 'timeout')],
+            'users': [('auth', '*')],
+            'users.name': [('people', 'bob')],
+            'names[0]': [('people', 'alice')],
+        })
+
+
+    def testTraceExtendwith(self):
+        """Test extendwith keys overwritten by the template aren't traced.
+        """
+        common = dict(buffer=4096, target='other')
+        auth = dict(target='common.$.target', recv='common.$.buffer')
+
+        test1 = Template('test1', dict(target='production'))
+
+        result, provenance = test1.render(
+            dict(common=common), extendwith=auth, trace=True
+        )
+        self.assertEquals(result, dict(target='production', recv=4096))
+        self.assertEquals(provenance, {'recv': [('common', 'buffer')]})
@@ -0,0 +1,170 @@
+"""
+Tests to verify the batched reference providers.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.providers import Provider
+from boaconstructor.providers import EnvironProvider
+from boaconstructor.providers import SQLiteProvider
+
+
+class CountingProvider(Provider):
+    """A dict backed provider recording each fetch_many call.
+    """
+    def __init__(self, data, ttl=None):
+        Provider.__init__(self, ttl)
+        self.data = data
+        self.calls = []
+
+    def fetch_many(self, attributes):
+        self.calls.append(attributes)
+        if attributes is None:
+            return dict(self.data)
+        return dict([(a, self.data[a]) for a in attributes if a in self.data])
+
+
+class ProviderTests(unittest.TestCase):
+
+
+    def testBatchedLookups(self):
+        """Test a render fetches what it needs from each provider in batches.
+        """
+        db = CountingProvider(dict(
+            timeout=42, port=8080, zone='other.$.zone', unused=1,
+        ))
+        other = CountingProvider(dict(zone='eu-west'))
+        common = Template('common', dict(retry='db.$.port'))
+
+        host1 = Template('host1', {
+                'timeout': 'db.$.timeout',
+                'port': 'db.$.port',
+                'zone': 'db.$.zone',
+                'retry': 'common.$.retry',
+                'names': ['db.$.timeout', 'literal'],
+                'all': 'other.*',
+                'host': 'host1.example.com',
+            },
+            references=dict(db=db, other=other, common=common),
+        )
+
+        result = host1.render()
+        self.assertEquals(result, {
+            'timeout': 42,
+            'port': 8080,
+            'zone': 'eu-west',
+            'retry': 8080,
+            'names': [42, 'literal'],
+            'all': dict(zone='eu-west'),
+            'host': 'host1.example.com',
+        })
+
+        # One call for db, and one for other which is all the zone lookup
+        # then needs too.
+        self.assertEquals(db.calls, [['port', 'timeout', 'zone']])
+        self.assertEquals(other.calls, [None])
+
+        # Nothing is cached without a ttl:
+        host1.render()
+        self.assertEquals(len(db.calls), 2)
+
+        # Rendering some keys asks the provider once per hop:
+        del db.calls[:]
+        self.assertEquals(host1.render(keys=['timeout', 'zone']), dict(timeout=42, zone='eu-west'))
+        self.assertEquals(db.calls, [['timeout'], ['zone']])
+
+
+    def testTTLCacheAndFallback(self):
+        """Test the ttl cache is shared across renders and that missing
+        attributes fall back to the internal references.
+        """
+        db = CountingProvider(dict(timeout=42), ttl=60)
+        host1 = Template('host1', dict(
+                timeout='common.$.timeout', port='common.$.port',
+            ),
+            references=dict(common=dict(port=80, timeout=1)),
+        )
+
+        result = host1.render(dict(common=db))
+        self.assertEquals(result, dict(timeout=42, port=80))
+        self.assertEquals(db.calls, [['port', 'timeout']])
+
+        result = host1.render(dict(common=db))
+        self.assertEquals(result, dict(timeout=42, port=80))
+        self.assertEquals(len(db.calls), 1)
+
+        db.invalidate()
+        host1.render(dict(common=db))
+        self.assertEquals(len(db.calls), 2)
+
+        # Direct use of has/get:
+        self.assertEquals(utils.has(db, 'timeout'), True)
+        self.assertEquals(utils.has(db, 'port'), False)
+        self.assertEquals(utils.get(db, 'timeout'), 42)
+        self.assertRaises(utils.AttributeError, utils.get, db, 'port')
+
+        host2 = Template('host2', dict(port='db.$.port'), dict(db=db))
+        self.assertRaises(utils.AttributeError, host2.render)
+
+
+    def testEnvironProvider(self):
+        """Test the environment variable provider.
+        """
+        env = EnvironProvider(
+            prefix='APP_', environ=dict(APP_PORT='80', APP_HOST='a', HOME='/'),
+        )
+        host1 = Template('host1', dict(port='env.$.PORT', all='env.*'), dict(env=env))
+        self.assertEquals(
+            host1.render(), dict(port='80', all=dict(PORT='80', HOST='a'))
+        )
+
+
+    def testSQLiteProvider(self):
+        """Test the SQLite table provider.
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            database = os.path.join(tmpdir, 'settings.db')
+            connection = sqlite3.connect(database)
+            connection.execute("CREATE TABLE common (name TEXT, value)")
+            connection.executemany(
+                "INSERT INTO common VALUES (?, ?)",
+                [('timeout', 42), ('email', 'admin@example.com')]
+            )
+            connection.commit()
+            connection.close()
+
+            common = SQLiteProvider(database, 'common', ttl=60)
+            host1 = Template('host1', dict(
+                    timeout='common.$.timeout', email='common.$.email',
+                ),
+                references=dict(common=common),
+            )
+            self.assertEquals(
+                host1.render(), dict(timeout=42, email='admin@example.com')
+            )
+
+            self.assertRaises(ValueError, SQLiteProvider, database, 'x; DROP')
+
+        finally:
+            shutil.rmtree(tmpdir)
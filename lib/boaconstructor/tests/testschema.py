@@ -0,0 +1,153 @@
+"""
+Tests to verify the schemas checked when rendering.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import Template
+from boaconstructor.schema import Schema
+from boaconstructor.schema import SchemaError
+from boaconstructor.store import TemplateStore
+
+
+class SchemaTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(port=80, servers=['ntp1', 'ntp2']))
+        self.spec = {
+            'host': basestring,
+            'port': int,
+            'ntp': [basestring],
+            'logging': {'level': basestring, 'days': (int, long)},
+        }
+
+
+    def problems(self, template, *args, **kwargs):
+        try:
+            template.render(*args, **kwargs)
+
+        except SchemaError as error:
+            return error.problems
+
+        return []
+
+
+    def testValid(self):
+        """Test a render matching its schema is returned as usual.
+        """
+        host = Template('host', {
+                'host': '1.2.3.4',
+                'port': 'common.$.port',
+                'ntp': 'common.$.servers',
+                'logging': dict(level='info', days=7),
+                'extra': True,
+            },
+            references=dict(common=self.common),
+            schema=self.spec,
+        )
+        self.assertEquals(host.render()['port'], 80)
+        self.assertTrue(isinstance(host.schema, Schema))
+
+
+    def testProblems(self):
+        """Test every problem is reported at once.
+        """
+        host = Template('host', {
+                'host': 1234,
+                'port': 'common.$.servers',
+                'ntp': ['ntp0', 'common.$.port'],
+            },
+            references=dict(common=self.common),
+            schema=Schema(self.spec, required=['host', 'port', 'ntp', 'version']),
+        )
+        self.assertEquals(self.problems(host), [
+            "['host']: expected basestring, got int 1234",
+            "['ntp'][1]: expected basestring, got int 80",
+            "['port']: expected int, got list ['ntp1', 'ntp2']",
+            "['version']: missing",
+        ])
+
+        host.set('logging', dict(level='info', days='7'))
+        self.assertEquals(self.problems(host, keys=['logging', 'host']), [
+            "['host']: expected basestring, got int 1234",
+            "['logging']['days']: expected int or long, got str '7'",
+        ])
+
+        # The error is a TemplateError naming the template:
+        host.schema = dict(host=basestring)
+        try:
+            host.render()
+        except SchemaError as error:
+            self.assertEquals(str(error), "host: ['host']: expected basestring, got int 1234")
+        else:
+            self.fail("SchemaError not raised")
+
+
+    def testLiteralsCheckedOnce(self):
+        """Test values without references are only checked when the content
+        changes.
+        """
+        calls = []
+
+        class Counted(type):
+            def __instancecheck__(cls, value):
+                calls.append(value)
+                return isinstance(value, int)
+
+        class Number(object):
+            __metaclass__ = Counted
+
+        host = Template('host', dict(literal=1, referred='common.$.port'),
+            references=dict(common=self.common),
+            schema=dict(literal=Number, referred=Number),
+        )
+        host.render()
+        host.render()
+        self.assertEquals(calls, [1, 80, 80])
+
+        host.set('literal', 2)
+        host.render()
+        self.assertEquals(calls, [1, 80, 80, 2, 80])
+
+
+    def testExtends(self):
+        """Test keys inherited from the template extended are checked.
+        """
+        base = Template('base', dict(port='common.$.port', level=3),
+            references=dict(common=self.common),
+        )
+        child = Template('child', dict(host='1.2.3.4'), extends=base,
+            schema=dict(host=basestring, port=int, level=basestring),
+        )
+        self.assertEquals(self.problems(child), ["['level']: expected basestring, got int 3"])
+
+        base.set('level', 'debug')
+        self.assertEquals(child.render()['level'], 'debug')
+
+
+    def testStore(self):
+        """Test renders from a TemplateStore are checked.
+        """
+        store = TemplateStore([
+            self.common,
+            Template('host', dict(port='common.$.servers'),
+                references=dict(common=self.common),
+                schema=dict(port=int),
+            ),
+        ])
+        self.assertRaises(SchemaError, store.render, 'host')
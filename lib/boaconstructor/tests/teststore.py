@@ -0,0 +1,211 @@
+"""
+Tests to verify the versioned template store.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import gc
+import unittest
+import threading
+
+from boaconstructor import Template
+from boaconstructor.store import TemplateStore
+from boaconstructor.store import diff_render
+
+
+class StoreTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.common = Template('common', dict(a=0, b=0))
+        self.host1 = Template('host1', {
+                'a': 'common.$.a',
+                'b': 'common.$.b',
+                'c': 0,
+            },
+            references=dict(common=self.common),
+        )
+        self.store = TemplateStore([self.common, self.host1])
+
+
+    def testBatch(self):
+        """Test a batch changes several templates as one version.
+        """
+        store = self.store
+        self.assertEquals(store.version, 0)
+
+        with store.batch() as batch:
+            batch.update('common', dict(a=1, b=1))
+            batch.set('host1', 'c', 1)
+            batch.set('host1', 'd', 'common.$.a')
+            # No change until commit:
+            self.assertEquals(store.render('host1'), dict(a=0, b=0, c=0))
+
+        self.assertEquals(store.version, 1)
+        self.assertEquals(store.render('host1'), dict(a=1, b=1, c=1, d=1))
+        self.assertEquals(self.common.content, dict(a=1, b=1))
+
+        # A bad change leaves everything as it was:
+        batch = store.batch()
+        batch.set('common', 'a', 2)
+        batch.remove('host1', 'missing')
+        self.assertRaises(KeyError, batch.commit)
+        self.assertEquals(store.version, 1)
+        self.assertEquals(self.common.content, dict(a=1, b=1))
+
+
+    def testPinnedVersion(self):
+        """Test a pinned version is unchanged by later commits, and is only
+        retained while held.
+        """
+        store = self.store
+        version = store.pin()
+
+        with store.batch() as batch:
+            batch.update('common', dict(a=1, b=1))
+        with store.batch() as batch:
+            batch.replace('common', dict(a=2, b=2))
+
+        self.assertEquals(version.render('host1'), dict(a=0, b=0, c=0))
+        self.assertEquals(store.render('host1'), dict(a=2, b=2, c=0))
+
+        gc.collect()
+        self.assertEquals(store.retained(), [0, 2])
+
+        del version
+        gc.collect()
+        self.assertEquals(store.retained(), [2])
+
+
+    def testReferencesInVersion(self):
+        """Test changes to references are part of the version.
+        """
+        other = Template('other', dict(a=5, b=5))
+        store = self.store
+        store.add(other)
+
+        version = store.pin()
+        with store.batch() as batch:
+            batch.set_references('host1', dict(common=other))
+            batch.update('other', dict(a=6, b=6))
+
+        self.assertEquals(version.render('host1'), dict(a=0, b=0, c=0))
+        self.assertEquals(store.render('host1'), dict(a=6, b=6, c=0))
+
+
+    def testOneNotificationPerBatch(self):
+        """Test subscribers are called once per batch.
+        """
+        store = self.store
+        calls = []
+        store.subscribe(lambda version, names: calls.append((version.number, names)))
+
+        with store.batch() as batch:
+            for i in range(10):
+                batch.set('common', 'a', i)
+                batch.set('host1', 'c', i)
+
+        self.assertEquals(calls, [(1, set(['common', 'host1']))])
+
+
+    def testConcurrentRenders(self):
+        """Test renders never see half of a batch.
+        """
+        store = self.store
+        problems = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                result = store.render('host1')
+                if not result['a'] == result['b'] == result['c']:
+                    problems.append(result)
+
+        readers = [threading.Thread(target=reader) for i in range(8)]
+        for thread in readers:
+            thread.start()
+
+        try:
+            for i in range(1, 501):
+                with store.batch() as batch:
+                    batch.update('common', dict(a=i, b=i))
+                    batch.set('host1', 'c', i)
+
+        finally:
+            stop.set()
+            for thread in readers:
+                thread.join()
+
+        self.assertEquals(problems, [])
+        self.assertEquals(store.version, 500)
+
+
+    def testDiffRender(self):
+        """Test only what changed is reported, with the paths to it.
+        """
+        common = Template('common', dict(
+            a=0, b=0, ntp=dict(servers=['ntp1', 'ntp2'], burst=True),
+        ))
+        host1 = Template('host1', dict(a='common.$.a', ntp='common.$.ntp'),
+            references=dict(common=common),
+        )
+        host2 = Template('host2', dict(b='common.$.b'),
+            references=dict(common=common),
+        )
+        host3 = Template('host3', {'all': 'common.*', 'host': 'host3'},
+            references=dict(common=common),
+        )
+        store = TemplateStore([common, host1, host2, host3])
+
+        first = store.pin()
+        with store.batch() as batch:
+            batch.set('common', 'a', 1)
+            batch.set('common', 'ntp', dict(servers=['ntp1', 'ntp3'], burst=True))
+            batch.set('host2', 'port', 80)
+
+        second = store.pin()
+        self.assertEquals(diff_render(first, second), {
+            'common': [
+                ('changed', 'a', 0, 1),
+                ('changed', 'ntp.servers[1]', 'ntp2', 'ntp3'),
+            ],
+            'host1': [
+                ('changed', 'a', 0, 1),
+                ('changed', 'ntp.servers[1]', 'ntp2', 'ntp3'),
+            ],
+            'host2': [('added', 'port', None, 80)],
+            'host3': [
+                ('changed', 'all.a', 0, 1),
+                ('changed', 'all.ntp.servers[1]', 'ntp2', 'ntp3'),
+            ],
+        })
+
+        # The new version's renders were kept and are correct:
+        for name in store.names():
+            self.assertEquals(second.traced(name).rendered, second.render(name))
+
+        # host1 doesn't use b:
+        with store.batch() as batch:
+            batch.set('common', 'b', 2)
+            batch.remove('host3', 'host')
+
+        self.assertEquals(diff_render(second, store.pin()), {
+            'common': [('changed', 'b', 0, 2)],
+            'host2': [('changed', 'b', 0, 2)],
+            'host3': [
+                ('changed', 'all.b', 0, 2),
+                ('removed', 'host', 'host3', None),
+            ],
+        })
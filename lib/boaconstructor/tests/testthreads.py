@@ -0,0 +1,110 @@
+"""
+Tests to verify templates can be rendered from many threads while changed.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+import threading
+
+from boaconstructor import Template
+
+
+class ThreadTests(unittest.TestCase):
+
+
+    def testRenderWhileUpdating(self):
+        """Test renders never see half of an update made by another thread.
+        """
+        common = Template('common', dict(a=0, b=0))
+        host1 = Template('host1', {
+                'a': 'common.$.a',
+                'b': 'common.$.b',
+                'host': '1.2.3.4',
+            },
+            references=dict(common=common),
+        )
+
+        problems = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                for template in (common, host1):
+                    result = template.render()
+                    if result['a'] != result['b']:
+                        problems.append(result)
+
+        readers = [threading.Thread(target=reader) for i in range(8)]
+        for thread in readers:
+            thread.start()
+
+        try:
+            for i in range(1, 2001):
+                common.update(dict(a=i, b=i))
+
+        finally:
+            stop.set()
+            for thread in readers:
+                thread.join()
+
+        self.assertEquals(problems, [])
+        self.assertEquals(common.version, 2000)
+        self.assertEquals(host1.render()['a'], 2000)
+
+
+    def testSnapshot(self):
+        """Test a snapshot is unchanged by later writes.
+        """
+        common = Template('common', dict(a=1))
+        before = common.snapshot()
+
+        common.set('a', 2)
+        common.set('b', 3)
+        common.remove('a')
+
+        self.assertEquals(before.content, dict(a=1))
+        self.assertEquals(before.version, 0)
+        self.assertEquals(common.content, dict(b=3))
+        self.assertEquals(common.version, 3)
+
+
+    def testReferencesChanged(self):
+        """Test the flattened references kept are dropped when they change.
+        """
+        data = Template('data', dict(size=1))
+        other = Template('other', dict(size=2))
+        common = Template('common', dict(size='data.$.size'),
+            references=dict(data=data),
+        )
+        host1 = Template('host1', dict(size='common.$.size'),
+            references=dict(common=common),
+        )
+        self.assertEquals(host1.render(), dict(size=1))
+
+        # A change to a child's references is seen by the parent:
+        common.references = dict(data=other)
+        self.assertEquals(host1.render(), dict(size=2))
+
+        # Changing them in place would go unseen, so isn't allowed:
+        self.assertRaises(TypeError, common.references.__setitem__, 'data', data)
+        self.assertRaises(TypeError, common.references.update, dict(data=data))
+        self.assertEquals(host1.render(), dict(size=2))
+
+        # The dict given is copied:
+        references = dict(data=data)
+        common.references = references
+        references['data'] = other
+        self.assertEquals(host1.render(), dict(size=1))
@@ -0,0 +1,140 @@
+"""
+Tests to verify validating templates before rendering.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+
+from boaconstructor import utils
+from boaconstructor import Template
+from boaconstructor.validate import validate
+
+
+class ValidateTests(unittest.TestCase):
+
+
+    def problems(self, templates, references=None):
+        return [
+            (problem.template, problem.key, problem.kind)
+            for problem in validate(templates, references)
+        ]
+
+
+    def testValid(self):
+        """Test a set of templates which all render has no problems.
+        """
+        common = Template('common', dict(timeout=42, retries=3, name='site.$.host'),
+            references=dict(site=dict(host='a.example.com')),
+        )
+        host = Template('host', {
+                'timeout': 'common.$.timeout',
+                'checks': ['common.$.retries', ['common.$.name'], 'ping'],
+                'copy': 'common.*',
+                'user': 'given.$.user',
+            },
+            references=dict(common=common),
+        )
+        child = Template('child', dict(port=80), extends=host)
+        references = dict(given=dict(user='bob'))
+
+        self.assertEquals(validate([common, host, child], references), [])
+        for template in (common, host, child):
+            template.render(references)
+
+
+    def testAllReported(self):
+        """Test every missing reference and attribute is found at once.
+        """
+        common = Template('common', dict(timeout=42, broken='nowhere.$.x'))
+        host = Template('host', {
+                'timeout': 'comon.$.timeout',
+                'retries': 'common.$.retries',
+                'checks': ['ping', 'common.$.interval'],
+                'copy': 'common.*',
+                'ok': 'common.$.timeout',
+            },
+            references=dict(common=common),
+        )
+        base = Template('base', dict(port='missing.$.port'))
+        child = Template('child', dict(port=80), extends=base)
+
+        self.assertEquals(self.problems([host, child]), [
+            ('base', 'port', 'reference'),
+            ('host', 'checks', 'attribute'),
+            ('host', 'copy', 'reference'),
+            ('host', 'retries', 'attribute'),
+            ('host', 'timeout', 'reference'),
+        ])
+
+        problem = validate([host])[-1]
+        self.assertEquals(problem.reference, 'comon')
+        self.assertEquals(problem.attribute, 'timeout')
+        self.assertEquals(str(problem), "host['timeout']: The reference 'comon' could not be resolved!")
+
+        self.assertRaises((utils.ReferenceError, utils.AttributeError), host.render)
+
+
+    def testReferencesGiven(self):
+        """Test the references given are looked in before the template's own.
+        """
+        host = Template('host', dict(user='given.$.user', port='own.$.port'),
+            references=dict(own=dict(port=80)),
+        )
+        self.assertEquals(self.problems([host]), [('host', 'user', 'reference')])
+        self.assertEquals(self.problems([host], dict(given=dict(user='bob'))), [])
+        self.assertEquals(
+            self.problems([host], dict(given=dict(name='bob'), own=dict(user='x'))),
+            [('host', 'user', 'attribute')],
+        )
+
+
+    def testCycle(self):
+        """Test chains which loop are found.
+        """
+        a = Template('a', dict(x='b.$.y', z='a.$.x', w='a.*'))
+        b = Template('b', dict(y='a.$.x'))
+        references = dict(a=a, b=b)
+
+        # 'w' includes itself and the looping 'x' and 'z':
+        self.assertEquals(self.problems([a], references), [
+            ('a', 'w', 'cycle'),
+            ('a', 'w', 'cycle'),
+            ('a', 'x', 'cycle'),
+            ('a', 'z', 'cycle'),
+        ])
+        problem = validate([a], references)[2]
+        self.assertTrue(problem.message in (
+            "The references loop: a.$.x -> b.$.y -> a.$.x!",
+            "The references loop: b.$.y -> a.$.x -> b.$.y!",
+        ))
+
+
+    def testDepth(self):
+        """Test chains longer than a render follows are found.
+        """
+        def chain(length):
+            content = dict([('k%d' % i, 'c.$.k%d' % (i + 1)) for i in range(1, length)])
+            content['k%d' % length] = 'end'
+            content['start'] = 'c.$.k1'
+            return Template('c', content, references=dict(c=dict(content)))
+
+        longest = chain(utils.MAX_HOPS)
+        self.assertEquals(self.problems([longest]), [])
+        self.assertEquals(longest.render()['start'], 'end')
+
+        too_long = chain(utils.MAX_HOPS + 1)
+        self.assertEquals(self.problems([too_long]), [('c', 'start', 'depth')])
+        self.assertNotEquals(too_long.render()['start'], 'end')
@@ -0,0 +1,124 @@
+"""
+Tests to verify the polling Watcher.
+
+Copyright 2011 Oisin Mulvihill
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+
+from boaconstructor.watch import Watcher
+from boaconstructor.directory import TemplateDirectory
+
+
+def write(directory, name, content, offset=10):
+    path = os.path.join(directory, "%s.json" % name)
+    stream = open(path, 'w')
+    try:
+        json.dump(content, stream)
+
+    finally:
+        stream.close()
+
+    # Make sure the change is seen, whatever the mtime resolution:
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + offset))
+
+
+class WatchTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write(self.directory, 'common', dict(timeout=42))
+        write(self.directory, 'other', dict(port=80))
+        write(self.directory, 'host1', dict(timeout='common.$.timeout'))
+        write(self.directory, 'host2', dict(port='other.$.port'))
+        write(self.directory, 'host3', dict(timeout='host1.$.timeout', user='users.$.bob'))
+
+        self.conf = TemplateDirectory(self.directory)
+        for name in ('host1', 'host2'):
+            self.conf.render(name)
+        self.conf.render('host3', keys=['timeout'])
+
+        self.affected = []
+        self.watcher = Watcher(self.conf, self.affected.append, debounce=1.0)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testDependents(self):
+        """Test only the templates whose renders used a changed file are
+        affected.
+        """
+        write(self.directory, 'common', dict(timeout=30))
+        self.assertEquals(self.watcher.poll(now=100), None)
+        self.assertEquals(self.watcher.poll(now=100.5), None)
+        self.assertEquals(self.watcher.poll(now=101), set(['common', 'host1', 'host3']))
+        self.assertEquals(self.affected, [set(['common', 'host1', 'host3'])])
+        self.assertEquals(self.watcher.poll(now=105), None)
+
+        # The affected renders were done again, with the same keys:
+        renders = dict(self.conf._renders.items())
+        self.assertEquals(renders[('host1', None)][1], dict(timeout=30))
+        self.assertEquals(renders[('host3', ('timeout',))][1], dict(timeout=30))
+        self.assertFalse(('host3', None) in renders)
+
+
+    def testDebounce(self):
+        """Test a burst of changes is handled together once it stops.
+        """
+        write(self.directory, 'common', dict(timeout=1), offset=10)
+        self.watcher.poll(now=100)
+        write(self.directory, 'common', dict(timeout=2), offset=20)
+        self.watcher.poll(now=100.8)
+        write(self.directory, 'other', dict(port=8080))
+        self.assertEquals(self.watcher.poll(now=101.6), None)
+        self.assertEquals(self.watcher.poll(now=102.6), set(['common', 'other', 'host1', 'host2', 'host3']))
+        self.assertEquals(len(self.affected), 1)
+        self.assertEquals(self.conf.render('host2'), dict(port=8080))
+
+
+    def testAddedAndFailed(self):
+        """Test templates which failed are tried again when files change.
+        """
+        self.assertRaises(Exception, self.conf.render, 'host3')
+        watcher = Watcher(self.conf, self.affected.append, debounce=0)
+        write(self.directory, 'users', dict(bob='bob'))
+        self.assertEquals(watcher.poll(), set(['users', 'host3']))
+        self.assertEquals(self.conf.render('host3'), dict(timeout=42, user='bob'))
+
+
+    def testThread(self):
+        """Test the background thread calls back.
+        """
+        called = threading.Event()
+        watcher = Watcher(self.conf, lambda names: called.set(), interval=0.01, debounce=0)
+        watcher.start()
+        try:
+            write(self.directory, 'other', dict(port=1))
+            called.wait(5)
+
+        finally:
+            watcher.stop()
+
+        self.assertTrue(called.isSet())
+        self.assertEquals(self.conf.render('host2'), dict(port=1))
@@ -16,6 +16,15 @@ render
 
 .. autofunction:: render
 
+.. autofunction:: iter_render
+
+.. autofunction:: prefetch_providers
+
+Lazy
+++++
+
+.. autoclass:: Lazy
+
 parse_value
 +++++++++++
 
@@ -31,6 +40,8 @@ build_ref_cache
 
 .. autofunction:: build_ref_cache
 
+.. autoclass:: LazyReferences
+
 hunt_n_resolve
 ++++++++++++++
 
@@ -50,18 +61,36 @@ get
 __all__ = [
     'parse_value', 'ReferenceError', 'AttributeError', 'has', 'get',
     'resolve_references', 'build_ref_cache', 'hunt_n_resolve', 'render',
+    'LazyReferences', 'prefetch_providers', 'pin_snapshots', 'Lazy',
+    'iter_render',
 ]
 
 import re
+import time
 import types
-import pprint
+import thread
+
+from boaconstructor import cache
+from boaconstructor import provenance
 
 
-# Reference-Attribute recovery <reference>.$.<attribute>
-REFATT_RE = re.compile(r"(?P<ref>.*)(?P<refatt>\.\$\.)(?P<attr>.*)")
+# Reference-Attribute recovery <reference>.$.<attribute>. The patterns are
+# compiled by re, and kept in its cache, when first used rather than on import.
+REFATT_RE = r"(?P<ref>.*)(?P<refatt>\.\$\.)(?P<attr>.*)"
 
 # All-Inclusion recovery <allfrom>.*
-ALLINC_RE = re.compile(r"^(?P<allfrom>.*)(?P<all>\.\*)$")
+ALLINC_RE = r"^(?P<allfrom>.*)(?P<all>\.\*)$"
+
+# The most references followed in resolving one value:
+MAX_HOPS = 20
+
+# Lists and tuples at least this long are resolved a chunk at a time:
+CHUNK_SIZE = 1024
+
+# When at least this many items of a list are in chunks holding references,
+# the chunks are resolved on a pool of WORKERS threads. None never does.
+PARALLEL_THRESHOLD = None
+WORKERS = 4
 
 
 def parse_value(value):
@@ -91,13 +120,15 @@ def parse_value(value):
             # ignore empty .* inclusion
             return returned
 
+        if '.$.' not in value and '.*' not in value:
+            # Neither can match, don't bother with the regexes.
+            return returned
+
         refatt_result = re.search(REFATT_RE, value)
         allinc_result = re.search(ALLINC_RE, value)
 
         if refatt_result:
             found = refatt_result.groupdict()
-            #print "found: '%s'" % pprint.pformat(found))
-            #print "groups", refatt_result.groups())
 
             returned['found'] = 'refatt'
             returned['reference'] = found.get('ref')
@@ -105,8 +136,6 @@ def parse_value(value):
 
         if allinc_result:
             found = allinc_result.groupdict()
-            #print("found: '%s'" % pprint.pformat(found))
-            #print("groups", allinc_result.groups())
 
             returned['found'] = 'all'
             returned['allfrom'] = found.get('allfrom')
@@ -114,6 +143,97 @@ def parse_value(value):
     return returned
 
 
+# Parsed reference strings shared by all renders and threads. Entries are
+# immutable tuples, set and read without a lock as single dict operations are
+# atomic. It is emptied when full rather than evicting as an LRU would, so the
+# read stays one dict lookup.
+_PARSED = {}
+_PARSED_LIMIT = 10000
+
+_NOT_FOUND = (None, '', '', '')
+
+# list id -> (list, copy of it, chunk size, starts of the chunks with references)
+_SCANNED = cache.register(cache.Cache('chunk_scan', max_entries=64))
+
+_pool = None
+_pool_lock = thread.allocate_lock()
+
+
+def _parse(value):
+    """Return parse_value's results for the value as a tuple.
+
+    :returns: (found, reference, attribute, allfrom)
+
+    Results for reference strings are kept so each is only parsed once.
+
+    """
+    if type(value) not in types.StringTypes:
+        return _NOT_FOUND
+
+    if '.$.' not in value and '.*' not in value:
+        # Plain strings aren't kept, they would push out the references.
+        return _NOT_FOUND
+
+    try:
+        return _PARSED[value]
+
+    except KeyError:
+        pass
+
+    result = parse_value(value)
+    returned = (
+        result['found'], result['reference'], result['attribute'], result['allfrom']
+    )
+    if len(_PARSED) >= _PARSED_LIMIT:
+        _PARSED.clear()
+    _PARSED[value] = returned
+
+    return returned
+
+
+class Lazy(object):
+    """A content value only worked out when its key is rendered.
+
+    .. code-block:: python
+
+        from boaconstructor import Lazy, Template
+
+        hosts = Template('hosts', dict(
+            names=Lazy(lambda: [row.name for row in db.hosts()]),
+            timeout=30,
+        ))
+
+        >> hosts.render(keys=['timeout'])
+        {'timeout': 30}
+
+    The factory is called with no arguments each time the key is rendered,
+    what it returns is resolved like any other value. If it is a generator,
+    or any other iterator, render() gives its items resolved in a list while
+    :py:func:`iter_render` resolves them only as they are read.
+
+    Keys not rendered, because others were asked for, never call the
+    factory. Fingerprints and schema checks made before rendering treat the
+    Lazy itself as the value.
+
+    """
+    __slots__ = ('factory',)
+
+    def __init__(self, factory):
+        """
+        :param factory: a callable taking no arguments.
+
+        """
+        self.factory = factory
+
+
+    def __call__(self):
+        return self.factory()
+
+
+    def __repr__(self):
+        return "Lazy(%r)" % (self.factory,)
+
+
 class ReferenceError(Exception):
     """Raised when a reference name could not found in references given."""
 
@@ -123,9 +243,9 @@ class AttributeError(Exception):
 
 
 def has(reference, attribute):
-    """Check if the dict, instance or Template instance has a given attribute.
+    """Check if the dict, instance, provider or Template instance has a given attribute.
 
-    :param reference: A dict, Template instance or a object instance.
+    :param reference: A dict, Template instance, reference provider or a object instance.
 
     :param attribute: A string representing the key/member variable to recover.
 
@@ -134,7 +254,7 @@ def has(reference, attribute):
     """
     returned = False
 
-    if type(reference) in (types.DictType, types.DictProxyType):
+    if isinstance(reference, (types.DictType, types.DictProxyType)):
         returned = attribute in reference
 
     elif hasattr(reference, 'content'):
@@ -142,6 +262,10 @@ def has(reference, attribute):
         # Template object itself.
         returned = attribute in getattr(reference, 'content')
 
+    elif hasattr(reference, 'get_many'):
+        # A reference provider, see boaconstructor.providers.
+        returned = attribute in reference.get_many([attribute])
+
     else:
         # Assume it is an instance of some kind which supports hasattr:
         returned = hasattr(reference, attribute)
@@ -150,9 +274,9 @@ def has(reference, attribute):
 
 
 def get(reference, attribute):
-    """Get the attribute value from the given dict, object instance or Template instance.
+    """Get the attribute value from the given dict, object instance, provider or Template instance.
 
-    :param reference: A dict, Template instance or a object instance.
+    :param reference: A dict, Template instance, reference provider or a object instance.
 
     :param attribute: A string representing the key/member variable to recover.
 
@@ -162,7 +286,7 @@ def get(reference, attribute):
     found = False
     returned = False
 
-    if type(reference) in (types.DictType, types.DictProxyType):
+    if isinstance(reference, (types.DictType, types.DictProxyType)):
         if attribute in reference:
             found = True
             returned = reference[attribute]
@@ -176,6 +300,13 @@ def get(reference, attribute):
             found = True
             returned = r[attribute]
 
+    elif hasattr(reference, 'get_many'):
+        # A reference provider, see boaconstructor.providers.
+        r = reference.get_many([attribute])
+        if attribute in r:
+            found = True
+            returned = r[attribute]
+
     else:
         # Assume it is an instance of some kind which supports getattr:
         if hasattr(reference, attribute):
@@ -218,53 +349,136 @@ def resolve_references(reference, attribute, int_references, ext_references={}):
     :returns: The value or item pointed at by the reference and / or attribute.
 
     """
-    found = False
-    returned = ""
-
-    #print("\n\nreference '%s' attribute '%s'\nint_references: '%s'\next_references: '%s'\n\n" % (reference, attribute, int_references, ext_references))
-
     ref_present = reference in ext_references or reference in int_references
     if not ref_present:
         # The reference is not present at all, abandon.
         raise ReferenceError("The reference '%s' could not be resolved!" % reference)
 
-    # Look for the attribute in the ext_references:
-    ext_result = None
-    if has(ext_references, reference):
-        r = get(ext_references, reference)
+    # Look for the attribute in the ext_references, then the int_references.
+    # Each is only asked once, so a provider is only asked once per hop:
+    for references in (ext_references, int_references):
+        r = _lookup(references, reference)
+        if r is _MISSING:
+            continue
 
         if not attribute:
             # all-inclusion operation, return the reference
-            found = True
-            returned = r
+            return r
 
-        elif has(r, attribute):
-            # Success, skip int_references lookup:
-            found = True
-            returned = get(r, attribute)
+        returned = _lookup(r, attribute)
+        if returned is not _MISSING:
+            return returned
 
-    int_result = None
-    if not found and has(int_references, reference):
-        # Nothing was found in externals so try in the internal references.
-        r = get(int_references, reference)
+    raise AttributeError("The attribute '%s' in any reference!" % attribute)
 
-        if not attribute:
-            # all-inclusion operation, return the reference
-            found = True
-            returned = r
 
-        elif has(r, attribute):
-            found = True
-            # Hurragh, its here.
-            returned = get(r, attribute)
+# Returned by _lookup for attributes which aren't present:
+_MISSING = object()
 
-    if not found:
-        raise AttributeError("The attribute '%s' in any reference!" % attribute)
 
-    return returned
+def _lookup(reference, attribute):
+    """Return what get() would, or _MISSING where has() would be False,
+    looking at the reference once.
+    """
+    if isinstance(reference, (types.DictType, types.DictProxyType)):
+        if attribute in reference:
+            return reference[attribute]
+        return _MISSING
+
+    elif hasattr(reference, 'content'):
+        content = reference.content
+        if attribute in content:
+            return content[attribute]
+        return _MISSING
+
+    elif hasattr(reference, 'get_many'):
+        return reference.get_many([attribute]).get(attribute, _MISSING)
 
+    try:
+        return getattr(reference, attribute)
+
+    except Exception:
+        # As hasattr() would be False.
+        return _MISSING
+
+
+class LazyReferences(dict):
+    """A flattened reference dict which is only worked out when a name is
+    first asked for.
+
+    The flattening is the same as :py:func:`build_ref_cache` does, so a name
+    given at more than one level resolves the same way whether the render is
+    of some keys or all of them. A render which never looks a reference up
+    doesn't flatten anything.
+
+    """
+    def __init__(self, references):
+        dict.__init__(self)
+        self._references = references
+        self._flattened = False
 
-def build_ref_cache(int_refs, ext_refs):
+
+    def _flatten(self):
+        if self._flattened:
+            return
+        found = {}
+
+        def recover(items, path):
+            # Store the references, later ones replacing earlier ones as in
+            # build_ref_cache, and then their 'child' references:
+            for reference, source in items:
+                found[reference] = source
+                if hasattr(source, 'references') and id(source) not in path:
+                    path.add(id(source))
+                    recover(getattr(source, 'references').items(), path)
+                    path.discard(id(source))
+
+        recover(self._references.items(), set())
+        dict.update(self, found)
+        self._flattened = True
+
+
+    def __contains__(self, name):
+        self._flatten()
+        return dict.__contains__(self, name)
+
+
+    def __getitem__(self, name):
+        self._flatten()
+        return dict.__getitem__(self, name)
+
+
+    def get(self, name, default=None):
+        self._flatten()
+        return dict.get(self, name, default)
+
+
+    def __iter__(self):
+        self._flatten()
+        return dict.__iter__(self)
+
+
+    def __len__(self):
+        self._flatten()
+        return dict.__len__(self)
+
+
+    def keys(self):
+        self._flatten()
+        return dict.keys(self)
+
+
+    def values(self):
+        self._flatten()
+        return dict.values(self)
+
+
+    def items(self):
+        self._flatten()
+        return dict.items(self)
+
+
+def build_ref_cache(int_refs, ext_refs, lazy=False, int_cache=None):
     """Work out all the references and child references from the internal and
     externally given references.
 
@@ -275,6 +489,14 @@ def build_ref_cache(int_refs, ext_refs):
 
     :param ext_refs: a dict of 'dicts and/or Template' instances.
 
+    :param lazy: If True each part is a :py:class:`LazyReferences` which
+    flattens all of its references when the render first looks one up. The
+    'int' part is int_cache instead, if given.
+
+    :param int_cache: the 'int' part from an earlier call with the same
+    int_refs. It is used as-is instead of flattening int_refs again, so it
+    must not be changed.
+
     :returns: a dict with the results in the form:
 
     .. code-block:: python
@@ -288,7 +510,17 @@ def build_ref_cache(int_refs, ext_refs):
     'testBuildRefCache()'.
 
     """
+    if lazy:
+        if int_cache is None:
+            int_cache = LazyReferences(int_refs)
+        return {
+            'int': int_cache,
+            'ext': LazyReferences(ext_refs),
+        }
+
     reference_cache = {'int':{}, 'ext':{}}
+    if int_cache is not None:
+        reference_cache['int'] = int_cache
 
     def recover(items, dest):
         # Store the references:
@@ -299,7 +531,8 @@ def build_ref_cache(int_refs, ext_refs):
                 children = getattr(source,'references').items()
                 recover(children, dest)
 
-    recover(int_refs.items(), dest='int')
+    if int_cache is None:
+        recover(int_refs.items(), dest='int')
     recover(ext_refs.items(), dest='ext')
 
     return reference_cache
@@ -312,27 +545,44 @@ def hunt_n_resolve(value, reference_cache):
 
     If the value is not an attribute it is passed through unprocessed.
 
+    Lists and tuples of CHUNK_SIZE or more items are looked through a chunk
+    at a time, once per list, and only the chunks holding references are
+    resolved. Set PARALLEL_THRESHOLD to the number of items to resolve from
+    which the chunks are shared among WORKERS threads. This pays where
+    resolving waits on providers or object attributes, plain references
+    are quicker resolved in the one thread.
+
     """
     # Hunt for the last non reference-attribute i.e the actual value
     loop_count = 0
     returned = value
 
+    # Only present when render instrumentation or tracing has been asked for:
+    counters = reference_cache.get('counters')
+    trace = reference_cache.get('trace')
+
     # Prevent looping forever on problems:
-    retries = 20
+    retries = MAX_HOPS
     while retries:
         retries -= 1
 
         #print("loop_count '%s', value: '%s'" %(loop_count, value))
 
-        result = parse_value(returned)
+        found, reference, attribute, allfrom = _parse(returned)
+        if counters is not None:
+            counters['parse_value_calls'] += 1
 
-        if result['found'] == 'refatt':
+        if found == 'refatt':
             # Resolve what this reference points at. Then loop to
             # check if this is also really a reference. Progress in
             # this way until no more ref-attrs are found. I.e. we've
             # got the actual value at the end of the pointer rainbow.
             #
-            returned, attribute = result['reference'], result['attribute']
+            returned = reference
+            if counters is not None:
+                counters['hops'] += 1
+            if trace is not None:
+                trace.hop(returned, attribute)
 
             if returned:
                 returned = resolve_references(
@@ -342,14 +592,19 @@ def hunt_n_resolve(value, reference_cache):
                         reference_cache['ext'],
                 )
 
-        elif result['found'] == 'all':
+        elif found == 'all':
             # Recover the dict to add and then loop over it in turn
             # resolving any references.
             #
             #print("** ALL: get all content for **\n%s\n" % result['allfrom'])
+            if counters is not None:
+                counters['hops'] += 1
+                counters['allinc_expansions'] += 1
+            if trace is not None:
+                trace.hop(allfrom, provenance.ALL)
 
             returned = resolve_references(
-                result['allfrom'],
+                allfrom,
                 None,
                 reference_cache['int'],
                 reference_cache['ext'],
@@ -360,10 +615,20 @@ def hunt_n_resolve(value, reference_cache):
                 returned.items(),
                 # No need to regenerate this, use our one.
                 reference_cache=reference_cache,
+                name=allfrom,
             )
 
 
         else:
+            if type(returned) is Lazy:
+                if reference_cache.get('prefetch'):
+                    # Left for the render, so it is only called once.
+                    break
+
+                # Work it out now and resolve what the factory gave:
+                returned = value = returned()
+                continue
+
             # Is this an iterable? If so we need to check each entry to
             # see if its a ref-attr or all-inc.
             if hasattr(value, '__iter__') and type(value) != types.DictType:
@@ -373,8 +638,21 @@ def hunt_n_resolve(value, reference_cache):
                 # We need to check across the contents of the iterable
                 # and resolve ref-attr or all-inc entries found.
                 returned = []
-                for item in value:
-                    returned.append(hunt_n_resolve(item, reference_cache))
+                if (
+                    trace is None and type(value) in _SEQUENCES
+                    and len(value) >= CHUNK_SIZE
+                ):
+                    returned = _resolve_chunks(value, reference_cache)
+
+                elif trace is None:
+                    for item in value:
+                        returned.append(hunt_n_resolve(item, reference_cache))
+
+                else:
+                    for index, item in enumerate(value):
+                        trace.enter(index)
+                        returned.append(hunt_n_resolve(item, reference_cache))
+                        trace.leave()
 
             # Ok, exit.
             break
@@ -384,7 +662,96 @@ def hunt_n_resolve(value, reference_cache):
     return returned
 
 
-def render(top_level_items, int_refs=None, ext_refs=None, reference_cache=None, extendwith=None):
+_SEQUENCES = (types.ListType, types.TupleType)
+
+
+def _may_refer(item):
+    """True if hunt_n_resolve could give something other than the item."""
+    kind = type(item)
+    if kind in types.StringTypes:
+        return '.$.' in item or item.endswith('.*')
+    return kind is Lazy or (kind != types.DictType and hasattr(item, '__iter__'))
+
+
+def _scan(value, size):
+    """Return the starts of the chunks of the list holding references.
+
+    The scan is kept with a shallow copy of the list, so a list rendered
+    often is only looked through once. It is done again if the list no
+    longer equals the copy, as when an item was changed in place.
+
+    """
+    found = _SCANNED.get(id(value))
+    if found is not None and found[0] is value and found[2] == size and found[1] == value:
+        return found[3]
+
+    starts = []
+    for start in range(0, len(value), size):
+        for item in value[start:start + size]:
+            if _may_refer(item):
+                starts.append(start)
+                break
+
+    _SCANNED.put(id(value), (value, value[:], size, starts))
+    return starts
+
+
+def _get_pool():
+    global _pool
+    _pool_lock.acquire()
+    try:
+        if _pool is None:
+            from multiprocessing.pool import ThreadPool
+            _pool = ThreadPool(WORKERS)
+        return _pool
+
+    finally:
+        _pool_lock.release()
+
+
+def _resolve_chunks(value, reference_cache):
+    """Resolve a long list or tuple a chunk at a time, returning a list.
+
+    Chunks without references are copied as they are. When enough items
+    need resolving the chunks are shared among a pool of threads, unless
+    counting for instrumentation or already in the pool. The items stay in
+    their order either way.
+
+    """
+    size = CHUNK_SIZE
+    returned = list(value)
+    starts = _scan(value, size)
+    if not starts:
+        return returned
+
+    threshold = PARALLEL_THRESHOLD
+    if (
+        threshold is not None and len(starts) > 1
+        and len(starts) * size >= threshold
+        and reference_cache.get('counters') is None
+        and not reference_cache.get('pooled')
+    ):
+        # Lists inside these are resolved in the worker, not queued behind it:
+        pooled = dict(reference_cache, pooled=True)
+
+        def resolve(start):
+            return [hunt_n_resolve(item, pooled) for item in value[start:start + size]]
+
+        resolved = _get_pool().map(resolve, starts, 1)
+
+    else:
+        resolved = [
+            [hunt_n_resolve(item, reference_cache) for item in value[start:start + size]]
+            for start in starts
+        ]
+
+    for start, items in zip(starts, resolved):
+        returned[start:start + size] = items
+
+    return returned
+
+
+def render(top_level_items, int_refs=None, ext_refs=None, reference_cache=None, extendwith=None, instrument=None, name=None, trace=False, keys=None, int_cache=None, interner=None):
     """Construct the final dictionary after resolving all references to get their actual values.
 
     :param top_level_items: A list of key, value items to use.
@@ -408,28 +775,238 @@ def render(top_level_items, int_refs=None, ext_refs=None, reference_cache=None,
     will overwrite any common keys. This is used for a generic template and
     specific templates.
 
+    :param instrument: An optional :py:class:`boaconstructor.instrument.Instrument`.
+
+    If given the timing, hop counts and cache statistics for this render are
+    recorded in it. All-inclusion renders are recorded under the name of the
+    reference they include. If a reference_cache from an instrumented render
+    is given its instrument is used.
+
+    :param name: The template name the statistics are recorded under.
+
+    :param trace: If True record which references supplied each value.
+
+    See :py:mod:`boaconstructor.provenance` for the form the provenance map
+    takes. It is recorded as the values are resolved. A
+    :py:class:`boaconstructor.provenance.Trace` can be given instead of True
+    to record into.
+
+    :param keys: If given only these keys are resolved and returned.
+
+    Keys from extendwith are only resolved if they're asked for and not
+    overwritten by top_level_items. The reference cache is built with lazy=True
+    so the references are only flattened if these keys look one up. Provider
+    attributes are looked up as they are reached rather than in batches. Keys
+    which are not present are left out.
+
+    :param int_cache: passed on to :py:func:`build_ref_cache`, with or
+    without keys.
+
+    :param interner: True or a :py:class:`boaconstructor.interning.Interner`
+    to share the rendered values with other renders, see
+    :py:mod:`boaconstructor.interning`.
+
     :returns: A single dict representing the combination of all parts after references have been resolved.
 
-    """
-    returned = {}
-    loop_count = 0
+    If trace is True then (rendered dict, provenance map) is returned instead.
 
+    """
     # Work out all the references, in effect flattening the
     # references and making lookup faster later on.
+    if keys is not None:
+        wanted = set(keys)
+        top_level_items = [
+            (key, value) for key, value in top_level_items if key in wanted
+        ]
+
+    cache_hit = True
     if not reference_cache:
-        reference_cache = build_ref_cache(int_refs, ext_refs)
+        cache_hit = False
+        if keys is None:
+            reference_cache = build_ref_cache(int_refs, ext_refs, int_cache=int_cache)
+            reference_cache = pin_snapshots(reference_cache)
+            reference_cache = prefetch_providers(top_level_items, extendwith, reference_cache)
+        else:
+            reference_cache = build_ref_cache(int_refs, ext_refs, lazy=True, int_cache=int_cache)
+
+    if trace:
+        tracer = trace
+        if not isinstance(tracer, provenance.Trace):
+            tracer = provenance.Trace()
+        reference_cache = dict(reference_cache, trace=tracer)
+
+    if instrument is None:
+        instrument = reference_cache.get('instrument')
 
-    #print("\n\nreference_cache:\n%s\n\n" % pprint.pformat(reference_cache))
+    if instrument is None:
+        returned = _render(top_level_items, reference_cache, extendwith, keys)
+
+    else:
+        # Give this render its own counters, any all-inclusion renders this
+        # triggers will pick up the instrument and set up their own.
+        counters = instrument.counters()
+        counters['cache_hits' if cache_hit else 'cache_misses'] += 1
+        reference_cache = dict(
+            reference_cache, instrument=instrument, counters=counters
+        )
+
+        started = time.time()
+        try:
+            returned = _render(top_level_items, reference_cache, extendwith, keys)
+
+        finally:
+            instrument.record(name, counters, time.time() - started)
+
+    if interner:
+        from boaconstructor import interning
+        interning.get_interner(interner).intern_values(returned)
+
+    if trace:
+        returned = (returned, tracer.provenance)
+
+    return returned
+
+
+def iter_render(top_level_items, int_refs=None, ext_refs=None, extendwith=None, keys=None):
+    """Render one key at a time, as the results are read.
+
+    The arguments are as for :py:func:`render`. The references are only
+    looked through as far as the keys read so far need.
+
+    :returns: a generator of (key, value) pairs, the top_level_items first
+    followed by any extendwith keys they don't give. Values which are
+    iterators, such as the generator a :py:class:`Lazy` factory returned,
+    are given as generators resolving each item as it is read.
+
+    """
+    if int_refs is None:
+        int_refs = {}
+    if ext_refs is None:
+        ext_refs = {}
+    reference_cache = build_ref_cache(int_refs, ext_refs, lazy=True)
+
+    given = set()
+    for key, value in top_level_items:
+        given.add(key)
+        yield key, _stream(value, reference_cache)
+
+    if extendwith:
+        content = getattr(extendwith, 'content', extendwith)
+        if keys is None:
+            keys = content.keys()
+        for key in keys:
+            if key not in given and key in content:
+                yield key, _stream(content[key], reference_cache)
+
+
+def _stream(value, reference_cache):
+    """Resolve a value for iter_render, leaving iterators to be resolved
+    as they are read.
+    """
+    if type(value) is Lazy:
+        value = value()
+
+    if (
+        type(value) not in types.StringTypes and type(value) != types.DictType
+        and hasattr(value, '__iter__') and iter(value) is value
+    ):
+        return (hunt_n_resolve(item, reference_cache) for item in value)
+
+    return hunt_n_resolve(value, reference_cache)
+
+
+def pin_snapshots(reference_cache):
+    """Fix the version of every template the render can reach.
+
+    :returns: the reference_cache as given if no reference has a snapshot()
+    method. Otherwise a copy with each such reference replaced by what its
+    snapshot() returned, so every hop to the same template in this render sees
+    the same content, whatever other threads change meanwhile.
+
+    """
+    returned = reference_cache
+    for dest in ('int', 'ext'):
+        references = reference_cache[dest]
+        for name, source in references.items():
+            snapshot = getattr(source, 'snapshot', None)
+            if snapshot is not None:
+                if references is reference_cache[dest]:
+                    if returned is reference_cache:
+                        returned = dict(reference_cache)
+                    references = returned[dest] = dict(references)
+                references[name] = snapshot()
+
+    return returned
+
+
+def prefetch_providers(top_level_items, extendwith, reference_cache):
+    """Batch the lookups from any reference providers present.
+
+    :returns: the reference_cache as given if there are no providers.
+
+    Otherwise a copy is returned with each provider replaced by a dict of the
+    values this render needs from it, fetched with one get_many call per
+    provider (and per level of provider to provider reference).
+
+    """
+    for dest in ('int', 'ext'):
+        for source in reference_cache[dest].values():
+            if hasattr(source, 'get_many'):
+                break
+        else:
+            continue
+        break
+
+    else:
+        # No providers, nothing to do.
+        return reference_cache
+
+    from boaconstructor import providers
+
+    reference_cache, views = providers.with_views(reference_cache)
+    values = [value for key, value in top_level_items]
+    if extendwith:
+        values.extend([value for key, value in extendwith.items()])
+    providers.prefetch(values, reference_cache, views)
+
+    return reference_cache
+
+
+def _render(top_level_items, reference_cache, extendwith, keys=None):
+    """Resolve the items and any extendwith, the work behind :py:func:`render`.
+    """
+    returned = {}
+    trace = reference_cache.get('trace')
 
     for top_level_ref, attr_or_ref in top_level_items:
+        if trace is not None:
+            trace.enter(top_level_ref)
         returned[top_level_ref] = hunt_n_resolve(attr_or_ref, reference_cache)
+        if trace is not None:
+            trace.leave()
 
     if extendwith:
         # Extend the returned dict with the content from extendwith, after it
         # goes through the resolve process.
+        if keys is None:
+            extend_items = extendwith.items()
+
+        else:
+            # Only the keys asked for which we don't provide ourselves:
+            content = getattr(extendwith, 'content', extendwith)
+            extend_items = [
+                (key, content[key]) for key in keys
+                if key not in returned and key in content
+            ]
+
         pending = {}
-        for ref, attr_or_ref in extendwith.items():
+        for ref, attr_or_ref in extend_items:
+            if trace is not None:
+                # Don't let keys we're about to overwrite replace our trace.
+                trace.enter(ref, muted=ref in returned)
             pending[ref] = hunt_n_resolve(attr_or_ref, reference_cache)
+            if trace is not None:
+                trace.leave()
 
         # Overwrite the rendered extendwith with values from the main template
         # (if there are any shared keys).
@@ -0,0 +1,304 @@
+"""
+.. module::`validate`
+    :platform: Unix, Windows
+    :synopsis: Find broken references in a set of templates without rendering.
+
+A missing reference or attribute is only found when a template using it is
+rendered. :py:func:`validate` finds them all for a whole set of templates in
+one pass, without rendering anything:
+
+.. code-block:: python
+
+    from boaconstructor.validate import validate
+
+    problems = validate([common, host1, host2, webservers])
+    for problem in problems:
+        print(problem)
+
+    >> host2['timeout']: The reference 'comon' could not be resolved!
+    >> host1['port']: The attribute 'prot' is not in any reference!
+
+Every reference-attribute and all-inclusion in the content, including those
+in lists, is looked up as a render would look it up: in the references given
+first and then in the template's own references. The chain of references
+from each is followed to its end. As well as the missing references and
+attributes on the way, chains which loop back on themselves and those longer
+than the :py:data:`boaconstructor.utils.MAX_HOPS` a render will follow are
+reported.
+
+Each chain is only followed once. Templates with the same references share
+what was found, so the time taken grows with the number of references rather
+than the number of templates times the length of their chains.
+
+The templates extended by those given are checked too. Values from reference
+providers are not looked up, their attributes are taken to be present and to
+be the end of the chain.
+
+.. autoclass:: Problem
+
+.. autofunction:: validate
+
+"""
+__all__ = ['validate', 'Problem', 'REFERENCE', 'ATTRIBUTE', 'CYCLE', 'DEPTH']
+
+import types
+
+from boaconstructor import utils
+from boaconstructor import provenance
+
+
+# The kinds of Problem:
+REFERENCE = 'reference'
+ATTRIBUTE = 'attribute'
+CYCLE = 'cycle'
+DEPTH = 'depth'
+
+# The depth of chains which are too long, any more is not counted:
+_TOO_DEEP = utils.MAX_HOPS + 1
+
+
+class Problem(object):
+    """Something which stops a template key rendering as it should.
+
+    :ivar template: the name of the template.
+
+    :ivar key: the top level key whose value has the problem.
+
+    :ivar kind: REFERENCE, ATTRIBUTE, CYCLE or DEPTH.
+
+    :ivar reference: the reference name where the problem was found.
+
+    :ivar attribute: the attribute asked for, or '*' for an all-inclusion.
+
+    :ivar message: what went wrong.
+
+    """
+    def __init__(self, template, key, kind, reference, attribute, message):
+        self.template = template
+        self.key = key
+        self.kind = kind
+        self.reference = reference
+        self.attribute = attribute
+        self.message = message
+
+
+    def __str__(self):
+        return "%s[%r]: %s" % (self.template, self.key, self.message)
+
+
+    def __repr__(self):
+        return "<Problem %s>" % self
+
+
+def validate(templates, references=None):
+    """Check every reference in the templates can be resolved.
+
+    :param templates: the Template instances to check.
+
+    :param references: the references the templates would be rendered with.
+
+    :returns: a list of :py:class:`Problem`, sorted by template name and key.
+    It is empty if every template would render.
+
+    """
+    if references is None:
+        references = {}
+
+    ext = utils.build_ref_cache({}, references)['ext']
+
+    checked = []
+    seen = set()
+    for template in templates:
+        while template is not None and id(template) not in seen:
+            seen.add(id(template))
+            checked.append(template)
+            template = template.extends
+
+    checkers = {}
+    problems = []
+    for template in checked:
+        snapshot = template.snapshot()
+        reference_cache = utils.pin_snapshots(
+            {'ext': ext, 'int': snapshot.flattened()}
+        )
+        context = (
+            frozenset([(name, id(source)) for name, source in reference_cache['ext'].items()]),
+            frozenset([(name, id(source)) for name, source in reference_cache['int'].items()]),
+        )
+        checker = checkers.get(context)
+        if checker is None:
+            checker = checkers[context] = _Checker(reference_cache)
+
+        for key, value in snapshot.content.items():
+            for kind, reference, attribute, message in checker.value(value):
+                problems.append(
+                    Problem(template.name, key, kind, reference, attribute, message)
+                )
+
+    problems.sort(key=lambda problem: (problem.template, problem.key))
+    return problems
+
+
+def _show(node):
+    reference, attribute = node
+    if attribute == provenance.ALL:
+        return "%s.*" % reference
+    return "%s.$.%s" % (reference, attribute)
+
+
+class _Checker(object):
+    """Follows the reference chains of the templates with one set of
+    references.
+
+    Each step in a chain is a (reference, attribute) node. What was found
+    from each node onwards is kept as (problems, depth), where problems is a
+    tuple of (kind, reference, attribute, message) and depth the number of
+    hops to the end of the chain.
+
+    """
+    def __init__(self, reference_cache):
+        self._ext = reference_cache['ext']
+        self._int = reference_cache['int']
+        self._done = {}
+        # The nodes whose chains are being followed:
+        self._active = set()
+
+
+    def value(self, value):
+        """Return the problems of a content value, as a list of tuples."""
+        if type(value) in types.StringTypes:
+            found, reference, attribute, allfrom = utils._parse(value)
+            if found == 'refatt' and reference:
+                node = (reference, attribute)
+            elif found == 'all':
+                node = (allfrom, provenance.ALL)
+            else:
+                return []
+
+            problems, depth = self._chain(node)
+            if not problems and depth > utils.MAX_HOPS:
+                return [(DEPTH, node[0], node[1],
+                    "The chain from '%s' is longer than %d references!" % (
+                        _show(node), utils.MAX_HOPS
+                    )
+                )]
+            return list(problems)
+
+        if hasattr(value, '__iter__') and type(value) != types.DictType:
+            returned = []
+            for item in value:
+                for problem in self.value(item):
+                    if problem not in returned:
+                        returned.append(problem)
+            return returned
+
+        return []
+
+
+    def _chain(self, node):
+        """Follow the chain from the node and return its (problems, depth).
+        """
+        done = self._done
+        active = self._active
+        path = []
+        result = None
+        while result is None:
+            result = done.get(node)
+            if result is not None:
+                break
+
+            if node in active:
+                if node in path:
+                    looped = path[path.index(node):]
+                else:
+                    # Back to an all-inclusion still being followed.
+                    looped = [node]
+                message = "The references loop: %s!" % " -> ".join(
+                    [_show(step) for step in looped + [node]]
+                )
+                result = ((CYCLE, node[0], node[1], message),), _TOO_DEEP
+                for step in looped:
+                    if step in path:
+                        done[step] = result
+                        active.discard(step)
+                        path.remove(step)
+                break
+
+            active.add(node)
+            path.append(node)
+            node, result = self._step(node)
+            if result is not None:
+                done[path[-1]] = result
+                active.discard(path.pop())
+
+        for step in reversed(path):
+            result = result[0], min(result[1] + 1, _TOO_DEEP)
+            done[step] = result
+            active.discard(step)
+
+        return result
+
+
+    def _step(self, node):
+        """Look up a node.
+
+        :returns: (the next node, None) if the value found is another
+        reference, otherwise (None, (problems, 1)).
+
+        """
+        reference, attribute = node
+        sources = [
+            references[reference] for references in (self._ext, self._int)
+            if reference in references
+        ]
+        if not sources:
+            return None, (((REFERENCE, reference, attribute,
+                "The reference '%s' could not be resolved!" % reference
+            ),), 1)
+
+        if attribute == provenance.ALL:
+            return None, (self._include(sources[0], reference), 1)
+
+        for source in sources:
+            if hasattr(source, 'get_many'):
+                # Providers are not looked up, take it to be there.
+                return None, ((), 1)
+
+            if utils.has(source, attribute):
+                value = utils.get(source, attribute)
+                break
+        else:
+            return None, (((ATTRIBUTE, reference, attribute,
+                "The attribute '%s' is not in any reference!" % attribute
+            ),), 1)
+
+        if type(value) in types.StringTypes:
+            found, next_reference, next_attribute, allfrom = utils._parse(value)
+            if found == 'refatt' and next_reference:
+                return (next_reference, next_attribute), None
+            elif found == 'all':
+                return (allfrom, provenance.ALL), None
+
+        return None, ((), 1)
+
+
+    def _include(self, source, reference):
+        """Return the problems of the values an all-inclusion adds."""
+        if not hasattr(source, 'items'):
+            return ((ATTRIBUTE, reference, provenance.ALL,
+                "The reference '%s' can't be included!" % reference
+            ),)
+
+        node = (reference, provenance.ALL)
+        self._active.add(node)
+        try:
+            returned = []
+            for key, value in source.items():
+                for problem in self.value(value):
+                    if problem not in returned:
+                        returned.append(problem)
+
+        finally:
+            self._active.discard(node)
+
+        return tuple(returned)
@@ -0,0 +1,146 @@
+"""
+.. module::`watch`
+    :platform: Unix, Windows
+    :synopsis: Reload changed template files and render their dependents again.
+
+A :py:class:`Watcher` polls a template directory for files which changed,
+by their size and modification time, so no extra packages are needed. When
+some have, only those are loaded again and only the templates whose renders
+used them are rendered again. The callback is then given the names of the
+templates affected:
+
+.. code-block:: python
+
+    from boaconstructor.directory import TemplateDirectory
+    from boaconstructor.watch import Watcher
+
+    conf = TemplateDirectory('conf/')
+
+    def changed(names):
+        for name in names:
+            push(name, conf.render(name))
+
+    watcher = Watcher(conf, changed, interval=1.0, debounce=0.5)
+    watcher.start()
+
+Which templates are affected comes from what the earlier renders of the
+:py:class:`boaconstructor.directory.TemplateDirectory` used. These are the
+changed templates, those whose renders used them and those which last failed
+to render. Each is rendered again, with the keys it was rendered with before,
+so the renders the callback asks for are ready.
+
+Editors and deploys often write several files, or one file several times, in
+quick succession. Once a change is seen the watcher waits until nothing more
+has changed for 'debounce' seconds and then handles all of them together.
+
+:py:meth:`Watcher.poll` does one check without starting a thread, for use in
+a loop of your own.
+
+.. autoclass:: Watcher
+    :members:
+
+"""
+__all__ = ['Watcher']
+
+import time
+import logging
+import threading
+
+from boaconstructor import directory
+
+
+def get_log():
+    return logging.getLogger('boaconstructor.watch')
+
+
+class Watcher(object):
+    """Polls a TemplateDirectory and calls back with the templates affected
+    by changed files.
+    """
+    def __init__(self, templates, callback, interval=1.0, debounce=0.5):
+        """
+        :param templates: a TemplateDirectory, or the directory to make one
+        of.
+
+        :param callback: called with the set of names of the templates
+        affected by each group of changes.
+
+        :param interval: the seconds between looking at the files.
+
+        :param debounce: the seconds to wait, after a change is seen, for
+        the files to stop changing.
+
+        """
+        if not isinstance(templates, directory.TemplateDirectory):
+            templates = directory.TemplateDirectory(templates)
+        self.templates = templates
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+
+        # The files as they were when last loaded or seen changing:
+        self._seen = templates.scan()
+        # When the files were last seen changing, None if they haven't been
+        # since last loaded:
+        self._changing = None
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def poll(self, now=None):
+        """Look at the files once.
+
+        :param now: the time to take it to be, by default time.time().
+
+        :returns: the set of names of the templates affected, or None if
+        nothing was done.
+
+        """
+        if now is None:
+            now = time.time()
+
+        signatures = self.templates.scan()
+        if signatures != self._seen:
+            self._seen = signatures
+            self._changing = now
+            if self.debounce:
+                return None
+
+        elif self._changing is None or now - self._changing < self.debounce:
+            return None
+
+        self._changing = None
+        changed = self.templates.refresh(signatures)
+        affected = self.templates.dependents(changed)
+        for name, error in self.templates.render_again(affected).items():
+            get_log().warn("Rendering '%s' failed: %s" % (name, error))
+
+        self.callback(affected)
+        return affected
+
+
+    def start(self):
+        """Poll in a background thread until :py:meth:`stop` is called."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='boaconstructor.watch')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def stop(self):
+        """Stop the background thread, waiting for it to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def _run(self):
+        while not self._stop.isSet():
+            try:
+                self.poll()
+
+            except Exception:
+                get_log().exception("Polling '%s' failed:" % self.templates.directory)
+
+            self._stop.wait(self.interval)
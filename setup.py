@@ -124,6 +124,9 @@ PackageData = {
 
 # Make exe versions of the scripts:
 EntryPoints = {
+    'console_scripts': [
+        'boaconstructor = boaconstructor.cli:main',
+    ],
 }
 
 setup(